@@ -0,0 +1,158 @@
+"""
+Throughput benchmark of the engine clients against the local mock server.
+
+Every selected engine runs the same count + search workflow the CLI runs, through the
+real clients pointed at `bench.mock_server`. The report lists pages per second, p50/p99
+page latency, retried responses and peak Python memory per engine, so changes to the
+fetch path can be compared without API keys or network noise.
+
+Example:
+    python -m bench.benchmark --results 20000 --latency 0.05 --throttle-rate 0.02
+"""
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+
+from bench.mock_server import start_mock_server
+from engine import ShodanClient, NetlasClient, FofaClient, ZoomeyeClient
+
+ENGINES = {
+    'shodan': lambda url, keys, **kwargs: ShodanClient(keys, base_url=f'{url}/shodan/host/', **kwargs),
+    'netlas': lambda url, keys, **kwargs: NetlasClient(keys, base_url=f'{url}/api/', **kwargs),
+    'fofa': lambda url, keys, **kwargs: FofaClient(keys, 'mock@example.com', base_url=f'{url}/api/v1/', **kwargs),
+    'zoomeye': lambda url, keys, **kwargs: ZoomeyeClient(keys, base_url=f'{url}/host/', **kwargs),
+}
+
+
+def percentile(values: list[float], share: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values (list[float]): Samples.
+        share (float): Percentile as a share, e.g. 0.99.
+
+    Returns:
+        float: Percentile of the samples, 0 if there are none.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))]
+
+
+def run_engine(name: str, url: str, query: str = 'benchmark', concurrency: int = None,
+               rate_limit: float = None, backoff_base: float = None, page_size: int = None, keys: int = 1) -> dict:
+    """
+    Run the count + search workflow of one engine and measure it.
+
+    Args:
+        name (str): Engine name, a key of ENGINES.
+        url (str): Base URL of the mock server.
+        query (str): Search query.
+        concurrency (int): Pages kept in flight, defaults to the engine's default.
+        rate_limit (float): Requests per second, defaults to the engine's default.
+        backoff_base (float): First retry delay in seconds, defaults to the client's.
+        page_size (int): Results per page, must match the mock server's, defaults to the client's.
+        keys (int): Number of API keys of the client.
+
+    Returns:
+        dict: Measurements of the run.
+    """
+    client = ENGINES[name](url, [f'{name}{index}' for index in range(keys)], concurrency=concurrency,
+                           rate_limit=rate_limit)
+    if backoff_base is not None:
+        for key in client.keys:
+            key.limiter.backoff_base = backoff_base
+    if page_size is not None:
+        client._RESULTS_PER_PAGE = page_size
+        if 'size' in client.PARAMS:
+            client.PARAMS['size'] = page_size
+    latencies = []
+    statuses = {}
+
+    def on_response(response, *args, **kwargs):
+        latencies.append(response.elapsed.total_seconds())
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    client.session.hooks['response'].append(on_response)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    try:
+        count = client.count(query)
+        servers = client.search(query, count)
+    finally:
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        client.close()
+    pages = statuses.get(200, 0)
+    return {
+        'engine': name,
+        'results': len(servers),
+        'requests': sum(statuses.values()),
+        'retries': sum(total for status, total in statuses.items() if status != 200),
+        'seconds': round(seconds, 3),
+        'pages_per_sec': round(pages / seconds, 1) if seconds else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'peak_mb': round(peak / 2 ** 20, 2),
+    }
+
+
+def print_report(rows: list[dict]):
+    columns = ['engine', 'results', 'requests', 'retries', 'seconds', 'pages_per_sec', 'p50_ms', 'p99_ms', 'peak_mb']
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    print('  '.join(column.rjust(widths[column]) for column in columns))
+    for row in rows:
+        print('  '.join(str(row[column]).rjust(widths[column]) for column in columns))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the engine clients against the local mock server')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--results', type=int, default=10000, help='number of hosts matching the query')
+    parser.add_argument('--latency', type=float, default=0.05, help='base response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum random extra delay in seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of 429 responses')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 5xx responses')
+    parser.add_argument('--retry-after', type=int, default=0, help='Retry-After of 429 responses in seconds')
+    parser.add_argument('--page-size', type=int, default=None, help='results per page, real API sizes if omitted')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keys', type=int, default=1, help='API keys per client')
+    parser.add_argument('--key-rate', type=float, default=None, help='mock requests per second allowed per API key')
+    parser.add_argument('--concurrency', type=int, default=None, help='pages in flight, engine default if omitted')
+    parser.add_argument('--rate-limit', type=float, default=1000.0, help='client requests per second')
+    parser.add_argument('--backoff-base', type=float, default=0.05, help='first retry delay in seconds')
+    parser.add_argument('--json', dest='json_path', default=None, help='also write the report to this JSON file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Retried responses are counted in the report, keep their log lines out of it.
+    logging.basicConfig(level=logging.CRITICAL)
+    server = start_mock_server(args.port, results=args.results, latency=args.latency, jitter=args.jitter,
+                               throttle_rate=args.throttle_rate, error_rate=args.error_rate,
+                               retry_after=args.retry_after, page_size=args.page_size, seed=args.seed,
+                               key_rate=args.key_rate)
+    try:
+        url = f'http://127.0.0.1:{args.port}'
+        rows = [run_engine(name, url, concurrency=args.concurrency, rate_limit=args.rate_limit,
+                           backoff_base=args.backoff_base, page_size=args.page_size, keys=args.keys)
+                for name in args.engines]
+    finally:
+        server.terminate()
+        server.wait()
+    print_report(rows)
+    if args.json_path:
+        with open(args.json_path, 'w') as file:
+            json.dump(rows, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
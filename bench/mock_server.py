@@ -0,0 +1,359 @@
+"""
+Local stand-in for the Shodan, Netlas, Fofa and ZoomEye search APIs.
+
+The server answers the count and search endpoints used by the engine clients with
+generated hosts, so the fetch path can be tested and benchmarked without API keys.
+Latency, result volume and the share of throttled (429) and failed (5xx) responses
+are configurable, as well as a per-key rate limit and the quota reported for every key.
+Queries are not interpreted: every query matches the same hosts.
+
+Run it with `python -m bench.mock_server --port 8900` and point the clients to it with
+`base_url`, e.g. `ShodanClient('key', base_url='http://127.0.0.1:8900/shodan/host/')`.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+COUNTRIES = ['US', 'CN', 'DE', 'RU', 'FR', 'NL', 'SG', 'JP', 'BR', 'SN']
+PORTS = [80, 443, 22, 8080, 21, 3389, 8443, 25]
+BASE_PATHS = {
+    'shodan': '/shodan/host/',
+    'netlas': '/api/',
+    'fofa': '/api/v1/',
+    'zoomeye': '/host/',
+}
+PAGE_SIZES = {'shodan': 100, 'netlas': 20, 'zoomeye': 20}
+
+
+class MockConfig:
+    """
+    Behaviour of the mock server.
+
+    Attributes:
+        results (int): Number of hosts matching every query.
+        latency (float): Base delay of every response in seconds.
+        jitter (float): Maximum random delay added to the base latency in seconds.
+        throttle_rate (float): Share of requests answered with 429.
+        error_rate (float): Share of requests answered with a 5xx status.
+        retry_after (int): Value of the Retry-After header of 429 responses.
+        page_size (int | None): Results per page of the engines with a fixed page size,
+            None for the sizes of the real APIs (PAGE_SIZES). Fofa takes the size from the request.
+        seed (int): Seed of the fault injection.
+        key_rate (float | None): Requests per second allowed per API key, None for no limit.
+        quota (int): Requests left reported by the quota endpoints for every key.
+    """
+
+    def __init__(self, results=10000, latency=0.05, jitter=0.0, throttle_rate=0.0, error_rate=0.0,
+                 retry_after=1, page_size=None, seed=None, key_rate=None, quota=100000):
+        self.results = results
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.page_sizes = {engine: page_size or size for engine, size in PAGE_SIZES.items()}
+        self.random = random.Random(seed)
+        self.key_rate = key_rate
+        self.quota = quota
+        self.key_buckets = {}
+
+
+def make_host(index: int) -> dict:
+    """
+    Generate the host with the given index.
+
+    Args:
+        index (int): Host index.
+
+    Returns:
+        dict: Host fields shared by all engines.
+    """
+    return {
+        'ip': socket.inet_ntoa((0x0A000000 + index).to_bytes(4, 'big')),
+        'port': PORTS[index % len(PORTS)],
+        'country': COUNTRIES[index % len(COUNTRIES)],
+        'protocol': 'https' if index % 2 else 'http',
+        'host': f'host{index}.example.com',
+        'timestamp': '2024-01-01T00:00:00.000000',
+    }
+
+
+def facet_counts(total: int, facet: str) -> list[tuple[str, int]]:
+    values = COUNTRIES if facet == 'country' else PORTS
+    counts = {}
+    for index in range(len(values)):
+        counts[str(values[index])] = total // len(values) + (1 if index < total % len(values) else 0)
+    return [(value, count) for value, count in counts.items() if count]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, Nagle's algorithm would hold the body back
+    # until the client's delayed ACK and add ~40 ms to every response.
+    disable_nagle_algorithm = True
+    config = MockConfig()
+    stats = {}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, engine: str, key: str):
+        with self.lock:
+            self.stats.setdefault(engine, {'requests': 0, 'throttled': 0, 'errors': 0})
+            self.stats[engine][key] += 1
+
+    def _send_json(self, body, status=HTTPStatus.OK, headers=None):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _engine(self, path: str) -> str | None:
+        for engine in ('shodan', 'fofa', 'netlas', 'zoomeye'):
+            if path.startswith(BASE_PATHS[engine]):
+                return engine
+        return None
+
+    def _inject(self, engine: str) -> bool:
+        """
+        Delay the response and answer with an injected failure if one is drawn.
+        """
+        config = self.config
+        time.sleep(config.latency + config.random.uniform(0, config.jitter))
+        self._count(engine, 'requests')
+        if config.key_rate and not self._take_key_token(config):
+            self._count(engine, 'throttled')
+            self._send_json({'error': 'Rate limit reached for this key'}, HTTPStatus.TOO_MANY_REQUESTS)
+            return True
+        draw = config.random.random()
+        if draw < config.throttle_rate:
+            self._count(engine, 'throttled')
+            self._send_json({'error': 'Rate limit reached'}, HTTPStatus.TOO_MANY_REQUESTS,
+                            {'Retry-After': str(config.retry_after)})
+            return True
+        if draw < config.throttle_rate + config.error_rate:
+            self._count(engine, 'errors')
+            status = config.random.choice([HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY,
+                                           HTTPStatus.SERVICE_UNAVAILABLE])
+            self._send_json({'error': 'Injected failure'}, status)
+            return True
+        return False
+
+    def _take_key_token(self, config: MockConfig) -> bool:
+        """
+        Take a token from the bucket of the request's API key, refilled at `key_rate` per second.
+        """
+        params = parse_qs(urlparse(self.path).query)
+        key = self.headers.get('X-API-Key') or self.headers.get('API-KEY') or params.get('key', [''])[0]
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = config.key_buckets.get(key, (max(1.0, config.key_rate), now))
+            tokens = min(max(1.0, config.key_rate), tokens + (now - updated) * config.key_rate)
+            allowed = tokens >= 1
+            config.key_buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def _page(self, start: int, size: int) -> range:
+        return range(max(0, start), min(self.config.results, start + size))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/_stats':
+            with self.lock:
+                return self._send_json(self.stats)
+        if url.path == '/api-info':
+            return self._send_json({'query_credits': self.config.quota, 'scan_credits': 0, 'plan': 'mock'})
+        if url.path == '/resources-info':
+            return self._send_json({'plan': 'mock', 'resources': {'search': self.config.quota}})
+        if url.path == BASE_PATHS['fofa'] + 'info/my':
+            return self._send_json({'error': False, 'email': params.get('email'),
+                                    'remain_api_query': self.config.quota, 'remain_api_data': self.config.quota})
+        engine = self._engine(url.path)
+        if engine is None:
+            return self._send_json({'error': 'Not found'}, HTTPStatus.NOT_FOUND)
+        if self._inject(engine):
+            return
+        total = self.config.results
+        endpoint = url.path[len(BASE_PATHS[engine]):]
+        if engine == 'shodan':
+            body = {'total': total}
+            if 'facets' in params:
+                facet = params['facets'].split(':')[0]
+                body['facets'] = {facet: [{'value': value, 'count': count}
+                                          for value, count in facet_counts(total, facet)]}
+            if endpoint == 'search':
+                page = int(params.get('page', 1))
+                size = self.config.page_sizes['shodan']
+                body['matches'] = [self._shodan_match(i) for i in self._page((page - 1) * size, size)]
+            return self._send_json(body)
+        if engine == 'netlas':
+            if endpoint == 'responses_count':
+                return self._send_json({'count': total})
+            size = self.config.page_sizes['netlas']
+            items = [{'data': self._netlas_data(i)} for i in self._page(int(params.get('start', 0)), size)]
+            return self._send_json({'items': items})
+        if engine == 'fofa':
+            if endpoint == 'search/stats':
+                facet = params.get('fields', 'country')
+                return self._send_json({'error': False, 'aggs': {
+                    facet: [{'name': value, 'count': count} for value, count in facet_counts(total, facet)]}})
+            size = int(params.get('size', 100))
+            page = int(params.get('page', 1))
+            fields = params.get('fields', 'host,ip,port').split(',')
+            rows = []
+            for i in self._page((page - 1) * size, size):
+                host = dict(make_host(i), lastupdatetime='2024-01-01 00:00:00')
+                row = [host.get(field, '') for field in fields]
+                rows.append(row[0] if len(row) == 1 else row)
+            query = base64.b64decode(params.get('qbase64', '')).decode(errors='replace')
+            return self._send_json({'error': False, 'size': total, 'page': page, 'query': query, 'results': rows})
+        if engine == 'zoomeye':
+            page = int(params.get('page', 1))
+            size = self.config.page_sizes['zoomeye']
+            body = {'total': total, 'matches': [self._zoomeye_match(i) for i in self._page((page - 1) * size, size)]}
+            if 'facets' in params:
+                body['facets'] = {facet: [{'name': value, 'count': count} for value, count in facet_counts(total, facet)]
+                                  for facet in params['facets'].split(',')}
+            return self._send_json(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if url.path != BASE_PATHS['netlas'] + 'responses/download/':
+            return self._send_json({'error': 'Not found'}, HTTPStatus.NOT_FOUND)
+        if self._inject('netlas'):
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        size = min(int(body.get('size', self.config.results)), self.config.results)
+        buffer = [b'[']
+        for i in range(size):
+            buffer.append((b',' if i else b'') + json.dumps({'data': self._netlas_data(i)}).encode())
+            if len(buffer) >= 500:
+                self._write_chunk(b''.join(buffer))
+                buffer = []
+        buffer.append(b']')
+        self._write_chunk(b''.join(buffer))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+
+    @staticmethod
+    def _shodan_match(index: int) -> dict:
+        host = make_host(index)
+        return {'ip_str': host['ip'], 'port': host['port'], 'transport': 'tcp', 'hostnames': [host['host']],
+                'timestamp': host['timestamp'], 'location': {'country_code': host['country']},
+                '_shodan': {'module': host['protocol']},
+                'data': 'HTTP/1.1 200 OK\r\nServer: nginx\r\n' * 8}
+
+    @staticmethod
+    def _netlas_data(index: int) -> dict:
+        host = make_host(index)
+        return {'ip': host['ip'], 'port': host['port'], 'protocol': host['protocol'], 'host': host['host'],
+                '@timestamp': host['timestamp']}
+
+    @staticmethod
+    def _zoomeye_match(index: int) -> dict:
+        host = make_host(index)
+        return {'ip': host['ip'], 'portinfo': {'port': host['port'], 'service': host['protocol'],
+                                               'hostname': host['host']},
+                'timestamp': host['timestamp'], 'geoinfo': {'country': {'code': host['country']}}}
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops the connections of a client opening more at once,
+    # which then wait for the SYN retransmission (1 s) and skew every measurement.
+    request_queue_size = 1024
+
+
+def serve(host: str, port: int, config: MockConfig):
+    """
+    Run the mock server until interrupted.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+        config (MockConfig): Server behaviour.
+    """
+    MockHandler.config = config
+    server = MockServer((host, port), MockHandler)
+    server.serve_forever()
+
+
+def start_mock_server(port: int, **options) -> subprocess.Popen:
+    """
+    Start the mock server in a separate process and wait until it accepts connections.
+
+    A separate process keeps the server away from gevent's monkey patching in the
+    process that runs the clients.
+
+    Args:
+        port (int): Port to listen on.
+        **options: MockConfig options, e.g. results=5000, latency=0.02.
+
+    Returns:
+        subprocess.Popen: Server process, terminate it when done.
+    """
+    args = [sys.executable, '-m', 'bench.mock_server', '--port', str(port)]
+    for name, value in options.items():
+        if value is not None:
+            args += [f'--{name.replace("_", "-")}', str(value)]
+    # Run from the repository root so `bench` is importable whatever the caller's directory.
+    process = subprocess.Popen(args, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f'The mock server did not start on port {port}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Local mock of the Shodan, Netlas, Fofa and ZoomEye APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--results', type=int, default=10000, help='number of hosts matching every query')
+    parser.add_argument('--latency', type=float, default=0.05, help='base response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum random extra delay in seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of 429 responses')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 5xx responses')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After of 429 responses in seconds')
+    parser.add_argument('--page-size', type=int, default=None, help='results per page, real API sizes if omitted')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--key-rate', type=float, default=None, help='requests per second allowed per API key')
+    parser.add_argument('--quota', type=int, default=100000, help='requests left reported for every API key')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    try:
+        serve(args.host, args.port, MockConfig(args.results, args.latency, args.jitter, args.throttle_rate,
+                                               args.error_rate, args.retry_after, args.page_size, args.seed,
+                                               args.key_rate, args.quota))
+    except KeyboardInterrupt:
+        pass
@@ -1,4 +1,27 @@
-from .shodan import ShodanClient
-from .netlas import NetlasClient
-from .fofa import FofaClient
-from .zoomeye import ZoomeyeClient
+"""
+Engine clients.
+
+The gevent clients (`ShodanClient`, ...) and the asyncio clients (`AsyncShodanClient`, ...)
+are imported on first access, so that importing the asyncio clients does not
+monkey-patch the process with gevent.
+"""
+import importlib
+
+_CLIENTS = {
+    'ShodanClient': 'engine.clients',
+    'NetlasClient': 'engine.clients',
+    'FofaClient': 'engine.clients',
+    'ZoomeyeClient': 'engine.clients',
+    'AsyncShodanClient': 'engine.aio',
+    'AsyncNetlasClient': 'engine.aio',
+    'AsyncFofaClient': 'engine.aio',
+    'AsyncZoomeyeClient': 'engine.aio',
+}
+
+__all__ = list(_CLIENTS)
+
+
+def __getattr__(name):
+    if name in _CLIENTS:
+        return getattr(importlib.import_module(_CLIENTS[name]), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
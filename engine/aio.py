@@ -0,0 +1,583 @@
+"""
+Engine clients running on an asyncio event loop.
+
+The clients share all engine logic with the gevent clients of `engine.clients` and only
+replace the transport with aiohttp. Importing this module does not import gevent, so the
+process is not monkey-patched and the clients can live inside an asyncio service.
+
+aiohttp is an optional dependency, install it with `pip install aiohttp`.
+
+Example:
+    async with AsyncShodanClient(api_key) as client:
+        count = await client.count('product:nginx')
+        async for ip in client.iter_ips('product:nginx', count):
+            print(ip)
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from http import HTTPStatus
+
+from engine.core import EngineCore
+from engine.fofa import FofaEngine
+from engine.netlas import NetlasEngine
+from engine.shodan import ShodanEngine
+from engine.zoomeye import ZoomeyeEngine
+from utils.exceptions import KeyPoolExhaustedException, NullResultException
+from utils.hosts import HostRecord
+from utils.ipset import IPSet
+from utils.journal import PageJournal
+from utils.jsonstream import JsonItemParser
+from utils.limits import DEADLINE, SearchLimits, SearchResult
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class PendingRequest:
+    """
+    Request built by an asyncio client, sent later by `AsyncApiClient._send`.
+
+    Attributes:
+        method (str): HTTP method.
+        url (str): Request URL.
+        kwargs (dict): Request arguments (params, json, stream).
+    """
+
+    def __init__(self, method: str, url: str, **kwargs):
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+
+class AsyncResponse:
+    """
+    Fully read aiohttp response exposing the part of the `requests.Response` interface
+    used by the engine logic.
+
+    Attributes:
+        status_code (int): HTTP status.
+        headers (dict): Response headers.
+        content (bytes): Response body, empty if it was streamed to a parser.
+    """
+
+    def __init__(self, status_code: int, headers, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncApiClient(EngineCore):
+    """
+        Base class for the API engine, sending requests with aiohttp on an asyncio event loop.
+
+        All pages of a query are fetched by at most `concurrency` tasks and yielded in page order.
+        The aiohttp session is created on first use, inside the running event loop.
+
+        Attributes:
+            session (aiohttp.ClientSession | None): Keep-alive session shared by all requests of this client.
+    """
+
+    def __init__(self, api_key, session=None, **kwargs):
+        """
+             Initializes the AsyncApiClient object.
+
+             Args:
+                 api_key (str): API key for the client.
+                 session (aiohttp.ClientSession): Session to send the requests with, created on
+                     first use if omitted. A given session is not closed by the client.
+                 **kwargs: Options of EngineCore (e.g. concurrency, rate_limit, timeout, cache).
+
+             Raises:
+                 ImportError: If aiohttp is not installed.
+        """
+        if aiohttp is None:
+            raise ImportError('The asyncio clients require aiohttp, install it with: pip install aiohttp')
+        super().__init__(api_key, **kwargs)
+        self.session = session
+        self._owns_session = session is None
+
+    def _get_session(self):
+        """
+        Get the client's session, creating it on first use.
+
+        The connection pool holds one connection per in-flight page plus one for count().
+
+        Returns:
+            aiohttp.ClientSession: Session of the client.
+        """
+        if self.session is None or self.session.closed:
+            connect_timeout, read_timeout = self.timeout
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency + 1),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout))
+            self._owns_session = True
+        return self.session
+
+    async def close(self):
+        """
+        Close the pooled connections of the client.
+        """
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def build_request(self, url: str, params: dict = None, method: str = 'GET', **kwargs) -> PendingRequest:
+        """
+        Build a request that goes through the client's session.
+
+        Args:
+            url (str): Request URL.
+            params (dict): Query string parameters.
+            method (str): HTTP method.
+            **kwargs: Extra request arguments (e.g. json).
+
+        Returns:
+            PendingRequest: Request ready to be sent.
+        """
+        return PendingRequest(method, url, params=params or {}, headers=self.HEADERS, **kwargs)
+
+    async def count(self, query: str, limits: SearchLimits = None) -> int:
+        """
+          Get the number of items for a query.
+
+          Args:
+              query (str): Search query.
+              limits (SearchLimits): Limits of the search, the request is not sent once a
+                  limit is hit and is abandoned at the deadline.
+
+          Returns:
+              int: Number of items matching the query, None if the request failed or was stopped.
+        """
+        query = query.strip()
+        if self._stop_early(limits):
+            return None
+        if len(self.keys) > 1 and not self.keys.refreshed:
+            await self.refresh_quotas()
+        request = self._count_request(query)
+        try:
+            self.logger.info(f'Getting the number of servers for query: {query}')
+            if limits is None or limits.deadline is None:
+                return self._read_count(query, request, await self._send(request))
+            send = asyncio.ensure_future(self._send(request))
+            done, _ = await asyncio.wait([send], timeout=limits.remaining())
+            if not done:
+                send.cancel()
+                limits.stop(DEADLINE)
+                self.logger.error(f'The count request of the query: {query} did not finish before the deadline')
+                return None
+            return self._read_count(query, request, send.result())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f'Error while making the request: {str(e)}')
+        except Exception as e:
+            self.logger.error(f'An unhandled error occurred: {str(e)}')
+
+    async def refresh_quotas(self) -> dict:
+        """
+        Request the remaining quota of every API key and take the used up keys out of rotation.
+
+        Returns:
+            dict: State of every key, by masked key.
+        """
+        self.keys.refreshed = True
+        for key in self.keys:
+            request = self._quota_request()
+            if request is None:
+                break
+            try:
+                response = await self._send(request, key)
+                if response.status_code == HTTPStatus.OK:
+                    self.keys.set_quota(key, self._read_quota(response.json()))
+                else:
+                    self.logger.error(f'Failed to get the quota of the key {key.name}: HTTP {response.status_code}')
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                self.logger.error(f'Failed to get the quota of the key {key.name}: {str(e)}')
+        return self.keys.snapshot()
+
+    async def get_facet_counts(self, query: str, facet: str) -> list[tuple[str, int]]:
+        """
+        Get the most common values of a facet among the results of a query.
+
+        Args:
+            query (str): Search query.
+            facet (str): Facet name, one of `_SHARD_FACETS`.
+
+        Returns:
+            list[tuple[str, int]]: Facet values with their number of results.
+        """
+        try:
+            response = await self._send(self._facet_request(query, facet))
+            if response.status_code == HTTPStatus.OK:
+                return self._read_facet_counts(response.json(), facet)
+            self.logger.error(f'HTTP error: {response.status_code}')
+            self.logger.error(f'Error text: {response.text}')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f'Error while making the request: {str(e)}')
+        except ValueError as e:
+            self.logger.error(f'Failed to decode the response: {str(e)}')
+        except KeyPoolExhaustedException as e:
+            self.logger.error(str(e))
+        return []
+
+    async def _send(self, request: PendingRequest, key=None, parser: JsonItemParser = None):
+        """
+        Send a request with one of the client's API keys, within the key's rate limit, and read its body.
+
+        A fresh cached response is returned without sending anything, unless
+        `refresh_cache` is set.
+
+        Args:
+            request (PendingRequest): Request to send.
+            key (PooledKey): Key to send the request with, the least loaded key if omitted.
+            parser (JsonItemParser): Parser the body of a successful response is streamed to
+                while it is received, instead of being kept in the response.
+
+        Returns:
+            AsyncResponse | CachedResponse: Server response.
+
+        Raises:
+            aiohttp.ClientError: If the request failed.
+            asyncio.TimeoutError: If the server did not answer in time.
+            ValueError: If the streamed body is not valid JSON.
+            KeyPoolExhaustedException: If every API key is out of rotation.
+        """
+        cached = self._cached(request)
+        if cached is not None:
+            return cached
+        if key is None:
+            key = await self.keys.acquire_async()
+        else:
+            await key.limiter.acquire_async()
+        self._apply_key(request, key)
+        # aiohttp rejects None values, requests leaves them out.
+        params = {name: value for name, value in request.kwargs['params'].items() if value is not None}
+        headers = {name: value for name, value in request.kwargs['headers'].items() if value is not None}
+        contexts = self.metrics.request_started(request)
+        started = time.monotonic()
+        response, error = None, None
+        try:
+            async with self._get_session().request(request.method, request.url, params=params,
+                                                   json=request.kwargs.get('json'), headers=headers) as raw:
+                response = AsyncResponse(raw.status, raw.headers, b'')
+                if parser is not None and raw.status == HTTPStatus.OK:
+                    self._on_response(request, response, key)
+                    async for chunk in raw.content.iter_chunked(self._PAGE_CHUNK_SIZE):
+                        self.metrics.record_bytes(len(chunk))
+                        parser.feed(chunk)
+                    parser.close()
+                    return response
+                response.content = await raw.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+            raise
+        finally:
+            self.keys.release(key)
+            self.metrics.request_finished(request, contexts, response, error, time.monotonic() - started)
+        self.metrics.record_bytes(len(response.content))
+        self._on_response(request, response, key)
+        return response
+
+    async def fetch_page(self, request: PendingRequest) -> list:
+        """
+        Fetch one page request of `get_request_page_list` with the client's keys, rate limits and retries.
+
+        Args:
+            request (PendingRequest): Page request.
+
+        Returns:
+            list: Raw items of the page, empty if all attempts failed.
+        """
+        return await self._fetch_page(request)
+
+    async def _fetch_page(self, request: PendingRequest) -> list:
+        """
+        Send a single page request, retrying with exponential backoff on failure.
+
+        Args:
+            request (PendingRequest): Page request.
+
+        Returns:
+            list: Raw items of the page, empty if all attempts failed.
+        """
+        for retry in range(1, self._MAX_RETRY_ATTEMPTS):
+            response = None
+            try:
+                self.logger.info(f'Sending a request, Parameters: {request.kwargs}')
+                parser = self._page_parser()
+                response = await self._send(request, parser=parser)
+                if response.status_code == HTTPStatus.OK:
+                    return self._read_page(request, response, parser)
+                else:
+                    cause = 'throttled' if response.status_code in self.THROTTLE_STATUSES else 'http_error'
+                    self.logger.error(f'HTTP error: {response.status_code}')
+                    self.logger.error(f'Error text: {response.text}')
+            except (NullResultException, ValueError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                cause = self._retry_cause(e)
+                if isinstance(e, NullResultException):
+                    self.logger.error(f'Failed to retrieve the list of IP addresses from the API: {e}')
+                else:
+                    self.logger.error(f'Error while making the request: {str(e)}')
+            except KeyPoolExhaustedException:
+                # The pool warned when its last key was retired, the page is left missing.
+                return []
+            if retry < self._MAX_RETRY_ATTEMPTS - 1:
+                delay = self._retry_delay(retry, response)
+                self.metrics.record_retry(cause, retry, delay)
+                self.logger.warning(
+                    f'Retrying the request in {delay:.1f} seconds (attempt {retry} of {self._MAX_RETRY_ATTEMPTS})')
+                await asyncio.sleep(delay)
+            else:
+                self.logger.error(f'Failed to get results after {retry} attempts')
+        return []
+
+    @staticmethod
+    def _retry_cause(error: Exception) -> str:
+        """
+        Classify a failed page request for the retry metrics.
+
+        Args:
+            error (Exception): Error raised while fetching the page.
+
+        Returns:
+            str: Retry cause.
+        """
+        if isinstance(error, NullResultException):
+            return 'empty_page'
+        if isinstance(error, asyncio.TimeoutError):
+            return 'timeout'
+        if isinstance(error, aiohttp.ClientConnectionError):
+            return 'connection'
+        if isinstance(error, ValueError):
+            return 'decode'
+        return 'request_error'
+
+    async def _iter_indexed_pages(self, query: str, count: int = None, skip=(),
+                                  limits: SearchLimits = None) -> AsyncIterator[tuple[int, list]]:
+        """
+        Fetch the result pages of a query and yield them with their page index.
+
+        Pages are fetched by a sliding window of `concurrency` tasks and yielded in page order,
+        so at most `concurrency` finished pages are buffered ahead of the consumer.
+
+        With limits, the pages are sent in waves sized to the result target (see
+        `_next_wave`), and the pages in flight are cancelled once a limit is hit.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            skip: Indexes of the pages that must not be fetched.
+            limits (SearchLimits): Limits of the search, checked between pages; the consumer
+                counts the results.
+
+        Yields:
+            tuple[int, list]: Page index and raw items of the page, empty if the page failed.
+        """
+        query = query.strip()
+        if count is None:
+            count = await self.count(query, limits) or 0
+        indexed_requests, first_page = self._plan_pages(query, count, skip, limits)
+        if first_page is not None:
+            yield 0, first_page
+        pending = deque(indexed_requests)
+        window = []
+        try:
+            while pending:
+                if self._stop_early(limits):
+                    return
+                wave = iter(self._next_wave(pending, limits))
+                for index, request in wave:
+                    window.append((index, asyncio.ensure_future(self._fetch_page(request))))
+                    if len(window) >= self.concurrency:
+                        break
+                while window:
+                    index, task = window[0]
+                    page_results = await self._wait_page(task, limits)
+                    if page_results is None:
+                        return
+                    window.pop(0)
+                    next_request = next(wave, None)
+                    if next_request is not None:
+                        window.append((next_request[0], asyncio.ensure_future(self._fetch_page(next_request[1]))))
+                    yield index, page_results
+                    if (window or pending) and self._stop_early(limits):
+                        return
+        finally:
+            for _, task in window:
+                task.cancel()
+
+    async def _wait_page(self, task: asyncio.Future, limits: SearchLimits | None) -> list | None:
+        """
+        Wait for a page, checking the limits while waiting.
+
+        Args:
+            task (asyncio.Future): Task fetching the page.
+            limits (SearchLimits | None): Limits of the search.
+
+        Returns:
+            list | None: Raw items of the page, None if a limit was hit.
+        """
+        if limits is None:
+            return await task
+        while True:
+            done, _ = await asyncio.wait([task], timeout=limits.wait_timeout())
+            if done:
+                return task.result()
+            if self._stop_early(limits):
+                return None
+
+    async def iter_pages(self, query: str, count: int = None, limits: SearchLimits = None) -> AsyncIterator[list]:
+        """
+        Fetch the result pages of a query and yield them as they arrive, in page order.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            limits (SearchLimits): Limits of the search, its results are the page items.
+
+        Yields:
+            list: Raw items of each page, empty if the page failed.
+        """
+        async for _, page_results in self._iter_indexed_pages(query, count, limits=limits):
+            if limits is not None:
+                if not page_results:
+                    limits.missing_pages += 1
+                page_results = limits.take(page_results)
+            yield page_results
+
+    async def iter_hosts(self, query: str, count: int = None, limits: SearchLimits = None) -> AsyncIterator[HostRecord]:
+        """
+        Yield a host record per search result as each page arrives.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            limits (SearchLimits): Limits of the search, its results are the host records.
+
+        Yields:
+            HostRecord: Host record, one per service of a host.
+        """
+        async for page_results in self.iter_pages(query, count, limits):
+            for host in self.get_parsed_hosts(page_results):
+                yield host
+
+    async def iter_ip_pages(self, query: str, count: int = None, journal: PageJournal = None,
+                            seen: IPSet = None, limits: SearchLimits = None) -> AsyncIterator[list[str]]:
+        """
+        Yield the deduplicated IP addresses of each page as it arrives.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            journal (PageJournal): Journal of the job for checkpoint and resume.
+            seen (IPSet): Set that collects the addresses, they are not yielded again.
+            limits (SearchLimits): Limits of the search, its results are the new addresses.
+
+        Yields:
+            list[str]: New IP addresses of a fetched page, possibly empty.
+        """
+        if seen is None:
+            seen = IPSet()
+        if journal is not None and count is None:
+            count = await self.count(query, limits)
+        finished_pages, resumed_ips = self._resume(query, count, journal, seen, limits)
+        if resumed_ips:
+            yield resumed_ips
+        missing_pages = 0
+        try:
+            async for index, page_results in self._iter_indexed_pages(query, count, skip=finished_pages,
+                                                                       limits=limits):
+                if not page_results:
+                    missing_pages += 1
+                    continue
+                yield self._page_ips(index, page_results, journal, seen, limits)
+        finally:
+            if journal is not None:
+                journal.close()
+        if limits is not None:
+            limits.missing_pages += missing_pages
+        self._finish_journal(journal, missing_pages, limits)
+
+    async def iter_ips(self, query: str, count: int = None, journal: PageJournal = None,
+                       seen: IPSet = None, limits: SearchLimits = None) -> AsyncIterator[str]:
+        """
+        Yield deduplicated IP addresses as each page arrives.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            journal (PageJournal): Journal of the job for checkpoint and resume.
+            seen (IPSet): Set that collects the addresses, they are not yielded again.
+            limits (SearchLimits): Limits of the search, its results are the new addresses.
+
+        Yields:
+            str: IP address.
+        """
+        async for ips in self.iter_ip_pages(query, count, journal=journal, seen=seen, limits=limits):
+            for ip in ips:
+                yield ip
+
+    async def search(self, query: str, count: int, journal: PageJournal = None,
+                     limits: SearchLimits = None) -> SearchResult:
+        """
+        Collect the IP addresses matching a query.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query.
+            journal (PageJournal): Journal of the job for checkpoint and resume.
+            limits (SearchLimits): Result target, deadline and cancel token of the search.
+
+        Returns:
+            SearchResult: Deduplicated IP addresses, iterated in numeric order (IPv4 first),
+                flagged as incomplete if a limit stopped the search or pages are missing.
+        """
+        limits = limits if limits is not None else SearchLimits()
+        servers = SearchResult()
+        async for _ in self.iter_ips(query, count, journal=journal, seen=servers, limits=limits):
+            pass
+        return servers.finish(limits, count)
+
+
+class AsyncShodanClient(ShodanEngine, AsyncApiClient):
+    """
+    Client for working with the Shodan API on an asyncio event loop.
+    """
+
+
+class AsyncFofaClient(FofaEngine, AsyncApiClient):
+    """
+    Client for working with the Fofa API on an asyncio event loop.
+    """
+
+
+class AsyncZoomeyeClient(ZoomeyeEngine, AsyncApiClient):
+    """
+    Client for working with the ZoomEye API on an asyncio event loop.
+    """
+
+
+class AsyncNetlasClient(NetlasEngine, AsyncApiClient):
+    """
+    Client for working with the Netlas API on an asyncio event loop.
+
+    Results are always paged, the bulk download is only available in the gevent client.
+    """
+
+    def _use_bulk(self, count: int) -> bool:
+        return False
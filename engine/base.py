@@ -1,167 +1,537 @@
-import logging
-import math
 import time
+from collections import deque
+from collections.abc import Iterator
 from http import HTTPStatus
 import grequests
 import requests
+from gevent import Timeout
+from gevent.pool import Pool
+from requests.adapters import HTTPAdapter
 
-from utils.exceptions import NullResultException
-from utils.helper import ipv4_sort
+from engine.core import EngineCore
+from utils.exceptions import KeyPoolExhaustedException, NullResultException
+from utils.hosts import HostRecord
+from utils.ipset import IPSet
+from utils.journal import PageJournal
+from utils.jsonstream import JsonItemParser
+from utils.limits import DEADLINE, SearchLimits, SearchResult
 
 
-class BaseApiClient():
+class BaseApiClient(EngineCore):
     """
-        Base class for the API engine.
+        Base class for the API engine, sending requests with grequests and gevent.
+
+        Importing this module monkey-patches the process with gevent (through grequests),
+        which must happen before `requests` is imported anywhere else. Services running an
+        asyncio event loop should use the clients of `engine.aio` instead.
 
         Attributes:
-            api_key (str): API key for the engine.
-            _MAX_RETRY_ATTEMPTS (int): Maximum number of retry attempts.
-            _RESULTS_PER_PAGE (int): Number of results per page.
-            _TOTAL_ITEMS_KWORD (str): Key to retrieve the total number of items in the API response.
-            BASE_URL (str): Base URL for API requests.
-            COUNT_ENDPOINT (str): Endpoint for counting items.
-            SEARCH_ENDPOINT (str): Endpoint for search queries.
-            PARAMS (dict): Request parameters.
-            HEADERS (dict): Request headers.
-            _QUERY_KWORD (str): Key for passing search queries.
-            _COUNT_KWORD (str): Key to retrieve the count in the API response.
-            _IP_KWORD (str): Key to extract IP addresses from the API response.
-            _PAGE_KWORD (str): Key for passing the page.
+            session (requests.Session): Keep-alive session shared by all requests of this client.
     """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, **kwargs):
         """
              Initializes the BaseApiClient object.
 
              Args:
                  api_key (str): API key for the client.
+                 **kwargs: Options of EngineCore (e.g. concurrency, rate_limit, timeout, cache).
+        """
+        super().__init__(api_key, **kwargs)
+        self.session = self._create_session()
+
+    def _create_session(self) -> requests.Session:
+        """
+        Create the keep-alive session used for every request of the client.
+
+        The connection pool holds one connection per in-flight page plus one for count().
+
+        Returns:
+            requests.Session: Configured session.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency + 1, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        """
+        Close the pooled connections of the client.
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def build_request(self, url: str, params: dict = None, method: str = 'GET', **kwargs):
+        """
+        Build a request that goes through the client's session.
+
+        Args:
+            url (str): Request URL.
+            params (dict): Query string parameters.
+            method (str): HTTP method.
+            **kwargs: Extra arguments of `requests.Session.request` (e.g. json, stream).
+
+        Returns:
+            grequests.AsyncRequest: Request ready to be sent.
         """
-        self._MAX_RETRY_ATTEMPTS = 10
-        self._RESULTS_PER_PAGE = 100
-        self._TOTAL_ITEMS_KWORD = ''
-        self.BASE_URL = ''
-        self.COUNT_ENDPOINT = ''
-        self.SEARCH_ENDPOINT = ''
-        self.PARAMS = {}
-        self.HEADERS = {}
-        self._PAGE_KWORD = 'page'
-        self._QUERY_KWORD = ''
-        self._COUNT_KWORD = ''
-        self._IP_KWORD = ''
-        self.api_key = api_key
-        self.logger = logging.getLogger(__name__)
-
-    def count(self, query: str) -> int:
+        return grequests.AsyncRequest(method, url, params=params or {}, headers=self.HEADERS, session=self.session,
+                                      timeout=self.timeout, **kwargs)
+
+    def count(self, query: str, limits: SearchLimits = None) -> int:
         """
           Get the number of items for a query.
 
+          With `_COUNT_FROM_SEARCH` enabled the first search page is requested instead of
+          the count endpoint; its items are kept and reused by the following search.
+
           Args:
               query (str): Search query.
+              limits (SearchLimits): Limits of the search, the request is not sent once a
+                  limit is hit and is abandoned at the deadline.
 
           Returns:
-              int: Number of items matching the query.
+              int: Number of items matching the query, None if the request failed or was stopped.
         """
-        params_copy = self.PARAMS.copy()
-        params_copy[self._QUERY_KWORD] = query
+        query = query.strip()
+        if self._stop_early(limits):
+            return None
+        if len(self.keys) > 1 and not self.keys.refreshed:
+            self.refresh_quotas()
+        request = self._count_request(query)
+        timer = Timeout(limits.remaining() if limits is not None else None)
         try:
             self.logger.info(f'Getting the number of servers for query: {query}')
-            result = grequests.get(self.COUNT_ENDPOINT, params=params_copy, headers=self.HEADERS).send()
-            if result.response.status_code == HTTPStatus.OK:
-                count = result.response.json()[self._COUNT_KWORD]
-                self.logger.info(f'For your query: [{query}], found [{count}]')
-                return count
-            else:
-                self.logger.error(f'HTTP error: {result.responses.status_code}')
-                self.logger.error(f'Error text: {result.responses.text}')
+            with timer:
+                return self._read_count(query, request, self._send(request))
+        except Timeout as e:
+            if e is not timer:
+                raise
+            limits.stop(DEADLINE)
+            self.logger.error(f'The count request of the query: {query} did not finish before the deadline')
         except requests.exceptions.RequestException as e:
             self.logger.error(f'Error while making the request: {str(e)}')
         except Exception as e:
             self.logger.error(f'An unhandled error occurred: {str(e)}')
 
-    def get_page_count(self, count: int) -> int:
+    def get_facet_counts(self, query: str, facet: str) -> list[tuple[str, int]]:
         """
-        Calculate the number of pages based on the total number of items.
+        Get the most common values of a facet among the results of a query.
 
         Args:
-            count (int): Total number of items.
+            query (str): Search query.
+            facet (str): Facet name, one of `_SHARD_FACETS`.
 
         Returns:
-            int: Number of pages.
+            list[tuple[str, int]]: Facet values with their number of results.
         """
-        return math.ceil(count / self._RESULTS_PER_PAGE)
+        payload = self._get_json(self._facet_request(query, facet))
+        if not payload:
+            return []
+        return self._read_facet_counts(payload, facet)
 
-    def _search(self, query: str, count: int) -> list[str]:
+    def refresh_quotas(self) -> dict:
         """
-        Execute a search query to the API.
+        Request the remaining quota of every API key and take the used up keys out of rotation.
+
+        Called by count() when the client has several keys. Without a quota endpoint the
+        keys stay in rotation until the API rejects them.
+
+        Returns:
+            dict: State of every key, by masked key.
+        """
+        self.keys.refreshed = True
+        for key in self.keys:
+            request = self._quota_request()
+            if request is None:
+                break
+            try:
+                response = self._send(request, key)
+                if response.status_code == HTTPStatus.OK:
+                    self.keys.set_quota(key, self._read_quota(response.json()))
+                else:
+                    self.logger.error(f'Failed to get the quota of the key {key.name}: HTTP {response.status_code}')
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self.logger.error(f'Failed to get the quota of the key {key.name}: {str(e)}')
+        return self.keys.snapshot()
+
+    def _get_json(self, request) -> dict | None:
+        """
+        Send a single request and decode its JSON body.
+
+        Args:
+            request (grequests.AsyncRequest): Request to send.
+
+        Returns:
+            dict | None: Decoded body, None if the request failed.
+        """
+        try:
+            response = self._send(request)
+            if response.status_code == HTTPStatus.OK:
+                return response.json()
+            self.logger.error(f'HTTP error: {response.status_code}')
+            self.logger.error(f'Error text: {response.text}')
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f'Error while making the request: {str(e)}')
+        except ValueError as e:
+            self.logger.error(f'Failed to decode the response: {str(e)}')
+        except KeyPoolExhaustedException as e:
+            self.logger.error(str(e))
+
+    def _send(self, request, key=None, parser: JsonItemParser = None) -> requests.Response:
+        """
+        Send a request with one of the client's API keys, within the key's rate limit.
+
+        A fresh cached response is returned without sending anything, unless
+        `refresh_cache` is set.
+
+        Args:
+            request (grequests.AsyncRequest): Request to send.
+            key (PooledKey): Key to send the request with, the least loaded key if omitted.
+            parser (JsonItemParser): Parser the body of a successful response is streamed to
+                while it is received, instead of being kept in the response.
+
+        Returns:
+            requests.Response: Server response.
+
+        Raises:
+            requests.exceptions.RequestException: If the request failed.
+            ValueError: If the streamed body is not valid JSON.
+            KeyPoolExhaustedException: If every API key is out of rotation.
+        """
+        cached = self._cached(request)
+        if cached is not None:
+            return cached
+        if key is None:
+            key = self.keys.acquire()
+        else:
+            key.limiter.acquire()
+        self._apply_key(request, key)
+        contexts = self.metrics.request_started(request)
+        started = time.monotonic()
+        try:
+            result = request.send(stream=True) if parser is not None else request.send()
+        finally:
+            self.keys.release(key)
+        self.metrics.request_finished(request, contexts, result.response, getattr(result, 'exception', None),
+                                      time.monotonic() - started)
+        if result.response is None:
+            raise result.exception
+        self._on_response(request, result.response, key)
+        if parser is not None and result.response.status_code == HTTPStatus.OK:
+            try:
+                for chunk in self.metrics.count_bytes(result.response.iter_content(self._PAGE_CHUNK_SIZE)):
+                    parser.feed(chunk)
+                parser.close()
+            except Exception:
+                # A fully read body returns the connection to the pool, a partly read one cannot be reused.
+                result.response.close()
+                raise
+        elif not request.kwargs.get('stream'):
+            self.metrics.record_bytes(len(result.response.content))
+        return result.response
+
+    def fetch_page(self, request) -> list:
+        """
+        Fetch one page request of `get_request_page_list` with the client's keys, rate limits and retries.
+
+        Args:
+            request (grequests.AsyncRequest): Page request.
+
+        Returns:
+            list: Raw items of the page, empty if all attempts failed.
+        """
+        return self._fetch_page(request)
+
+    def _fetch_page(self, request) -> list:
+        """
+        Send a single page request, retrying with exponential backoff on failure.
+
+        Args:
+            request (grequests.AsyncRequest): Page request.
+
+        Returns:
+            list: Raw items of the page, empty if all attempts failed.
+        """
+        for retry in range(1, self._MAX_RETRY_ATTEMPTS):
+            response = None
+            try:
+                self.logger.info(f'Sending a request, Parameters: {request.kwargs}')
+                parser = self._page_parser()
+                response = self._send(request, parser=parser)
+                if response.status_code == HTTPStatus.OK:
+                    return self._read_page(request, response, parser)
+                else:
+                    cause = 'throttled' if response.status_code in self.THROTTLE_STATUSES else 'http_error'
+                    self.logger.error(f'HTTP error: {response.status_code}')
+                    self.logger.error(f'Error text: {response.text}')
+            except (
+                    NullResultException, requests.exceptions.Timeout,
+                    requests.exceptions.RequestException, ValueError) as e:
+                cause = self._retry_cause(e)
+                if isinstance(e, NullResultException):
+                    self.logger.error(f'Failed to retrieve the list of IP addresses from the API: {e}')
+                else:
+                    self.logger.error(f'Error while making the request: {str(e)}')
+            except KeyPoolExhaustedException:
+                # The pool warned when its last key was retired, the page is left missing.
+                return []
+            if retry < self._MAX_RETRY_ATTEMPTS - 1:
+                delay = self._retry_delay(retry, response)
+                self.metrics.record_retry(cause, retry, delay)
+                self.logger.warning(
+                    f'Retrying the request in {delay:.1f} seconds (attempt {retry} of {self._MAX_RETRY_ATTEMPTS})')
+                time.sleep(delay)
+            else:
+                self.logger.error(f'Failed to get results after {retry} attempts')
+        return []
+
+    @staticmethod
+    def _retry_cause(error: Exception) -> str:
+        """
+        Classify a failed page request for the retry metrics.
+
+        Args:
+            error (Exception): Error raised while fetching the page.
+
+        Returns:
+            str: Retry cause.
+        """
+        if isinstance(error, NullResultException):
+            return 'empty_page'
+        if isinstance(error, requests.exceptions.Timeout):
+            return 'timeout'
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return 'connection'
+        if isinstance(error, ValueError):
+            return 'decode'
+        return 'request_error'
+
+    def _iter_indexed_pages(self, query: str, count: int = None, skip=(),
+                            limits: SearchLimits = None) -> Iterator[tuple[int, list]]:
+        """
+        Fetch the result pages of a query and yield them with their page index.
+
+        Pages are fetched by a pool of `concurrency` greenlets and yielded in page order.
+        At most `concurrency` finished pages are buffered ahead of the consumer.
+
+        With limits, the pages are sent in waves sized to the result target (see
+        `_next_wave`), and the pages in flight are killed once a limit is hit.
 
         Args:
             query (str): Search query.
-            count (int): Number of items matching the query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            skip: Indexes of the pages that must not be fetched.
+            limits (SearchLimits): Limits of the search, checked between pages; the consumer
+                counts the results.
+
+        Yields:
+            tuple[int, list]: Page index and raw items of the page, empty if the page failed.
+        """
+        query = query.strip()
+        if count is None:
+            count = self.count(query, limits) or 0
+        indexed_requests, first_page = self._plan_pages(query, count, skip, limits)
+        if first_page is not None:
+            yield 0, first_page
+        pending = deque(indexed_requests)
+        pool = Pool(self.concurrency)
+        try:
+            while pending:
+                if self._stop_early(limits):
+                    return
+                wave = self._next_wave(pending, limits)
+                pages = pool.imap(self._fetch_indexed_page, wave, maxsize=self.concurrency)
+                for left in range(len(wave) - 1, -1, -1):
+                    indexed_page = self._next_page(pages, limits)
+                    if indexed_page is None:
+                        return
+                    yield indexed_page
+                    if (left or pending) and self._stop_early(limits):
+                        return
+        finally:
+            pool.kill()
+
+    def _next_page(self, pages: Iterator[tuple[int, list]], limits: SearchLimits | None) -> tuple[int, list] | None:
+        """
+        Wait for the next page, checking the limits while waiting.
+
+        Args:
+            pages (Iterator[tuple[int, list]]): Pages being fetched.
+            limits (SearchLimits | None): Limits of the search.
 
         Returns:
-            list[str]: List of search results.
+            tuple[int, list] | None: Page index and raw items of the page, None if a limit was hit.
         """
-        request_list = self.get_request_page_list(query, count)
-        results = []
-        for request in request_list:
-            for retry in range(1, self._MAX_RETRY_ATTEMPTS):
-                try:
-                    self.logger.info(f'Sending a request: {query}, Parameters: {request.kwargs}')
-                    result = request.send()
-                    if result.response.status_code == HTTPStatus.OK:
-                        page_results = result.response.json()[self._TOTAL_ITEMS_KWORD]
-                        if len(page_results) > 0:
-                            results.extend(page_results)
-                            break
-                        else:
-                            raise NullResultException
-                    else:
-                        self.logger.error(f'HTTP error: {result.response.status_code}')
-                        self.logger.error(f'Error text: {result.response.text}')
-                except (
-                        NullResultException, requests.exceptions.Timeout,
-                        requests.exceptions.RequestException) as e:
-                    if isinstance(e, NullResultException):
-                        self.logger.error(f'Failed to retrieve the list of IP addresses from the API: {e}')
-                    if retry < self._MAX_RETRY_ATTEMPTS - 1:
-                        self.logger.warning(
-                            f'Retrying the request in {retry} seconds (attempt {retry} of {self._MAX_RETRY_ATTEMPTS})')
-                        time.sleep(retry)
-                    else:
-                        self.logger.error(f'Failed to get results after {retry} attempts')
-        return results
-
-    def search(self, query: str, count: int) -> list[str]:
-        result_list = self._search(query, count)
-        servers = self.get_parsed_ip_list(result_list)
-        return ipv4_sort(servers)
+        if limits is None:
+            return next(pages)
+        while True:
+            with Timeout(limits.wait_timeout(), False):
+                return next(pages)
+            if self._stop_early(limits):
+                return None
 
-    def get_ip_list(self, query: str, count) -> list[str]:
-        results = self.search(query, count)
-        if results:
-            return self.get_parsed_ip_list(results)
+    def _fetch_indexed_page(self, indexed_request: tuple) -> tuple[int, list]:
+        index, request = indexed_request
+        return index, self._fetch_page(request)
+
+    def iter_pages(self, query: str, count: int = None, limits: SearchLimits = None) -> Iterator[list]:
+        """
+        Fetch the result pages of a query and yield them as they arrive, in page order.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            limits (SearchLimits): Limits of the search, its results are the page items.
+
+        Yields:
+            list: Raw items of each page, empty if the page failed.
+        """
+        for _, page_results in self._iter_indexed_pages(query, count, limits=limits):
+            if limits is not None:
+                if not page_results:
+                    limits.missing_pages += 1
+                page_results = limits.take(page_results)
+            yield page_results
+
+    def iter_records(self, query: str, count: int = None, limits: SearchLimits = None) -> Iterator:
+        """
+        Yield raw search results one by one, page by page.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            limits (SearchLimits): Limits of the search, its results are the records.
+
+        Yields:
+            Raw search result items.
+        """
+        for page_results in self.iter_pages(query, count, limits):
+            yield from page_results
+
+    def iter_hosts(self, query: str, count: int = None, limits: SearchLimits = None) -> Iterator[HostRecord]:
+        """
+        Yield a host record per search result as each page arrives.
+
+        Records are not deduplicated: a host with several services yields one record per
+        service. Create the client with `host_fields=True` so that minimal mode requests
+        the fields of the records.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            limits (SearchLimits): Limits of the search, its results are the host records.
+
+        Yields:
+            HostRecord: Host record.
+        """
+        for page_results in self.iter_pages(query, count, limits):
+            yield from self.get_parsed_hosts(page_results)
+
+    def iter_ip_pages(self, query: str, count: int = None, journal: PageJournal = None,
+                      seen: IPSet = None, limits: SearchLimits = None) -> Iterator[list[str]]:
+        """
+        Yield the deduplicated IP addresses of each page as it arrives.
+
+        Only the addresses seen so far are kept in memory, packed in an IPSet; raw page
+        items are dropped as soon as their IP addresses are extracted.
+
+        With a journal, the addresses of the pages finished by a previous run are yielded
+        first as a single batch and only the missing pages are fetched. Every new page is
+        recorded as soon as it is processed; the journal is removed once no page is missing.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            journal (PageJournal): Journal of the job for checkpoint and resume.
+            seen (IPSet): Set that collects the addresses, they are not yielded again.
+            limits (SearchLimits): Limits of the search, its results are the new addresses.
+
+        Yields:
+            list[str]: New IP addresses of a fetched page, possibly empty.
+        """
+        if seen is None:
+            seen = IPSet()
+        if journal is not None and count is None:
+            count = self.count(query, limits)
+        finished_pages, resumed_ips = self._resume(query, count, journal, seen, limits)
+        if resumed_ips:
+            yield resumed_ips
+        missing_pages = 0
+        try:
+            for index, page_results in self._iter_indexed_pages(query, count, skip=finished_pages, limits=limits):
+                if not page_results:
+                    missing_pages += 1
+                    continue
+                yield self._page_ips(index, page_results, journal, seen, limits)
+        finally:
+            if journal is not None:
+                journal.close()
+        if limits is not None:
+            limits.missing_pages += missing_pages
+        self._finish_journal(journal, missing_pages, limits)
 
-    def get_request_page_list(self, query: str, count: int) -> list:
+    def iter_ips(self, query: str, count: int = None, journal: PageJournal = None,
+                 seen: IPSet = None, limits: SearchLimits = None) -> Iterator[str]:
         """
-        Get a list of requests for paging the results.
+        Yield deduplicated IP addresses as each page arrives.
+
+        See iter_ip_pages for the memory use and the journal.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            journal (PageJournal): Journal of the job for checkpoint and resume.
+            seen (IPSet): Set that collects the addresses, they are not yielded again.
+            limits (SearchLimits): Limits of the search, its results are the new addresses.
+
+        Yields:
+            str: IP address.
+        """
+        for ips in self.iter_ip_pages(query, count, journal=journal, seen=seen, limits=limits):
+            yield from ips
+
+    def _search(self, query: str, count: int, limits: SearchLimits = None) -> list[str]:
+        """
+        Execute a search query to the API.
 
         Args:
             query (str): Search query.
             count (int): Number of items matching the query.
+            limits (SearchLimits): Result target, deadline and cancel token of the search.
 
         Returns:
-            list[grequests.Request]: List of requests for searching by pages.
+            list[str]: List of search results.
         """
-        raise NotImplementedError
+        return list(self.iter_records(query, count, limits))
 
-    def get_parsed_ip_list(self, results: str) -> list:
+    def search(self, query: str, count: int, journal: PageJournal = None,
+               limits: SearchLimits = None) -> SearchResult:
         """
-        Get a list of IP addresses from the search results.
+        Collect the IP addresses matching a query.
 
         Args:
-            results: Search results.
+            query (str): Search query.
+            count (int): Number of items matching the query.
+            journal (PageJournal): Journal of the job for checkpoint and resume.
+            limits (SearchLimits): Result target, deadline and cancel token of the search.
 
         Returns:
-            list[str]: List of IP addresses.
+            SearchResult: Deduplicated IP addresses, iterated in numeric order (IPv4 first),
+                flagged as incomplete if a limit stopped the search or pages are missing.
         """
-        raise NotImplementedError
+        limits = limits if limits is not None else SearchLimits()
+        servers = SearchResult()
+        for _ in self.iter_ips(query, count, journal=journal, seen=servers, limits=limits):
+            pass
+        return servers.finish(limits, count)
+
+    def get_ip_list(self, query: str, count) -> list[str]:
+        results = self.search(query, count)
+        if results:
+            return self.get_parsed_ip_list(results)
@@ -0,0 +1,161 @@
+import time
+from collections.abc import Iterator
+from http import HTTPStatus
+
+# engine.base imports grequests, which must monkey-patch the process before requests is imported.
+from engine.base import BaseApiClient
+import requests
+from engine.fofa import FofaEngine
+from engine.netlas import NetlasEngine
+from engine.shodan import ShodanEngine
+from engine.zoomeye import ZoomeyeEngine
+from utils.exceptions import KeyPoolExhaustedException
+from utils.jsonstream import iter_json_items
+from utils.limits import SearchLimits
+
+
+class ShodanClient(ShodanEngine, BaseApiClient):
+    """
+    Client for working with the Shodan API, sending requests with gevent.
+    """
+
+
+class FofaClient(FofaEngine, BaseApiClient):
+    """
+    Client for working with the Fofa API, sending requests with gevent.
+    """
+
+
+class ZoomeyeClient(ZoomeyeEngine, BaseApiClient):
+    """
+    Client for working with the ZoomEye API, sending requests with gevent.
+    """
+
+
+class NetlasClient(NetlasEngine, BaseApiClient):
+    """
+    Client for working with the Netlas API, sending requests with gevent.
+
+    Large result sets are streamed from the bulk download endpoint instead of being paged.
+    """
+
+    def _iter_indexed_pages(self, query: str, count: int = None, skip=(),
+                            limits: SearchLimits = None) -> Iterator[tuple[int, list]]:
+        """
+        Fetch the results of a query, switching to the bulk download for large counts.
+
+        A result target below the bulk threshold is paged, as only a few pages are needed.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            skip: Indexes of the pages that must not be yielded.
+            limits (SearchLimits): Limits of the search.
+
+        Yields:
+            tuple[int, list]: Page index and raw items of the page.
+        """
+        query = query.strip()
+        if count is None:
+            count = self.count(query, limits) or 0
+        target = self._target(count, limits)
+        if self._use_bulk(target):
+            yield from self._iter_bulk_batches(query, target, skip, limits)
+        else:
+            yield from super()._iter_indexed_pages(query, count, skip, limits)
+
+    def _batch_digest(self, ips) -> int:
+        return hash(frozenset(ips))
+
+    def _deliver(self, delivered: dict, index: int, batch: list) -> bool:
+        """
+        Tell whether a downloaded page must be yielded, and record it as delivered.
+
+        Args:
+            delivered (dict): Digests of the pages already yielded by index, None if unknown.
+            index (int): Page index.
+            batch (list): Raw items of the page.
+
+        Returns:
+            bool: True if the page was not yielded before or came back with other addresses.
+        """
+        digest = self._batch_digest(self.get_parsed_ip_list(batch))
+        if index in delivered:
+            if delivered[index] is None or delivered[index] == digest:
+                return False
+            self.logger.warning(f'The download returned page {index} with other addresses, '
+                                f'the order of the results changed since it was first fetched')
+        delivered[index] = digest
+        return True
+
+    def _iter_bulk_batches(self, query: str, count: int, skip=(),
+                           limits: SearchLimits = None) -> Iterator[tuple[int, list]]:
+        """
+        Stream the results of a query from the bulk download endpoint.
+
+        The response body is decoded item by item while it is being received and the items
+        are grouped into pages of `_BULK_BATCH_SIZE`. If the stream breaks, the download is
+        retried and the pages that were already yielded are skipped. The limits are checked
+        after every page and the download is closed once one is hit.
+
+        Skipping a page by its index relies on the download returning the items in the same
+        order every time. The addresses of a skipped page are compared with the ones it had
+        before; if they differ the order changed and the page is yielded again, its addresses
+        already seen are dropped by the caller.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items to download, the result target of the search.
+            skip: Indexes of the pages that must not be yielded, or their addresses by index.
+            limits (SearchLimits): Limits of the search.
+
+        Yields:
+            tuple[int, list]: Page index and raw items of the page.
+        """
+        # Pages already yielded, with a digest of their addresses if known.
+        delivered = {index: self._batch_digest(ips) for index, ips in skip.items()} \
+            if isinstance(skip, dict) else dict.fromkeys(skip)
+        self.logger.info(f'Downloading {count} results for query: {query}')
+        for retry in range(1, self._MAX_RETRY_ATTEMPTS):
+            if self._stop_early(limits):
+                return
+            response = None
+            try:
+                response = self._send(self._bulk_request(query, count))
+                if response.status_code == HTTPStatus.OK:
+                    index, batch = 0, []
+                    chunks = self.metrics.count_bytes(response.iter_content(chunk_size=self._BULK_CHUNK_SIZE))
+                    for item in iter_json_items(chunks):
+                        batch.append(item)
+                        if len(batch) == self._BULK_BATCH_SIZE:
+                            if self._deliver(delivered, index, batch):
+                                self._record_page(response, batch)
+                                yield index, batch
+                                if (index + 1) * self._BULK_BATCH_SIZE < count and self._stop_early(limits):
+                                    return
+                            index, batch = index + 1, []
+                    if batch and self._deliver(delivered, index, batch):
+                        self._record_page(response, batch)
+                        yield index, batch
+                    return
+                else:
+                    cause = 'throttled' if response.status_code in self.THROTTLE_STATUSES else 'http_error'
+                    self.logger.error(f'HTTP error: {response.status_code}')
+                    self.logger.error(f'Error text: {response.text}')
+            except (requests.exceptions.RequestException, ValueError) as e:
+                cause = self._retry_cause(e)
+                self.logger.error(f'Error while downloading the results: {str(e)}')
+            except KeyPoolExhaustedException as e:
+                self.logger.error(str(e))
+                return
+            finally:
+                if response is not None:
+                    response.close()
+            if retry < self._MAX_RETRY_ATTEMPTS - 1:
+                delay = self._retry_delay(retry, response)
+                self.metrics.record_retry(cause, retry, delay)
+                self.logger.warning(
+                    f'Retrying the download in {delay:.1f} seconds (attempt {retry} of {self._MAX_RETRY_ATTEMPTS})')
+                time.sleep(delay)
+            else:
+                self.logger.error(f'Failed to download results after {retry} attempts')
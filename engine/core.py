@@ -0,0 +1,826 @@
+import logging
+import math
+import time
+from collections import deque
+from collections.abc import Callable
+from datetime import date
+from http import HTTPStatus
+
+from utils.cache import CachedResponse, ResponseCache, make_cache_key
+from utils.exceptions import NullResultException
+from utils.hosts import HostRecord
+from utils.ipset import IPSet
+from utils.journal import PageJournal
+from utils.jsonstream import JsonItemParser
+from utils.keypool import KeyPool, PooledKey, split_keys
+from utils.limits import SearchLimits
+from utils.metrics import REGISTRY, MetricsRegistry
+from utils.ratelimit import RateLimiter, parse_retry_after
+
+
+class EngineCore():
+    """
+        Engine logic shared by the gevent and the asyncio clients.
+
+        Holds the configuration of an engine and everything that does not depend on how
+        requests are sent: building requests, decoding responses, paging, caching and
+        metrics. It imports no HTTP library, the backends add the transport on top of it
+        (`engine.base.BaseApiClient` with gevent, `engine.aio.AsyncApiClient` with asyncio).
+
+        Attributes:
+            api_key (str): First API key of the engine.
+            api_keys (list[str]): All API keys of the engine, requests are spread across them.
+            _MAX_RETRY_ATTEMPTS (int): Maximum number of retry attempts.
+            _RESULTS_PER_PAGE (int): Number of results per page.
+            _TOTAL_ITEMS_KWORD (str): Key to retrieve the total number of items in the API response.
+            BASE_URL (str): Base URL for API requests.
+            COUNT_ENDPOINT (str): Endpoint for counting items.
+            SEARCH_ENDPOINT (str): Endpoint for search queries.
+            PARAMS (dict): Request parameters.
+            HEADERS (dict): Request headers.
+            _QUERY_KWORD (str): Key for passing search queries.
+            _COUNT_KWORD (str): Key to retrieve the count in the API response.
+            _IP_KWORD (str): Key to extract IP addresses from the API response.
+            _PAGE_KWORD (str): Key for passing the page.
+            _COUNT_FROM_SEARCH (bool): Take the count from the first search page and keep the page
+                for the search, for engines whose count endpoint is the search endpoint.
+            _MAX_FIRST_PAGES (int): Maximum number of first pages kept between count() and the search.
+            _CREDENTIAL_PARAMS (tuple): Request parameters holding credentials, left out of cache keys.
+            _FIELDS_KWORD (str): Key for passing the list of returned fields, empty if the API has none.
+            _MINIMAL_FIELDS (list[str]): Fields needed to extract IP addresses from the results.
+            _HOST_FIELDS (list[str]): Fields needed to build host records, requested with `host_fields`.
+            _ITEM_ROOT (str): Key of the object holding the fields of a result item, empty if they
+                are at the top level of the item.
+            _PAGE_CHUNK_SIZE (int): Size of the chunks read from a streamed page response.
+            _MAX_PAGES (int | None): Deepest page the API serves, None if there is no limit.
+            _SHARD_FACETS (list[str]): Facets used to split queries that exceed the page limit.
+            _CREDITS_PER_PAGE (float): Estimated API credits spent per result page, 0 if unknown.
+            DEFAULT_CONCURRENCY (int): Number of pages kept in flight unless overridden.
+            DEFAULT_RATE_LIMIT (float | None): Requests per second allowed by the provider.
+            THROTTLE_STATUSES (tuple): HTTP statuses that mean the client is sending too fast.
+            KEY_REJECTED_STATUSES (tuple): HTTP statuses that take the API key out of rotation.
+            DEFAULT_TIMEOUT (tuple): Connect and read timeouts in seconds.
+            concurrency (int): Number of pages kept in flight by this client, across all keys.
+            limiter (RateLimiter): Request budget of the first API key.
+            timeout (tuple): Connect and read timeouts in seconds used by this client.
+            DEFAULT_CACHE_TTL (float): Seconds a cached response of the engine stays fresh.
+            cache (ResponseCache | None): On-disk response cache, None to disable caching.
+            cache_ttl (float): Seconds a cached response stays fresh for this client.
+            refresh_cache (bool): Ignore cached responses but store the fresh ones.
+            minimal (bool): Ask the API to return only the fields the client consumes.
+            extra_fields (list[str]): Fields requested in addition to the minimal ones.
+            host_fields (bool): Also request the fields of host records in minimal mode.
+            stream_pages (bool): Decode page responses while they are received.
+            metrics (EngineMetrics): Counters and histograms of the engine's fetch pipeline.
+    """
+
+    DEFAULT_CONCURRENCY = 1
+    DEFAULT_RATE_LIMIT = None
+    THROTTLE_STATUSES = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE)
+    KEY_REJECTED_STATUSES = (HTTPStatus.UNAUTHORIZED, HTTPStatus.PAYMENT_REQUIRED)
+    DEFAULT_TIMEOUT = (10, 60)
+    DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+    def __init__(self, api_key, concurrency: int = None, rate_limit: float = None,
+                 timeout: tuple[float, float] = None, cache: ResponseCache = None, cache_ttl: float = None,
+                 refresh_cache: bool = False, minimal: bool = True, extra_fields: list[str] = None,
+                 host_fields: bool = False, stream_pages: bool = True, metrics: MetricsRegistry = None):
+        """
+             Initializes the EngineCore object.
+
+             Args:
+                 api_key (str | list[str]): API key for the client, or several keys as a list or a
+                     comma-separated string.
+                 concurrency (int): Number of pages fetched at the same time, across all keys.
+                     Defaults to the engine's DEFAULT_CONCURRENCY per key.
+                 rate_limit (float): Requests per second of each key. Defaults to the engine's DEFAULT_RATE_LIMIT.
+                 timeout (tuple[float, float]): Connect and read timeouts in seconds.
+                     Defaults to the engine's DEFAULT_TIMEOUT.
+                 cache (ResponseCache): Response cache shared by count() and page requests.
+                 cache_ttl (float): Seconds a cached response stays fresh.
+                     Defaults to the engine's DEFAULT_CACHE_TTL.
+                 refresh_cache (bool): Bypass cached responses and overwrite them with fresh ones.
+                 minimal (bool): Request only the fields needed to extract IP addresses
+                     (plus `extra_fields`) instead of the provider's full documents.
+                 extra_fields (list[str]): Additional fields to request in minimal mode.
+                 host_fields (bool): Also request the port, protocol, host name and timestamp fields
+                     in minimal mode, for `iter_hosts`.
+                 stream_pages (bool): Decode the items of page responses from the socket as they
+                     arrive instead of reading the whole body first. Pages are read whole when a
+                     cache is set, since the cache stores the body.
+                 metrics (MetricsRegistry): Registry receiving the client's metrics.
+                     Defaults to the global registry `utils.metrics.REGISTRY`.
+        """
+        self._MAX_RETRY_ATTEMPTS = 10
+        self._RESULTS_PER_PAGE = 100
+        self._TOTAL_ITEMS_KWORD = ''
+        self.BASE_URL = ''
+        self.COUNT_ENDPOINT = ''
+        self.SEARCH_ENDPOINT = ''
+        self.PARAMS = {}
+        self.HEADERS = {}
+        self._PAGE_KWORD = 'page'
+        self._QUERY_KWORD = ''
+        self._COUNT_KWORD = ''
+        self._IP_KWORD = ''
+        self._COUNT_FROM_SEARCH = False
+        self._MAX_FIRST_PAGES = 64
+        self._first_pages = {}
+        self._CREDENTIAL_PARAMS = ()
+        self._FIELDS_KWORD = ''
+        self._MINIMAL_FIELDS = []
+        self._HOST_FIELDS = []
+        self._ITEM_ROOT = ''
+        self._PAGE_CHUNK_SIZE = 64 * 1024
+        self._MAX_PAGES = None
+        self._SHARD_FACETS = []
+        self._CREDITS_PER_PAGE = 0
+        self.api_keys = split_keys(api_key)
+        self.api_key = self.api_keys[0]
+        self.concurrency = max(1, concurrency or self.DEFAULT_CONCURRENCY * len(self.api_keys))
+        self.limiter = RateLimiter(rate=rate_limit or self.DEFAULT_RATE_LIMIT,
+                                   max_concurrency=math.ceil(self.concurrency / len(self.api_keys)))
+        self._key_pool = None
+        self.timeout = timeout or self.DEFAULT_TIMEOUT
+        self.cache = cache
+        self.cache_ttl = cache_ttl or self.DEFAULT_CACHE_TTL
+        self.refresh_cache = refresh_cache
+        self.minimal = minimal
+        self.extra_fields = list(extra_fields or [])
+        self.host_fields = host_fields
+        self.stream_pages = stream_pages
+        self.metrics = (metrics or REGISTRY).get(str(self))
+        self.logger = logging.getLogger(__name__)
+
+    def get_fields(self) -> list[str]:
+        """
+        Get the fields requested from the API in minimal mode.
+
+        Returns:
+            list[str]: Minimal fields, the host record fields if enabled and the extra fields, without duplicates.
+        """
+        host_fields = self._HOST_FIELDS if self.host_fields else []
+        return list(dict.fromkeys(self._MINIMAL_FIELDS + host_fields + self.extra_fields))
+
+    def _apply_field_projection(self):
+        """
+        Add the field list to the request parameters when minimal mode is on.
+
+        Engines call it at the end of their initialization, once PARAMS is set.
+        """
+        if self.minimal and self._FIELDS_KWORD:
+            self.PARAMS[self._FIELDS_KWORD] = ','.join(self.get_fields())
+
+    def _item_projection(self) -> Callable | None:
+        """
+        Build the function trimming a result item to the fields the client consumes.
+
+        In minimal mode only the top-level part of every field of `get_fields` is kept, so
+        items are as small as if the API had honored the field list. Items that are not
+        objects (e.g. Fofa rows) are left unchanged.
+
+        Returns:
+            Callable | None: Projection of an item, None if items are kept whole.
+        """
+        fields = self.get_fields()
+        if not self.minimal or not fields:
+            return None
+        names = tuple(dict.fromkeys(field.split('.', 1)[0] for field in fields))
+        root = self._ITEM_ROOT
+
+        def project(item):
+            data = item.get(root) if root and isinstance(item, dict) else item
+            if not isinstance(data, dict):
+                return item
+            data = {name: data[name] for name in names if name in data}
+            return {root: data} if root else data
+
+        return project
+
+    def _page_parser(self) -> JsonItemParser | None:
+        """
+        Create the parser of a streamed page response.
+
+        Returns:
+            JsonItemParser | None: Parser of the page items, None if pages are read whole.
+        """
+        if not self.stream_pages or self.cache is not None:
+            return None
+        return JsonItemParser(self._TOTAL_ITEMS_KWORD, self._item_projection())
+
+    def build_request(self, url: str, params: dict = None, method: str = 'GET', **kwargs):
+        """
+        Build a request of the client's backend.
+
+        Args:
+            url (str): Request URL.
+            params (dict): Query string parameters.
+            method (str): HTTP method.
+            **kwargs: Extra request arguments (e.g. json, stream).
+
+        Returns:
+            Request with `method`, `url` and `kwargs` attributes, ready to be sent by the backend.
+        """
+        raise NotImplementedError
+
+    def _count_request(self, query: str):
+        """
+        Build the request answered with the number of items of a query.
+
+        With `_COUNT_FROM_SEARCH` enabled this is the first search page.
+
+        Args:
+            query (str): Stripped search query.
+
+        Returns:
+            Count request.
+        """
+        if self._COUNT_FROM_SEARCH:
+            return self.get_request_page_list(query, 1)[0]
+        params_copy = self.PARAMS.copy()
+        params_copy[self._QUERY_KWORD] = query
+        return self.build_request(self.COUNT_ENDPOINT, params_copy)
+
+    def _read_count(self, query: str, request, response) -> int | None:
+        """
+        Extract the number of items from the response to a count request.
+
+        The response is cached and, with `_COUNT_FROM_SEARCH`, its items are kept and reused
+        by the following search.
+
+        Args:
+            query (str): Stripped search query.
+            request: Count request.
+            response: Response to the request.
+
+        Returns:
+            int | None: Number of items matching the query, None if the request failed.
+        """
+        if response.status_code != HTTPStatus.OK:
+            self.logger.error(f'HTTP error: {response.status_code}')
+            self.logger.error(f'Error text: {response.text}')
+            return None
+        payload = response.json()
+        count = payload[self._COUNT_KWORD]
+        self._store(request, response)
+        if self._COUNT_FROM_SEARCH and payload.get(self._TOTAL_ITEMS_KWORD):
+            page_results = payload[self._TOTAL_ITEMS_KWORD]
+            project = self._item_projection()
+            if project is not None:
+                page_results = [project(item) for item in page_results]
+            self._record_page(response, page_results)
+            self._keep_first_page(query, page_results)
+        self.logger.info(f'For your query: [{query}], found [{count}]')
+        return count
+
+    def _keep_first_page(self, query: str, page_results: list):
+        """
+        Keep the first search page downloaded by count() for the next search of the query.
+
+        Args:
+            query (str): Search query.
+            page_results (list): Raw items of the first page.
+        """
+        self._first_pages.pop(query, None)
+        if len(self._first_pages) >= self._MAX_FIRST_PAGES:
+            self._first_pages.pop(next(iter(self._first_pages)))
+        self._first_pages[query] = page_results
+
+    def take_first_page(self, query: str) -> list | None:
+        """
+        Take the first search page downloaded by count() for a query, if it was kept.
+
+        The page is handed out once, the next search of the query fetches it again.
+
+        Args:
+            query (str): Search query.
+
+        Returns:
+            list | None: Raw items of the first page, None if count() did not keep it.
+        """
+        return self._first_pages.pop(query.strip(), None)
+
+    def _plan_pages(self, query: str, count: int, skip=(), limits: SearchLimits = None) -> tuple[list, list | None]:
+        """
+        Build the page requests of a query that still have to be sent.
+
+        A count over the engine's paging limit is recorded in the limits as truncated, the
+        results beyond the limit cannot be fetched.
+
+        Args:
+            query (str): Stripped search query.
+            count (int): Number of items matching the query.
+            skip: Indexes of the pages that must not be fetched.
+            limits (SearchLimits): Limits of the search.
+
+        Returns:
+            tuple[list, list | None]: Page indexes with their requests, and the items of the first
+                page if count() already downloaded it.
+        """
+        max_results = self.get_max_results()
+        if max_results is not None and count > max_results:
+            self.logger.warning(f'The query matches {count} results, the {self} API only pages through '
+                                f'the first {max_results}: {query}')
+            if limits is not None:
+                limits.cap(count, max_results)
+        indexed_requests = [(index, request) for index, request in enumerate(self.get_request_page_list(query, count))
+                            if index not in skip]
+        first_page = self.take_first_page(query)
+        if first_page is not None and indexed_requests and indexed_requests[0][0] == 0:
+            indexed_requests = indexed_requests[1:]
+        else:
+            first_page = None
+        self.logger.info(
+            f'Fetching {len(indexed_requests)} pages for query: {query} ({self.concurrency} in flight)')
+        return indexed_requests, first_page
+
+    def get_page_count(self, count: int, limits: SearchLimits = None) -> int:
+        """
+        Calculate the number of pages based on the total number of items.
+
+        Args:
+            count (int): Total number of items.
+            limits (SearchLimits): Limits of the search, at most the pages needed to reach its
+                result target are counted, as if every item was a new result.
+
+        Returns:
+            int: Number of pages.
+        """
+        pages = math.ceil(count / self._RESULTS_PER_PAGE)
+        needed = limits.pages_needed(self._RESULTS_PER_PAGE) if limits is not None else None
+        return pages if needed is None else min(pages, needed)
+
+    def get_max_results(self) -> int | None:
+        """
+        Get the number of results reachable by paging a single query.
+
+        Returns:
+            int | None: Maximum number of results, None if paging is not limited.
+        """
+        if self._MAX_PAGES is None:
+            return None
+        return self._MAX_PAGES * self._RESULTS_PER_PAGE
+
+    def _facet_request(self, query: str, facet: str):
+        """
+        Build the request answered with the most common values of a facet.
+
+        Args:
+            query (str): Search query.
+            facet (str): Facet name, one of `_SHARD_FACETS`.
+
+        Returns:
+            Facet request.
+        """
+        raise NotImplementedError
+
+    def _read_facet_counts(self, payload: dict, facet: str) -> list[tuple[str, int]]:
+        """
+        Extract the facet values from the response to a facet request.
+
+        Args:
+            payload (dict): Decoded response body.
+            facet (str): Facet name.
+
+        Returns:
+            list[tuple[str, int]]: Facet values with their number of results.
+        """
+        raise NotImplementedError
+
+    def refine_query(self, query: str, facet: str, value: str) -> str:
+        """
+        Restrict a query to one value of a facet.
+
+        Args:
+            query (str): Search query.
+            facet (str): Facet name.
+            value (str): Facet value.
+
+        Returns:
+            str: Restricted query.
+        """
+        raise NotImplementedError
+
+    def exclude_query(self, query: str, facet: str, values: list[str]) -> str:
+        """
+        Restrict a query to the results that match none of the given facet values.
+
+        Args:
+            query (str): Search query.
+            facet (str): Facet name.
+            values (list[str]): Excluded facet values.
+
+        Returns:
+            str: Restricted query.
+        """
+        raise NotImplementedError
+
+    def since_query(self, query: str, since: date) -> str | None:
+        """
+        Restrict a query to the results updated on or after a date.
+
+        Args:
+            query (str): Search query.
+            since (date): First day of the results.
+
+        Returns:
+            str | None: Restricted query, None if the engine has no time filter.
+        """
+        return None
+
+    def _cache_key(self, request) -> str:
+        """
+        Build the cache key of a request from the engine, URL and parameters without credentials.
+
+        Args:
+            request: Request.
+
+        Returns:
+            str: Cache key.
+        """
+        params = {key: value for key, value in request.kwargs.get('params', {}).items()
+                  if key not in self._CREDENTIAL_PARAMS}
+        if request.kwargs.get('json') is not None:
+            params['json'] = request.kwargs['json']
+        return make_cache_key(str(self), f'{request.method} {request.url}', params)
+
+    def _cached(self, request) -> CachedResponse | None:
+        """
+        Look up a fresh cached response to a request, unless `refresh_cache` is set.
+
+        Args:
+            request: Request.
+
+        Returns:
+            CachedResponse | None: Cached response, None on a miss.
+        """
+        if self.cache is None or self.refresh_cache:
+            return None
+        cached = self.cache.get(self._cache_key(request), self.cache_ttl)
+        if cached is None:
+            return None
+        self.logger.info(f'Using the cached response, Parameters: {request.kwargs}')
+        self.metrics.record_cache_hit()
+        return CachedResponse(cached)
+
+    def _store(self, request, response):
+        """
+        Store a validated response in the cache.
+
+        Args:
+            request: Request.
+            response: Successful response to the request.
+        """
+        if self.cache is not None and not isinstance(response, CachedResponse):
+            self.cache.set(self._cache_key(request), str(self), response.text)
+
+    @property
+    def keys(self) -> KeyPool:
+        """
+        Pool of the client's API keys, built on first use.
+
+        The first key uses the client's limiter, the other keys get their own with the same settings.
+        """
+        if self._key_pool is None:
+            keys = []
+            for index, api_key in enumerate(self.api_keys):
+                if index == 0:
+                    limiter = self.limiter
+                else:
+                    limiter = RateLimiter(rate=self.limiter.rate, max_concurrency=self.limiter.max_concurrency,
+                                          backoff_base=self.limiter.backoff_base, backoff_max=self.limiter.backoff_max)
+                params, headers = self._key_credentials(index, api_key)
+                name = f'...{api_key[-4:]}' if api_key else f'#{index + 1}'
+                keys.append(PooledKey(name, params, headers, limiter))
+            self._key_pool = KeyPool(str(self), keys)
+        return self._key_pool
+
+    def _key_credentials(self, index: int, api_key: str) -> tuple[dict, dict]:
+        """
+        Get the request parameters and headers that authenticate with one of the API keys.
+
+        Args:
+            index (int): Index of the key in `api_keys`.
+            api_key (str): API key.
+
+        Returns:
+            tuple[dict, dict]: Credential parameters and headers.
+        """
+        return {}, {}
+
+    def _apply_key(self, request, key: PooledKey):
+        """
+        Authenticate a request with a key of the pool.
+
+        Args:
+            request: Request.
+            key (PooledKey): Key to send the request with.
+        """
+        if key.params:
+            request.kwargs['params'] = {**request.kwargs.get('params', {}), **key.params}
+        if key.headers:
+            request.kwargs['headers'] = {**(request.kwargs.get('headers') or self.HEADERS), **key.headers}
+
+    def _quota_request(self):
+        """
+        Build the request answered with the remaining quota of an API key.
+
+        Returns:
+            Quota request, None if the engine has no quota endpoint.
+        """
+        return None
+
+    def _read_quota(self, payload: dict) -> float | None:
+        """
+        Extract the remaining quota from the response to a quota request.
+
+        Args:
+            payload (dict): Decoded response body.
+
+        Returns:
+            float | None: Page requests left, None if unknown.
+        """
+        return None
+
+    def _on_response(self, request, response, key: PooledKey):
+        """
+        Adapt the key's rate limiter and quota to the status and rate limit headers of a response.
+
+        Args:
+            request: Request.
+            response: Server response.
+            key (PooledKey): Key the request was sent with.
+        """
+        if response.status_code in self.THROTTLE_STATUSES:
+            key.limiter.on_throttle(response.headers)
+        elif response.status_code in self.KEY_REJECTED_STATUSES:
+            self.keys.retire(key, f'rejected with HTTP {response.status_code}')
+        elif response.status_code == HTTPStatus.OK:
+            key.limiter.on_success(response.headers)
+            if request.url == self.SEARCH_ENDPOINT:
+                self.keys.charge(key)
+
+    def _retry_delay(self, retry: int, response=None) -> float:
+        """
+        Get the delay before the next attempt of a failed request.
+
+        A throttled response already paused its key for the delay announced by the server,
+        the backoff only adds to it when it is longer.
+
+        Args:
+            retry (int): Number of the failed attempt, starting from 1.
+            response: Response of the failed attempt, None if no response was received.
+
+        Returns:
+            float: Seconds to wait, the backoff or the announced delay, whichever is longer.
+        """
+        delay = self.limiter.backoff(retry)
+        if response is not None and response.status_code in self.THROTTLE_STATUSES:
+            delay = max(delay, parse_retry_after(response.headers) or 0.0)
+        return delay
+
+    def _read_page(self, request, response, parser: JsonItemParser = None) -> list:
+        """
+        Decode the items of a successful page response.
+
+        Args:
+            request: Page request.
+            response: Response to the request with status 200.
+            parser (JsonItemParser): Parser the backend fed the streamed body to, None if
+                the body was read whole.
+
+        Returns:
+            list: Items of the page, trimmed to the requested fields in minimal mode.
+
+        Raises:
+            NullResultException: If the page holds no items.
+            ValueError: If the body is not valid JSON.
+        """
+        if parser is not None:
+            page_results, decode_seconds = parser.items, parser.seconds
+        else:
+            started = time.monotonic()
+            page_results = response.json().get(self._TOTAL_ITEMS_KWORD) or []
+            project = self._item_projection()
+            if project is not None:
+                page_results = [project(item) for item in page_results]
+            decode_seconds = time.monotonic() - started
+        if len(page_results) > 0:
+            self._store(request, response)
+            self._record_page(response, page_results, decode_seconds)
+            return page_results
+        raise NullResultException
+
+    def _record_page(self, response, page_results: list, decode_seconds: float = None):
+        """
+        Record a received result page in the metrics.
+
+        Args:
+            response: Response holding the page.
+            page_results (list): Raw items of the page.
+            decode_seconds (float): JSON decode time of the page.
+        """
+        credits = 0 if isinstance(response, CachedResponse) else self._CREDITS_PER_PAGE
+        self.metrics.record_page(len(page_results), decode_seconds, credits)
+
+    def _add_new_ip(self, seen: IPSet, ip: str) -> bool:
+        """
+        Add an address to the set of seen addresses.
+
+        Args:
+            seen (IPSet): Addresses seen so far.
+            ip (str): IP address from a search result.
+
+        Returns:
+            bool: True if the address is valid and was not seen before.
+        """
+        try:
+            return seen.add(ip)
+        except ValueError:
+            self.logger.warning(f'Skipping a malformed IP address: {ip!r}')
+            return False
+
+    def _journal_page_size(self, count: int, limits: SearchLimits = None) -> int:
+        """
+        Get the number of items behind one page index of the journal.
+
+        Args:
+            count (int): Number of items matching the query.
+            limits (SearchLimits): Limits of the search.
+
+        Returns:
+            int: Number of items per page.
+        """
+        return self._RESULTS_PER_PAGE
+
+    def _resume(self, query: str, count: int | None, journal: PageJournal | None, seen: IPSet,
+                limits: SearchLimits = None) -> tuple[dict, list[str]]:
+        """
+        Load the pages a previous run of the job has finished.
+
+        The journal is discarded if its pages were fetched with another page size, e.g.
+        by the bulk download instead of the paged search.
+
+        Args:
+            query (str): Search query.
+            count (int | None): Number of items matching the query.
+            journal (PageJournal | None): Journal of the job.
+            seen (IPSet): Set that collects the addresses.
+            limits (SearchLimits): Limits of the search, the addresses count towards its results.
+
+        Returns:
+            tuple[dict, list[str]]: Finished pages by index, and their addresses not seen before.
+        """
+        if journal is None:
+            return {}, []
+        journal.page_size = self._journal_page_size(count or 0, limits)
+        finished_pages = journal.load()
+        if finished_pages:
+            self.logger.info(f'Resuming the query: {query}, {len(finished_pages)} pages already fetched')
+        return finished_pages, self._new_ips([ip for ips in finished_pages.values() for ip in ips], seen, limits)
+
+    def _page_ips(self, index: int, page_results: list, journal: PageJournal | None, seen: IPSet,
+                  limits: SearchLimits = None) -> list[str]:
+        """
+        Extract the addresses of a page, record the page in the journal and drop known addresses.
+
+        Args:
+            index (int): Page index.
+            page_results (list): Raw items of the page.
+            journal (PageJournal | None): Journal of the job.
+            seen (IPSet): Set that collects the addresses.
+            limits (SearchLimits): Limits of the search, the addresses count towards its results.
+
+        Returns:
+            list[str]: Addresses of the page not seen before, cut to the result target.
+        """
+        ips = self.get_parsed_ip_list(page_results)
+        if journal is not None:
+            journal.record(index, ips)
+        return self._new_ips(ips, seen, limits)
+
+    def _new_ips(self, ips: list[str], seen: IPSet, limits: SearchLimits = None) -> list[str]:
+        """
+        Add addresses to the set of seen addresses until the result target is reached.
+
+        Args:
+            ips (list[str]): IP addresses.
+            seen (IPSet): Set that collects the addresses.
+            limits (SearchLimits): Limits of the search, the new addresses count towards its results.
+
+        Returns:
+            list[str]: Addresses not seen before.
+        """
+        if limits is None or limits.max_results is None:
+            new_ips = [ip for ip in ips if self._add_new_ip(seen, ip)]
+        else:
+            new_ips = []
+            room = limits.max_results - limits.results
+            for ip in ips:
+                if len(new_ips) >= room:
+                    break
+                if self._add_new_ip(seen, ip):
+                    new_ips.append(ip)
+        if limits is not None:
+            limits.results += len(new_ips)
+        return new_ips
+
+    def _finish_journal(self, journal: PageJournal | None, missing_pages: int, limits: SearchLimits = None):
+        """
+        Remove the journal of a complete job, keep it if pages are missing or a limit stopped the job.
+
+        Args:
+            journal (PageJournal | None): Journal of the job.
+            missing_pages (int): Number of pages that could not be fetched.
+            limits (SearchLimits): Limits of the job.
+        """
+        if journal is None:
+            return
+        if missing_pages:
+            self.logger.warning(f'{missing_pages} pages are missing, run the query again to fetch them')
+        elif limits is not None and limits.stopped is not None:
+            self.logger.info(f'The search stopped early ({limits.stopped}), run the query again to fetch the rest')
+        else:
+            journal.remove()
+
+    def _stop_early(self, limits: SearchLimits | None) -> bool:
+        """
+        Check the limits of a search that has pages left, and record the one that is hit.
+
+        Args:
+            limits (SearchLimits | None): Limits of the search.
+
+        Returns:
+            bool: True if the search must stop.
+        """
+        if limits is None:
+            return False
+        reason = limits.exceeded()
+        if reason is None:
+            return False
+        if limits.stop(reason):
+            self.logger.info(f'Stopping the search with pages left: {reason} reached ({limits.results} results)')
+        return True
+
+    def _next_wave(self, pending: deque, limits: SearchLimits | None) -> list:
+        """
+        Take the page requests to send next.
+
+        Without a result target all pages are sent at once. With a target only the pages
+        needed to reach it are sent, as if every item was a new result; the next wave is
+        only sent if the results of this one fall short.
+
+        Args:
+            pending (deque): Page indexes with their requests not sent yet, in page order.
+            limits (SearchLimits | None): Limits of the search.
+
+        Returns:
+            list: Page indexes with their requests.
+        """
+        needed = limits.pages_needed(self._RESULTS_PER_PAGE) if limits is not None else None
+        if needed is None or needed >= len(pending):
+            wave = list(pending)
+            pending.clear()
+            return wave
+        return [pending.popleft() for _ in range(max(1, needed))]
+
+    def get_request_page_list(self, query: str, count: int, limits: SearchLimits = None) -> list:
+        """
+        Get a list of requests for paging the results.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query.
+            limits (SearchLimits): Limits of the search, the pages beyond its result target are left out.
+
+        Returns:
+            list: List of requests for searching by pages.
+        """
+        raise NotImplementedError
+
+    def get_parsed_ip_list(self, results: str) -> list:
+        """
+        Get a list of IP addresses from the search results.
+
+        Args:
+            results: Search results.
+
+        Returns:
+            list[str]: List of IP addresses.
+        """
+        raise NotImplementedError
+
+    def get_parsed_hosts(self, results: list) -> list[HostRecord]:
+        """
+        Get host records from the search results, one per result item.
+
+        Engines override it to read the port, protocol, host name and timestamp of every
+        item; by default the records only hold the IP addresses.
+
+        Args:
+            results (list): Search results.
+
+        Returns:
+            list[HostRecord]: Host records.
+        """
+        return [HostRecord(ip, engine=str(self)) for ip in self.get_parsed_ip_list(results)]
@@ -0,0 +1,101 @@
+import logging
+import time
+from datetime import date
+
+from engine.base import BaseApiClient
+from engine.sharding import QuerySharder
+from utils.delta import DeltaStore
+from utils.exceptions import IncompleteSearchException
+from utils.ipset import ip_sort_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPIRE_AFTER = 30 * 24 * 60 * 60
+DEFAULT_OVERLAP = 24 * 60 * 60
+
+
+class DeltaResult:
+    """
+    Changes of the results of a query since its last run.
+
+    Attributes:
+        engine (str): Engine name.
+        query (str): Tracked search query.
+        search_query (str): Query sent to the engine, narrowed by a time filter on incremental runs.
+        full (bool): The run fetched the complete result set instead of the recent hosts.
+        added (list[str]): Addresses not known before the run, in numeric order.
+        removed (list[str]): Known addresses that are gone, in numeric order.
+        fetched (int): Number of addresses returned by the engine.
+    """
+
+    def __init__(self, engine: str, query: str, search_query: str, full: bool, added: list[str],
+                 removed: list[str], fetched: int):
+        self.engine = engine
+        self.query = query
+        self.search_query = search_query
+        self.full = full
+        self.added = sorted(added, key=ip_sort_key)
+        self.removed = sorted(removed, key=ip_sort_key)
+        self.fetched = fetched
+
+
+def delta_search(client: BaseApiClient, query: str, store: DeltaStore, full: bool = False,
+                 expire_after: float = DEFAULT_EXPIRE_AFTER, overlap: float = DEFAULT_OVERLAP) -> DeltaResult | None:
+    """
+    Search a query and report the addresses added and removed since its last run.
+
+    The first run of a query fetches the complete result set. The following runs narrow
+    the query with the engine's time filter (e.g. Shodan `after:`) to the hosts updated
+    since the last run, so they only cost a few pages. The engines filter by day, so the
+    narrowed window starts `overlap` seconds before the last run to not miss any host.
+
+    An incremental run cannot see that a host is gone, a known address is therefore
+    removed once the engine has not returned it for `expire_after` seconds. Full runs
+    remove every known address missing from the results.
+
+    A run missing pages, stopped by a limit or cut short by the engine's paging limit
+    (a shard that cannot be split further) would report the addresses it did not reach as
+    removed and move the window past hosts it never saw, so the state is only updated by
+    complete runs.
+
+    Args:
+        client (BaseApiClient): Engine client.
+        query (str): Search query.
+        store (DeltaStore): State of the previous runs.
+        full (bool): Fetch the complete result set even if the query was run before.
+        expire_after (float): Seconds after which an address not returned again is removed.
+        overlap (float): Seconds the incremental window reaches back before the last run.
+
+    Returns:
+        DeltaResult | None: Changes since the last run, None if the count request failed.
+
+    Raises:
+        IncompleteSearchException: If pages could not be fetched, the state is left unchanged.
+    """
+    query = query.strip()
+    engine = str(client)
+    started = time.time()
+    last_run = None if full else store.last_run(engine, query)
+    search_query = query
+    if last_run is not None:
+        narrowed = client.since_query(query, date.fromtimestamp(last_run - overlap))
+        if narrowed is None:
+            logger.warning(f'The {engine} engine has no time filter, fetching the complete results')
+        else:
+            search_query = narrowed
+    full = search_query == query
+    count = client.count(search_query)
+    if count is None:
+        return None
+    sharder = QuerySharder(client)
+    if sharder.needs_sharding(count):
+        logger.info(f'The query exceeds the {engine} paging limit, splitting it into shards')
+        servers = sharder.search(search_query, count)
+    else:
+        servers = client.search(search_query, count)
+    if not servers.complete:
+        logger.warning(f'The {engine} run of the query is incomplete ({servers.reason}), '
+                       f'keeping the state of the last run: {query}')
+        raise IncompleteSearchException(servers.reason)
+    added, removed = store.update(engine, query, servers, started, full, expire_after)
+    return DeltaResult(engine, query, search_query, full, added, removed, len(servers))
@@ -0,0 +1,255 @@
+"""
+Distributed page fetching over a shared work queue.
+
+A coordinator expands a search into one task per result page on a durable queue
+(utils.workqueue) and merges the addresses pushed back by the workers. Workers run in
+separate processes, on this machine or on others sharing the queue file, so network I/O
+and JSON decoding of the pages are spread over several cores.
+
+Start the workers, then run the search with JIXER_QUEUE set (or call distributed_search):
+    python -m engine.distributed --queue .queue/tasks.sqlite --processes 4
+
+Every worker process has its own clients and rate limits, so the request rate of an
+engine grows with the number of processes; lower it with --rate-limit if needed.
+"""
+import argparse
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections.abc import Mapping
+
+from engine.base import BaseApiClient
+from gevent.pool import Pool
+from utils.limits import MAX_RESULTS, SearchLimits, SearchResult
+from utils.workqueue import DONE, FAILED, LEASED, PENDING, PageTask, WorkQueue
+
+logger = logging.getLogger(__name__)
+
+
+def distributed_search(client: BaseApiClient, query: str, queue: WorkQueue, count: int = None,
+                       poll: float = 1.0, max_attempts: int = 3, limits: SearchLimits = None) -> SearchResult | None:
+    """
+    Search a query by queueing its pages for the workers and merging their results.
+
+    The job stays on the queue until every page is fetched: if the coordinator is stopped,
+    hits the deadline or is cancelled, or pages fail, running the same query again resumes
+    the job. Without workers the coordinator waits until the deadline of `limits`, forever
+    if there is none. With a result target only the pages needed to reach it are queued,
+    as if every item was a new result, and the addresses are cut to the target.
+
+    Args:
+        client (BaseApiClient): Client used for the count request and the page plan.
+        query (str): Search query.
+        queue (WorkQueue): Queue shared with the workers.
+        count (int): Number of items matching the query, requested from the API if omitted.
+        poll (float): Seconds between two progress checks.
+        max_attempts (int): Leases of a page before it is given up.
+        limits (SearchLimits): Result target, deadline and cancel token of the search.
+
+    Returns:
+        SearchResult | None: Deduplicated addresses of the fetched pages, flagged as incomplete
+            if pages failed or a limit stopped the wait, None if the count request failed.
+    """
+    query = query.strip()
+    limits = limits if limits is not None else SearchLimits()
+    if count is None:
+        count = client.count(query, limits)
+    if count is None:
+        return None
+    if limits.cap(count, client.get_max_results()):
+        logger.warning(f'The query matches {count} results, the {client} API only pages through '
+                       f'the first {client.get_max_results()}: {query}')
+    planned = len(client.get_request_page_list(query, count))
+    pages = len(client.get_request_page_list(query, count, limits))
+    first_page = client.take_first_page(query)
+    done = {0: [ip for ip in client.get_parsed_ip_list(first_page) if ip]} if first_page and pages else None
+    job = queue.submit(str(client), query, count, pages, done, max_attempts)
+    logger.info(f'Waiting for the workers of the queue {queue.path} '
+                f'(python -m engine.distributed --queue {queue.path})')
+    reported = None
+    while True:
+        progress = queue.progress(job)
+        if not progress[PENDING] and not progress[LEASED]:
+            break
+        reason = limits.exceeded()
+        if reason is not None and reason != MAX_RESULTS:
+            limits.stop(reason)
+            logger.warning(f'Job {job}: stopped waiting ({reason}) with {progress[DONE]} of {pages} pages done, '
+                           f'run the query again to resume it')
+            break
+        if progress != reported:
+            logger.info(f'Job {job}: {progress[DONE]} of {pages} pages done, {progress[LEASED]} being fetched')
+            reported = progress
+        wait = limits.wait_timeout()
+        time.sleep(poll if wait is None else min(poll, wait))
+    servers = SearchResult()
+    if limits.max_results is None:
+        servers.update(queue.results(job))
+    else:
+        for ip in queue.results(job):
+            if len(servers) >= limits.max_results:
+                break
+            servers.update([ip])
+        if len(servers) >= limits.max_results and pages < planned:
+            limits.stop(MAX_RESULTS)
+    limits.results = len(servers)
+    limits.missing_pages += progress[FAILED]
+    if progress[FAILED]:
+        logger.warning(f'{progress[FAILED]} pages could not be fetched, run the query again to retry them')
+    elif limits.stopped is None:
+        queue.remove(job)
+    return servers.finish(limits, count)
+
+
+class PageWorker:
+    """
+    Worker fetching the pages leased from a work queue.
+
+    A pool of greenlets leases pages, rebuilds their requests with the worker's own
+    clients, fetches them with the clients' retries and rate limits, and pushes the
+    deduplicated addresses of every page back to the queue.
+
+    Attributes:
+        queue (WorkQueue): Queue shared with the coordinator.
+        clients (Mapping): Clients by engine name, e.g. `ENGINES.lazy()`.
+        name (str): Worker name stored with its leases.
+        lease (float): Seconds a page is reserved for the worker.
+        concurrency (int): Pages fetched at the same time.
+    """
+
+    _MAX_PLANS = 8
+
+    def __init__(self, queue: WorkQueue, clients: Mapping, name: str = None, lease: float = 120,
+                 concurrency: int = 4):
+        self.queue = queue
+        self.clients = clients
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease = lease
+        self.concurrency = max(1, concurrency)
+        self.completed = 0
+        self._plans = {}
+
+    def _page_request(self, client: BaseApiClient, task: PageTask):
+        """
+        Get the request of a page, the page plans of the last queries are kept.
+
+        Args:
+            client (BaseApiClient): Client of the page's engine.
+            task (PageTask): Leased page.
+
+        Returns:
+            Page request.
+        """
+        key = (task.engine, task.query, task.count)
+        if key not in self._plans:
+            if len(self._plans) >= self._MAX_PLANS:
+                self._plans.pop(next(iter(self._plans)))
+            self._plans[key] = client.get_request_page_list(task.query, task.count)
+        return self._plans[key][task.page]
+
+    def process(self, task: PageTask) -> bool:
+        """
+        Fetch a leased page and push its addresses to the queue.
+
+        Args:
+            task (PageTask): Leased page.
+
+        Returns:
+            bool: True if the page was fetched.
+        """
+        try:
+            client = self.clients[task.engine]
+            page_results = client.fetch_page(self._page_request(client, task))
+            if not page_results:
+                self.queue.fail(task, 'the page could not be fetched')
+                return False
+            self.queue.complete(task, {ip for ip in client.get_parsed_ip_list(page_results) if ip})
+            self.completed += 1
+            return True
+        except Exception as e:
+            logger.error(f'Failed to process {task}: {e}')
+            self.queue.fail(task, str(e))
+            return False
+
+    def _work(self, idle_exit: float | None, poll: float):
+        idle_since = time.monotonic()
+        while True:
+            task = self.queue.claim(self.name, self.clients.keys(), self.lease)
+            if task is None:
+                if idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                    return
+                time.sleep(poll)
+                continue
+            self.process(task)
+            idle_since = time.monotonic()
+
+    def run(self, idle_exit: float = None, poll: float = 1.0) -> int:
+        """
+        Fetch pages until the queue stays empty for `idle_exit` seconds, forever if None.
+
+        Args:
+            idle_exit (float): Seconds without work after which the worker stops.
+            poll (float): Seconds between two checks of an empty queue.
+
+        Returns:
+            int: Number of fetched pages.
+        """
+        logger.info(f'Worker {self.name} fetching pages from {self.queue.path} ({self.concurrency} in flight)')
+        pool = Pool(self.concurrency)
+        try:
+            for _ in range(self.concurrency):
+                pool.spawn(self._work, idle_exit, poll)
+            pool.join()
+        finally:
+            pool.kill()
+        logger.info(f'Worker {self.name} stopped after {self.completed} pages')
+        return self.completed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch the pages queued by distributed searches')
+    parser.add_argument('--queue', default='.queue/tasks.sqlite', help='SQLite file of the work queue')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes to start')
+    parser.add_argument('--concurrency', type=int, default=4, help='pages fetched at the same time per process')
+    parser.add_argument('--engines', nargs='+', default=None, help='engines to fetch pages for, all if omitted')
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second per key and process')
+    parser.add_argument('--lease', type=float, default=120, help='seconds a page is reserved for a worker')
+    parser.add_argument('--idle-exit', type=float, default=None, help='stop after this many idle seconds')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    if args.processes > 1:
+        # Every process runs its own gevent hub and clients.
+        child_args = list(argv if argv is not None else sys.argv[1:]) + ['--processes', '1']
+        children = [subprocess.Popen([sys.executable, '-m', 'engine.distributed'] + child_args)
+                    for _ in range(args.processes)]
+        try:
+            return max(child.wait() for child in children)
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+            return 1
+    import dotenv
+    from engine.registry import ENGINES
+
+    dotenv.load_dotenv('.env')
+    options = {'rate_limit': args.rate_limit} if args.rate_limit else {}
+    clients = ENGINES.lazy(args.engines, **options)
+    queue = WorkQueue(args.queue)
+    try:
+        PageWorker(queue, clients, lease=args.lease, concurrency=args.concurrency).run(args.idle_exit)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import logging
+from string import Formatter
+
+from gevent.pool import Pool
+
+from engine.base import BaseApiClient
+from utils.ipset import IPSet
+from utils.limits import SearchLimits
+
+logger = logging.getLogger(__name__)
+
+
+def render_queries(templates: dict[str, str], **values) -> dict[str, str]:
+    """
+    Build the query of every engine from per-engine templates.
+
+    Templates use `str.format` placeholders, so one logical query can be written in the
+    syntax of each engine, e.g. `{'shodan': 'http.favicon.hash:{favicon}',
+    'fofa': 'icon_hash="{favicon}"'}`.
+
+    Args:
+        templates (dict[str, str]): Query template by engine name.
+        **values: Values substituted into the templates.
+
+    Returns:
+        dict[str, str]: Query by engine name.
+    """
+    return {name: template.format(**values) for name, template in templates.items()}
+
+
+def template_fields(templates: dict[str, str]) -> list[str]:
+    """
+    Get the names of the placeholders used by the query templates.
+
+    Args:
+        templates (dict[str, str]): Query template by engine name.
+
+    Returns:
+        list[str]: Placeholder names in order of first use.
+
+    Raises:
+        ValueError: If a template has unbalanced braces.
+    """
+    fields = {}
+    for template in templates.values():
+        for _, field, _, _ in Formatter().parse(template):
+            if field:
+                fields[field] = None
+    return list(fields)
+
+
+def fan_out_search(engines: dict[str, BaseApiClient], queries: dict[str, str]) -> dict[str, IPSet]:
+    """
+    Run one query per engine at the same time and collect the results of every engine.
+
+    Every engine runs in its own greenlet (and keeps its own pages in flight), so the
+    total time is about the time of the slowest engine. A failing engine is logged and
+    does not stop the others; the addresses it found before failing are left out, so the
+    results only hold what every engine returned in full. An engine that finished with
+    missing pages or over its paging limit keeps its results, with a warning.
+
+    Args:
+        engines (dict[str, BaseApiClient]): Clients by engine name.
+        queries (dict[str, str]): Query by engine name, engines without a query are skipped.
+
+    Returns:
+        dict[str, IPSet]: IP addresses found by each engine that did not fail.
+    """
+    found = {}
+
+    def run(name: str):
+        engine = engines[name]
+        query = queries[name]
+        logger.info(f'Running the {engine} engine with the query: {query}')
+        servers = IPSet()
+        limits = SearchLimits()
+        try:
+            for _ in engine.iter_ips(query, seen=servers, limits=limits):
+                pass
+        except Exception as e:
+            logger.error(f'The {engine} engine failed, its {len(servers)} servers are left out: {str(e)}')
+            return
+        if not limits.complete:
+            logger.warning(f'The {engine} engine returned incomplete results: {limits.missing_pages} pages '
+                           f'could not be fetched and {limits.truncated} results are beyond its paging limit')
+        logger.info(f'The {engine} engine found {len(servers)} servers')
+        found[name] = servers
+
+    names = [name for name, query in queries.items() if query and name in engines]
+    if names:
+        pool = Pool(len(names))
+        pool.map(run, names)
+    return found
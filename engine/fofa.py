@@ -1,14 +1,16 @@
+from datetime import date
 from urllib.parse import urljoin
 
-import grequests
-
-from engine.base import BaseApiClient
+from engine.core import EngineCore
 from utils.helper import query_to_bs64
+from utils.hosts import HostRecord, first_hostname, parse_port
+from utils.keypool import split_keys
+from utils.limits import SearchLimits
 
 
-class FofaClient(BaseApiClient):
+class FofaEngine(EngineCore):
     """
-    Client for working with the Fofa API.
+    Logic of the Fofa API, shared by the gevent and the asyncio clients.
 
     Attributes:
         BASE_URL (str): Base URL for Fofa API requests.
@@ -18,30 +20,56 @@ class FofaClient(BaseApiClient):
         _QUERY_KWORD (str): Key to pass the search query in Base64 encoding.
         _RESULTS_PER_PAGE (int): Number of results per page.
         _TOTAL_ITEMS_KWORD (str): Key to retrieve the total number of items in the API response.
+        _COUNT_FROM_SEARCH (bool): The count is read from the first search page, which is reused.
+        _DEFAULT_FIELDS (list[str]): Fields returned by the API when no field list is passed.
+        _FIELDS_KWORD (str): Key to pass the list of returned fields.
+        _MINIMAL_FIELDS (list[str]): Fields needed to extract IP addresses.
+        _HOST_FIELDS (list[str]): Fields needed to build host records.
         PARAMS (dict): API request parameters.
+        STATS_ENDPOINT (str): Endpoint for aggregations by field.
+        QUOTA_ENDPOINT (str): Endpoint reporting the API queries left on an account.
+        emails (list[str]): Email address of every API key.
+        _MAX_PAGES (int): Deepest page served by the API.
+        _SHARD_FACETS (list[str]): Fields used to split large queries.
     """
 
-    def __init__(self, api_key: str, email: str):
+    DEFAULT_CONCURRENCY = 4
+
+    def __init__(self, api_key: str, email: str, base_url: str = None, **kwargs):
         """
-        Initializes the FofaClient object.
+        Initializes the FofaEngine object.
 
         Args:
-            api_key (str): Client's API key.
-            email (str): Client's email address.
+            api_key (str | list[str]): Client's API key, or several keys to spread the requests across.
+            email (str | list[str]): Client's email address, or the address of every key in the same order.
+            base_url (str): Base URL of the API, e.g. of a local mock server.
+            **kwargs: Options passed to the client backend (e.g. concurrency).
         """
-        super().__init__(api_key)
-        self.BASE_URL = 'https://fofa.info/api/v1/'
+        super().__init__(api_key, **kwargs)
+        self.BASE_URL = base_url or 'https://fofa.info/api/v1/'
         self.COUNT_ENDPOINT = urljoin(self.BASE_URL, 'search/all')
         self.SEARCH_ENDPOINT = urljoin(self.BASE_URL, 'search/all')
+        self.STATS_ENDPOINT = urljoin(self.BASE_URL, 'search/stats')
+        self.QUOTA_ENDPOINT = urljoin(self.BASE_URL, 'info/my')
+        self.emails = split_keys(email)
         self._COUNT_KWORD = 'size'
         self._QUERY_KWORD = 'qbase64'
         self._RESULTS_PER_PAGE = 1000
         self._TOTAL_ITEMS_KWORD = 'results'
+        self._COUNT_FROM_SEARCH = True
+        self._CREDENTIAL_PARAMS = ('email', 'key')
         self.PARAMS = {
-            'email': email,
+            'email': self.emails[0],
             'key': self.api_key,
             'size': self._RESULTS_PER_PAGE
         }
+        self._DEFAULT_FIELDS = ['host', 'ip', 'port']
+        self._FIELDS_KWORD = 'fields'
+        self._MINIMAL_FIELDS = ['ip']
+        self._HOST_FIELDS = ['port', 'protocol', 'host', 'lastupdatetime']
+        self._apply_field_projection()
+        self._MAX_PAGES = 2500
+        self._SHARD_FACETS = ['country', 'port', 'asn']
 
     def get_parsed_ip_list(self, results: list) -> list:
         """
@@ -53,42 +81,121 @@ class FofaClient(BaseApiClient):
         Returns:
             set[str]: Set of IP addresses.
         """
-        return set([_[1] for _ in results])
+        fields = self.get_fields() if self.minimal else self._DEFAULT_FIELDS
+        if len(fields) == 1:
+            # With a single field every result is a bare value instead of a row.
+            return set([_[0] if isinstance(_, list) else _ for _ in results])
+        ip_index = fields.index('ip')
+        return set([_[ip_index] for _ in results])
+
+    def get_parsed_hosts(self, results: list) -> list[HostRecord]:
+        """
+        Build a host record from every row of the query results.
+
+        Rows hold the requested fields in request order, fields that were not requested
+        are left empty in the records.
 
-    def count(self, query: str) -> int:
+        Args:
+            results (list): Query results.
+
+        Returns:
+            list[HostRecord]: Host records.
         """
-        Get the number of items matching the query.
+        fields = self.get_fields() if self.minimal else self._DEFAULT_FIELDS
+        columns = {name: index for index, name in enumerate(fields)}
+
+        def value(row: list, name: str):
+            index = columns.get(name)
+            return row[index] if index is not None and index < len(row) else None
+
+        hosts = []
+        for _ in results:
+            row = _ if isinstance(_, list) else [_]
+            ip = value(row, 'ip')
+            hosts.append(HostRecord(ip, parse_port(value(row, 'port')), value(row, 'protocol') or None,
+                                    first_hostname(value(row, 'host'), ip), 'fofa', value(row, 'lastupdatetime')))
+        return hosts
+
+    def _count_request(self, query: str):
+        """
+        Build the count request, with the query in Base64 encoding.
 
         Args:
-            query (str): Search query.
+            query (str): Stripped search query.
 
         Returns:
-            int: Number of items matching the query.
+            Count request.
         """
-        query_b64 = query_to_bs64(query)
-        return super().count(query_b64)
+        if self._COUNT_FROM_SEARCH:
+            return super()._count_request(query)
+        return super()._count_request(query_to_bs64(query))
 
-    def get_request_page_list(self, query: str, count: int) -> list:
+    def get_request_page_list(self, query: str, count: int, limits: SearchLimits = None) -> list:
         """
         Get a list of requests for paging the results.
 
         Args:
             query (str): Search query.
             count (int): Number of items matching the query.
+            limits (SearchLimits): Limits of the search, the pages beyond its result target are left out.
 
         Returns:
-            list[grequests.Request]: List of requests for searching by pages.
+            list: List of requests for searching by pages.
         """
         request_list = []
         if count > 0:
-            pages = min(self.get_page_count(count), 2500)
+            pages = min(self.get_page_count(count, limits), self._MAX_PAGES)
             params = self.PARAMS.copy()
             params[self._QUERY_KWORD] = query_to_bs64(query)
             for page in range(1, pages + 1):
                 params = params.copy()
                 params.update({self._PAGE_KWORD: page})
-                request_list.append(grequests.get(self.SEARCH_ENDPOINT, params=params, headers=self.HEADERS))
+                request_list.append(self.build_request(self.SEARCH_ENDPOINT, params))
         return request_list
 
+    def _facet_request(self, query: str, facet: str):
+        """
+        Build a stats endpoint request for the most common values of a field.
+
+        Args:
+            query (str): Search query.
+            facet (str): Field name.
+
+        Returns:
+            Facet request.
+        """
+        params = {
+            'email': self.PARAMS['email'],
+            'key': self.api_key,
+            self._QUERY_KWORD: query_to_bs64(query),
+            'fields': facet,
+        }
+        return self.build_request(self.STATS_ENDPOINT, params)
+
+    def _read_facet_counts(self, payload: dict, facet: str) -> list[tuple[str, int]]:
+        if payload.get('error'):
+            return []
+        return [(str(_.get('code') or _.get('name')), _['count']) for _ in payload.get('aggs', {}).get(facet) or []]
+
+    def _key_credentials(self, index: int, api_key: str) -> tuple[dict, dict]:
+        return {'email': self.emails[min(index, len(self.emails) - 1)], 'key': api_key}, {}
+
+    def _quota_request(self):
+        return self.build_request(self.QUOTA_ENDPOINT)
+
+    def _read_quota(self, payload: dict) -> float | None:
+        if payload.get('error'):
+            return 0
+        return payload.get('remain_api_query')
+
+    def refine_query(self, query: str, facet: str, value: str) -> str:
+        return f'({query}) && {facet}="{value}"'
+
+    def exclude_query(self, query: str, facet: str, values: list[str]) -> str:
+        return ' && '.join([f'({query})'] + [f'{facet}!="{value}"' for value in values])
+
+    def since_query(self, query: str, since: date) -> str:
+        return f'({query}) && after="{since:%Y-%m-%d}"'
+
     def __str__(self):
         return 'fofa'
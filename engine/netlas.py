@@ -1,13 +1,14 @@
+from datetime import date
 from urllib.parse import urljoin
 
-import grequests
+from engine.core import EngineCore
+from utils.hosts import HostRecord, first_hostname, parse_port
+from utils.limits import SearchLimits
 
-from engine.base import BaseApiClient
 
-
-class NetlasClient(BaseApiClient):
+class NetlasEngine(EngineCore):
     """
-    Client for working with the Netlas API.
+    Logic of the Netlas API, shared by the gevent and the asyncio clients.
 
     Attributes:
         BASE_URL (str): Base URL for Netlas API requests.
@@ -20,23 +21,42 @@ class NetlasClient(BaseApiClient):
         _QUERY_KWORD (str): Key to pass the search query.
         _RESULTS_PER_PAGE (int): Number of results per page.
         _TOTAL_ITEMS_KWORD (str): Key to retrieve the total number of items in the API response.
+        _FIELDS_KWORD (str): Key to pass the list of returned fields.
+        _MINIMAL_FIELDS (list[str]): Fields needed to extract IP addresses.
+        _HOST_FIELDS (list[str]): Fields needed to build host records.
+        _ITEM_ROOT (str): Key of the object holding the fields of an item.
+        DOWNLOAD_ENDPOINT (str): Endpoint for bulk downloads.
+        _BULK_THRESHOLD (int): Number of results from which the bulk download is used.
+        _BULK_BATCH_SIZE (int): Number of downloaded items grouped into one page.
+        _BULK_CHUNK_SIZE (int): Size of the chunks read from the download stream.
+        bulk (bool): Use the bulk download for large result sets.
     """
 
-    def __init__(self, api_key):
+    DEFAULT_CONCURRENCY = 4
+
+    def __init__(self, api_key, bulk: bool = True, bulk_threshold: int = None, base_url: str = None, **kwargs):
         """
-        Initializes the NetlasClient object.
+        Initializes the NetlasEngine object.
 
         Args:
-            api_key (str): Client's API key.
+            api_key (str | list[str]): Client's API key, or several keys to spread the requests across.
+            bulk (bool): Download large result sets in one stream instead of 20-item pages.
+            bulk_threshold (int): Number of results from which the bulk download is used.
+            base_url (str): Base URL of the API, e.g. of a local mock server.
+            **kwargs: Options passed to the client backend (e.g. concurrency).
         """
-        super().__init__(api_key)
-        self.BASE_URL = 'https://app.netlas.io/api/'
+        super().__init__(api_key, **kwargs)
+        self.BASE_URL = base_url or 'https://app.netlas.io/api/'
         self.COUNT_ENDPOINT = urljoin(self.BASE_URL, 'responses_count')
         self.SEARCH_ENDPOINT = urljoin(self.BASE_URL, 'responses')
+        self.DOWNLOAD_ENDPOINT = urljoin(self.BASE_URL, 'responses/download/')
+        self._BULK_THRESHOLD = bulk_threshold or 2000
+        self._BULK_BATCH_SIZE = 1000
+        self._BULK_CHUNK_SIZE = 64 * 1024
+        self.bulk = bulk
         self.HEADERS['X-API-Key'] = self.api_key
         self.PARAMS = {
             'source_type': 'include',
-            'fields': 'ip',
         }
         self._IP_KWORD = 'ip'
         self._COUNT_KWORD = 'count'
@@ -44,29 +64,87 @@ class NetlasClient(BaseApiClient):
         self._QUERY_KWORD = 'q'
         self._RESULTS_PER_PAGE = 20
         self._TOTAL_ITEMS_KWORD = 'items'
+        self._FIELDS_KWORD = 'fields'
+        self._MINIMAL_FIELDS = ['ip']
+        self._HOST_FIELDS = ['port', 'protocol', 'host', 'last_updated', '@timestamp']
+        self._ITEM_ROOT = 'data'
+        self._apply_field_projection()
 
-    def get_request_page_list(self, query: str, count: int):
+    def get_request_page_list(self, query: str, count: int, limits: SearchLimits = None):
         """
         Get a list of requests for paging the results.
 
         Args:
             query (str): Search query.
             count (int): Number of items matching the query.
+            limits (SearchLimits): Limits of the search, the pages beyond its result target are left out.
 
         Returns:
-            list[grequests.Request]: List of requests for searching by pages.
+            list: List of requests for searching by pages.
         """
         request_list = []
         if count > 0:
-            pages = self.get_page_count(count)
+            pages = self.get_page_count(count, limits)
             params = self.PARAMS.copy()
             params[self._QUERY_KWORD] = query
             for page in range(pages):
                 params = params.copy()
                 params.update({self._PAGE_KWORD: page * self._RESULTS_PER_PAGE})
-                request_list.append(grequests.get(self.SEARCH_ENDPOINT, params=params, headers=self.HEADERS))
+                request_list.append(self.build_request(self.SEARCH_ENDPOINT, params))
         return request_list
 
+    def _use_bulk(self, count: int) -> bool:
+        """
+        Tell whether the results of a query are fetched with the bulk download.
+
+        Args:
+            count (int): Number of items matching the query.
+
+        Returns:
+            bool: True if the bulk download is enabled and the count reaches its threshold.
+        """
+        return self.bulk and count >= self._BULK_THRESHOLD
+
+    def _target(self, count: int, limits: SearchLimits = None) -> int:
+        """
+        Get the number of items to fetch for a query.
+
+        Args:
+            count (int): Number of items matching the query.
+            limits (SearchLimits): Limits of the search.
+
+        Returns:
+            int: The count, cut to the result target of the limits.
+        """
+        return count if limits is None or limits.max_results is None else min(count, limits.max_results)
+
+    def _journal_page_size(self, count: int, limits: SearchLimits = None) -> int:
+        if self._use_bulk(self._target(count, limits)):
+            return self._BULK_BATCH_SIZE
+        return self._RESULTS_PER_PAGE
+
+    def _bulk_request(self, query: str, count: int):
+        """
+        Build the streamed bulk download request of a query.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items to download.
+
+        Returns:
+            Bulk download request.
+        """
+        body = {
+            'q': query,
+            'size': count,
+            'type': 'json',
+            'indices': '',
+            'source_type': self.PARAMS['source_type'],
+        }
+        if self.minimal:
+            body['fields'] = self.get_fields()
+        return self.build_request(self.DOWNLOAD_ENDPOINT, method='POST', json=body, stream=True)
+
     def get_parsed_ip_list(self, results) -> set:
         """
         Extract IP addresses from the query results.
@@ -79,5 +157,29 @@ class NetlasClient(BaseApiClient):
         """
         return set([_.get('data').get('ip') for _ in results])
 
+    def get_parsed_hosts(self, results: list) -> list[HostRecord]:
+        """
+        Build a host record from every response of the query results.
+
+        Args:
+            results (list): Query results.
+
+        Returns:
+            list[HostRecord]: Host records.
+        """
+        hosts = []
+        for _ in results:
+            data = _.get('data')
+            hosts.append(HostRecord(data.get('ip'), parse_port(data.get('port')), data.get('protocol'),
+                                    first_hostname(data.get('host'), data.get('ip')), 'netlas',
+                                    data.get('last_updated') or data.get('@timestamp')))
+        return hosts
+
+    def _key_credentials(self, index: int, api_key: str) -> tuple[dict, dict]:
+        return {}, {'X-API-Key': api_key}
+
+    def since_query(self, query: str, since: date) -> str:
+        return f'({query}) AND last_updated:[{since:%Y-%m-%d} TO *]'
+
     def __str__(self):
         return 'netlas'
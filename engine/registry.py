@@ -0,0 +1,238 @@
+"""
+Registry of the search engines, imported on first use.
+
+Engines are registered by name with the import path of their client classes, one per
+backend ('gevent' or 'asyncio'). Nothing is imported until a client of the engine is
+created, so the CLI does not pay for gevent, requests or aiohttp at startup, and gevent
+is not imported at all unless a gevent client is used.
+
+Third-party packages can add engines through entry points, e.g. in pyproject.toml:
+
+    [project.entry-points."jixer.engines"]
+    censys = "jixer_censys.client:CensysClient"
+
+    [project.entry-points."jixer.async_engines"]
+    censys = "jixer_censys.aio:AsyncCensysClient"
+
+Their API key is read from the `<NAME>_API_KEY` environment variable.
+"""
+import importlib
+import logging
+import os
+from collections.abc import Iterator, Mapping
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('gevent', 'asyncio')
+ENTRY_POINT_GROUPS = {'gevent': 'jixer.engines', 'asyncio': 'jixer.async_engines'}
+
+
+def import_object(path: str):
+    """
+    Import an object from its 'module:attribute' path.
+
+    Args:
+        path (str): Import path, e.g. 'engine.clients:ShodanClient'.
+
+    Returns:
+        The imported object.
+    """
+    module_name, _, attribute = path.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class EngineSpec:
+    """
+    Registered engine.
+
+    Attributes:
+        name (str): Engine name.
+        clients (dict[str, str]): Import path of the client class by backend.
+        settings (dict[str, str]): Environment variable read for each client argument.
+    """
+
+    def __init__(self, name: str, clients: dict[str, str], settings: dict[str, str] = None):
+        self.name = name
+        self.clients = clients
+        self.settings = settings or {'api_key': f'{name.upper()}_API_KEY'}
+
+    def client_class(self, backend: str = 'gevent') -> type:
+        """
+        Import the client class of a backend.
+
+        Args:
+            backend (str): 'gevent' or 'asyncio'.
+
+        Returns:
+            type: Client class.
+
+        Raises:
+            KeyError: If the engine has no client for the backend.
+        """
+        if backend not in self.clients:
+            raise KeyError(f'The {self.name} engine has no {backend} client')
+        return import_object(self.clients[backend])
+
+    def read_settings(self) -> dict:
+        """
+        Read the client arguments from the environment.
+
+        Returns:
+            dict: Client arguments.
+        """
+        return {argument: os.environ.get(variable) for argument, variable in self.settings.items()}
+
+
+class EngineRegistry:
+    """
+    Engines by name, with the third-party engines declared through entry points.
+
+    Entry points are only read, not imported, when the engine names are first needed.
+    """
+
+    def __init__(self):
+        self._specs = {}
+        self._entry_points_loaded = False
+
+    def register(self, name: str, client: str = None, async_client: str = None, settings: dict[str, str] = None):
+        """
+        Register an engine, or add a backend to a registered one.
+
+        Args:
+            name (str): Engine name.
+            client (str): Import path of the gevent client class.
+            async_client (str): Import path of the asyncio client class.
+            settings (dict[str, str]): Environment variable read for each client argument,
+                defaults to `api_key` from `<NAME>_API_KEY`.
+        """
+        spec = self._specs.get(name)
+        if spec is None:
+            spec = self._specs[name] = EngineSpec(name, {}, settings)
+        elif settings:
+            spec.settings = settings
+        if client:
+            spec.clients['gevent'] = client
+        if async_client:
+            spec.clients['asyncio'] = async_client
+
+    def _load_entry_points(self):
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        from importlib.metadata import entry_points
+        for backend, group in ENTRY_POINT_GROUPS.items():
+            for entry_point in entry_points(group=group):
+                spec = self._specs.get(entry_point.name)
+                if spec is not None and backend in spec.clients:
+                    logger.warning(f'Ignoring the entry point of the already registered engine: {entry_point.name}')
+                    continue
+                if backend == 'gevent':
+                    self.register(entry_point.name, client=entry_point.value)
+                else:
+                    self.register(entry_point.name, async_client=entry_point.value)
+
+    def names(self, backend: str = None) -> list[str]:
+        """
+        Get the names of the registered engines.
+
+        Args:
+            backend (str): Only the engines with a client for this backend, all if omitted.
+
+        Returns:
+            list[str]: Engine names in registration order.
+        """
+        self._load_entry_points()
+        return [name for name, spec in self._specs.items() if backend is None or backend in spec.clients]
+
+    def spec(self, name: str) -> EngineSpec:
+        """
+        Get a registered engine.
+
+        Args:
+            name (str): Engine name.
+
+        Returns:
+            EngineSpec: Registered engine.
+
+        Raises:
+            KeyError: If no engine has this name.
+        """
+        self._load_entry_points()
+        if name not in self._specs:
+            raise KeyError(f'Unknown engine "{name}", expected one of {", ".join(self._specs)}')
+        return self._specs[name]
+
+    def create(self, name: str, backend: str = 'gevent', **kwargs):
+        """
+        Import the client class of an engine and create a client.
+
+        Args:
+            name (str): Engine name.
+            backend (str): 'gevent' or 'asyncio'.
+            **kwargs: Client options (e.g. cache), they override the settings read from the environment.
+
+        Returns:
+            Engine client.
+        """
+        spec = self.spec(name)
+        return spec.client_class(backend)(**{**spec.read_settings(), **kwargs})
+
+    def lazy(self, names: list[str] = None, backend: str = 'gevent', **kwargs) -> 'LazyEngines':
+        """
+        Get clients that are created on first access.
+
+        Args:
+            names (list[str]): Engine names, all engines of the backend if omitted.
+            backend (str): 'gevent' or 'asyncio'.
+            **kwargs: Options passed to every client.
+
+        Returns:
+            LazyEngines: Clients by engine name.
+        """
+        return LazyEngines(self, names if names is not None else self.names(backend), backend, kwargs)
+
+
+class LazyEngines(Mapping):
+    """
+    Read-only mapping of clients by engine name; a client is created when it is first accessed.
+    """
+
+    def __init__(self, registry: EngineRegistry, names: list[str], backend: str, options: dict):
+        self._registry = registry
+        self._names = list(names)
+        self._backend = backend
+        self._options = options
+        self._clients = {}
+
+    def __getitem__(self, name: str):
+        if name not in self._names:
+            raise KeyError(name)
+        if name not in self._clients:
+            self._clients[name] = self._registry.create(name, self._backend, **self._options)
+        return self._clients[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def created(self) -> dict:
+        """
+        Get the clients created so far.
+
+        Returns:
+            dict: Clients by engine name.
+        """
+        return dict(self._clients)
+
+
+ENGINES = EngineRegistry()
+ENGINES.register('shodan', 'engine.clients:ShodanClient', 'engine.aio:AsyncShodanClient',
+                 {'api_key': 'SHODAN_API_KEY'})
+ENGINES.register('netlas', 'engine.clients:NetlasClient', 'engine.aio:AsyncNetlasClient',
+                 {'api_key': 'NETLAS_API_KEY'})
+ENGINES.register('fofa', 'engine.clients:FofaClient', 'engine.aio:AsyncFofaClient',
+                 {'api_key': 'FOFA_API_KEY', 'email': 'FOFA_EMAIL'})
+ENGINES.register('zoomeye', 'engine.clients:ZoomeyeClient', 'engine.aio:AsyncZoomeyeClient',
+                 {'api_key': 'ZOOMEYE_API_KEY'})
@@ -0,0 +1,154 @@
+import logging
+from collections.abc import Iterator
+
+from gevent.pool import Pool
+
+from engine.base import BaseApiClient
+from utils.hosts import HostRecord
+from utils.limits import MAX_RESULTS, SearchLimits, SearchResult
+
+logger = logging.getLogger(__name__)
+
+
+class QuerySharder:
+    """
+    Split queries that exceed an engine's pagination limit into disjoint sub-queries.
+
+    A query with more results than the engine can page through is split by the values
+    of its first shard facet (country, port, ASN, ...) as reported by the engine's
+    facet/stats endpoint, plus one residual query excluding all those values. A shard
+    that is still too large is split again by the next facet, the residual by the same
+    facet while that keeps shrinking it. A shard that is too large once the facets run
+    out is searched up to the limit, the results beyond it are recorded as truncated.
+
+    Attributes:
+        client (BaseApiClient): Engine client.
+        max_results (int | None): Largest shard size, None if the engine has no limit.
+        concurrency (int): Number of shards searched at the same time.
+    """
+
+    def __init__(self, client: BaseApiClient, max_results: int = None, concurrency: int = 4):
+        """
+        Initializes the QuerySharder object.
+
+        Args:
+            client (BaseApiClient): Engine client.
+            max_results (int): Largest shard size, defaults to the engine's paging limit.
+            concurrency (int): Number of shards searched at the same time.
+        """
+        self.client = client
+        self.max_results = max_results or client.get_max_results()
+        self.concurrency = concurrency
+
+    def needs_sharding(self, count: int) -> bool:
+        return self.max_results is not None and count > self.max_results
+
+    def plan(self, query: str, count: int = None, limits: SearchLimits = None) -> list[tuple[str, int]]:
+        """
+        Split a query into shards that fit under the limit.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            limits (SearchLimits): Limits of the search, they record the results of the shards
+                that could not be split under the limit as truncated.
+
+        Returns:
+            list[tuple[str, int]]: Shard queries with the number of results to fetch.
+        """
+        if count is None:
+            count = self.client.count(query) or 0
+        shards = self._split(query, count, list(self.client._SHARD_FACETS), limits)
+        logger.info(f'The query: {query} was split into {len(shards)} shards')
+        return shards
+
+    def _split(self, query: str, count: int, facets: list[str], limits: SearchLimits = None) -> list[tuple[str, int]]:
+        if not self.needs_sharding(count):
+            return [(query, count)] if count else []
+        if not facets:
+            logger.warning(f'Cannot split the query: {query} any further, '
+                           f'only {self.max_results} of {count} results will be fetched')
+            if limits is not None:
+                limits.cap(count, self.max_results)
+            return [(query, self.max_results)]
+        facet, next_facets = facets[0], facets[1:]
+        buckets = self.client.get_facet_counts(query, facet)
+        if not buckets:
+            return self._split(query, count, next_facets, limits)
+        shards = []
+        for value, bucket_count in buckets:
+            shards.extend(self._split(self.client.refine_query(query, facet, value), bucket_count, next_facets, limits))
+        if sum(bucket_count for _, bucket_count in buckets) < count:
+            residual = self.client.exclude_query(query, facet, [value for value, _ in buckets])
+            residual_count = self.client.count(residual) or 0
+            # The facet endpoints only return the top values, so the residual is split by the
+            # same facet again as long as that keeps shrinking it.
+            residual_facets = facets if residual_count < count else next_facets
+            shards.extend(self._split(residual, residual_count, residual_facets, limits))
+        return shards
+
+    def search(self, query: str, count: int = None, limits: SearchLimits = None) -> SearchResult:
+        """
+        Search all shards of a query in parallel and merge their results.
+
+        Every shard runs with its own limits, sharing the deadline and cancel token of the
+        search, and they are merged into the limits of the search when the shard ends. A
+        shard gets the part of the result target left when it starts; shards running at the
+        same time may overshoot the target, the merged results are cut to it.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            limits (SearchLimits): Limits of the whole query, e.g. a result target.
+
+        Returns:
+            SearchResult: Deduplicated IP addresses of all shards, incomplete if pages of a
+                shard could not be fetched, a shard could not be split under the limit or a
+                limit stopped the search.
+        """
+        limits = limits if limits is not None else SearchLimits()
+        servers = SearchResult()
+
+        def run(shard: tuple[str, int]):
+            reason = limits.stopped or limits.exceeded()
+            if reason is not None:
+                limits.stop(reason)
+                return
+            shard_query, shard_count = shard
+            max_results = None if limits.max_results is None else limits.max_results - limits.results
+            shard_limits = SearchLimits(max_results, deadline=limits.deadline, cancel=limits.cancel)
+            try:
+                for _ in self.client.iter_ips(shard_query, shard_count, seen=servers, limits=shard_limits):
+                    pass
+            finally:
+                limits.merge(shard_limits)
+
+        Pool(self.concurrency).map(run, self.plan(query, count, limits))
+        if limits.max_results is not None and len(servers) > limits.max_results:
+            servers = SearchResult(ip for ip, _ in zip(servers, range(limits.max_results)))
+            limits.results = len(servers)
+            limits.stop(MAX_RESULTS)
+        if limits.missing_pages:
+            logger.warning(f'{limits.missing_pages} pages of the shards of the query: {query} could not be fetched')
+        return servers.finish(limits, count)
+
+    def iter_hosts(self, query: str, count: int = None, limits: SearchLimits = None) -> Iterator[HostRecord]:
+        """
+        Yield the host records of all shards of a query, one shard after the other.
+
+        The shards are disjoint, so no record is yielded twice.
+
+        Args:
+            query (str): Search query.
+            count (int): Number of items matching the query, requested from the API if omitted.
+            limits (SearchLimits): Limits of the whole query, passed to one shard after the
+                other; they also count the pages that could not be fetched and the shards cut
+                short by the limit.
+
+        Yields:
+            HostRecord: Host record.
+        """
+        for shard_query, shard_count in self.plan(query, count, limits):
+            if limits is not None and limits.stopped is not None:
+                return
+            yield from self.client.iter_hosts(shard_query, shard_count, limits)
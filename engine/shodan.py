@@ -1,38 +1,63 @@
+from datetime import date
 from urllib.parse import urljoin
-import grequests
-from engine.base import BaseApiClient
+from engine.core import EngineCore
+from utils.hosts import HostRecord, first_hostname, parse_port
+from utils.limits import SearchLimits
 
 
-class ShodanClient(BaseApiClient):
+class ShodanEngine(EngineCore):
     """
-    Client for working with the Shodan API.
+    Logic of the Shodan API, shared by the gevent and the asyncio clients.
 
     Attributes:
         BASE_URL (str): Base URL for Shodan API requests.
         COUNT_ENDPOINT (str): Endpoint for counting items.
         SEARCH_ENDPOINT (str): Endpoint for search queries.
+        QUOTA_ENDPOINT (str): Endpoint reporting the query credits left on a key.
         HEADERS (dict): Headers for API requests.
         PARAMS (dict): API request parameters.
         _QUERY_KWORD (str): Key to pass the search query.
         _COUNT_KWORD (str): Key to retrieve the count in the API response.
         _TOTAL_ITEMS_KWORD (str): Key to retrieve the total number of items in the API response.
+        _FIELDS_KWORD (str): Key to pass the list of returned banner fields.
+        _MINIMAL_FIELDS (list[str]): Banner fields needed to extract IP addresses.
+        _HOST_FIELDS (list[str]): Banner fields needed to build host records.
+        _SHARD_FACETS (list[str]): Facets used to split large queries.
+        _FACET_SIZE (int): Number of facet values requested per facet.
+        _CREDITS_PER_PAGE (float): Query credits charged per search page.
     """
 
-    def __init__(self, api_key: str):
+    DEFAULT_CONCURRENCY = 1
+    DEFAULT_RATE_LIMIT = 1.0
+
+    def __init__(self, api_key: str, base_url: str = None, **kwargs):
         """
-        Initializes the ShodanClient object.
+        Initializes the ShodanEngine object.
 
         Args:
-            api_key (str): Client's API key.
+            api_key (str | list[str]): Client's API key, or several keys to spread the requests across.
+            base_url (str): Base URL of the API, e.g. of a local mock server.
+            **kwargs: Options passed to the client backend (e.g. concurrency).
         """
-        super().__init__(api_key)
+        super().__init__(api_key, **kwargs)
         self.PARAMS['key'] = self.api_key
-        self.BASE_URL = 'https://api.shodan.io/shodan/host/'
+        self._CREDENTIAL_PARAMS = ('key',)
+        self.BASE_URL = base_url or 'https://api.shodan.io/shodan/host/'
         self.COUNT_ENDPOINT = urljoin(self.BASE_URL, 'count')
         self.SEARCH_ENDPOINT = urljoin(self.BASE_URL, 'search')
+        self.QUOTA_ENDPOINT = urljoin(self.BASE_URL, '/api-info')
         self._QUERY_KWORD = 'query'
         self._COUNT_KWORD = 'total'
         self._TOTAL_ITEMS_KWORD = 'matches'
+        self._FIELDS_KWORD = 'fields'
+        self._MINIMAL_FIELDS = ['ip_str']
+        self._HOST_FIELDS = ['port', 'transport', 'hostnames', 'timestamp', '_shodan']
+        if self.minimal:
+            self.PARAMS['minify'] = 'true'
+        self._apply_field_projection()
+        self._SHARD_FACETS = ['country', 'port', 'asn']
+        self._FACET_SIZE = 100
+        self._CREDITS_PER_PAGE = 1
 
     def get_parsed_ip_list(self, results: list) -> set:
         """
@@ -46,27 +71,78 @@ class ShodanClient(BaseApiClient):
         """
         return set([_.get('ip_str') for _ in results])
 
-    def get_request_page_list(self, query: str, count: int) -> list:
+    def get_parsed_hosts(self, results: list) -> list[HostRecord]:
+        """
+        Build a host record from every banner of the query results.
+
+        Args:
+            results (list): Query results.
+
+        Returns:
+            list[HostRecord]: Host records, the protocol is the Shodan module (e.g. https) or the transport.
+        """
+        return [HostRecord(_.get('ip_str'), parse_port(_.get('port')),
+                           (_.get('_shodan') or {}).get('module') or _.get('transport'),
+                           first_hostname(_.get('hostnames'), _.get('ip_str')), 'shodan', _.get('timestamp'))
+                for _ in results]
+
+    def get_request_page_list(self, query: str, count: int, limits: SearchLimits = None) -> list:
         """
         Get a list of requests for paging the results.
 
         Args:
             query (str): Search query.
             count (int): Number of items matching the query.
+            limits (SearchLimits): Limits of the search, the pages beyond its result target are left out.
 
         Returns:
-            list[grequests.Request]: List of requests for searching by pages.
+            list: List of requests for searching by pages.
         """
         request_list = []
         if count > 0:
-            pages = self.get_page_count(count)
+            pages = self.get_page_count(count, limits)
             params = self.PARAMS.copy()
             params['query'] = query
             for page in range(1, pages + 1):
                 params = params.copy()
                 params.update({self._PAGE_KWORD: page})
-                request_list.append(grequests.get(self.SEARCH_ENDPOINT, params=params, headers=self.HEADERS))
+                request_list.append(self.build_request(self.SEARCH_ENDPOINT, params))
         return request_list
 
+    def _facet_request(self, query: str, facet: str):
+        """
+        Build a count endpoint request for the most common values of a facet.
+
+        Args:
+            query (str): Search query.
+            facet (str): Facet name.
+
+        Returns:
+            Facet request.
+        """
+        params = {'key': self.api_key, self._QUERY_KWORD: query, 'facets': f'{facet}:{self._FACET_SIZE}'}
+        return self.build_request(self.COUNT_ENDPOINT, params)
+
+    def _read_facet_counts(self, payload: dict, facet: str) -> list[tuple[str, int]]:
+        return [(str(_['value']), _['count']) for _ in payload.get('facets', {}).get(facet, [])]
+
+    def _key_credentials(self, index: int, api_key: str) -> tuple[dict, dict]:
+        return {'key': api_key}, {}
+
+    def _quota_request(self):
+        return self.build_request(self.QUOTA_ENDPOINT)
+
+    def _read_quota(self, payload: dict) -> float | None:
+        return payload.get('query_credits')
+
+    def refine_query(self, query: str, facet: str, value: str) -> str:
+        return f'{query} {facet}:"{value}"'
+
+    def exclude_query(self, query: str, facet: str, values: list[str]) -> str:
+        return ' '.join([query] + [f'-{facet}:"{value}"' for value in values])
+
+    def since_query(self, query: str, since: date) -> str:
+        return f'{query} after:{since:%d/%m/%Y}'
+
     def __str__(self) -> str:
         return 'shodan'
@@ -1,16 +1,19 @@
+from datetime import date
 from urllib.parse import urljoin
-import grequests
-from engine.base import BaseApiClient
+from engine.core import EngineCore
+from utils.hosts import HostRecord, first_hostname, parse_port
+from utils.limits import SearchLimits
 
 
-class ZoomeyeClient(BaseApiClient):
+class ZoomeyeEngine(EngineCore):
     """
-    Client for working with the ZoomEye API.
+    Logic of the ZoomEye API, shared by the gevent and the asyncio clients.
 
     Attributes:
         BASE_URL (str): Base URL for ZoomEye API requests.
         COUNT_ENDPOINT (str): Endpoint for counting items.
         SEARCH_ENDPOINT (str): Endpoint for search queries.
+        QUOTA_ENDPOINT (str): Endpoint reporting the search resources left on a key.
         HEADERS (dict): Headers for API requests.
         PARAMS (dict): API request parameters.
         _QUERY_KWORD (str): Key to pass the search query.
@@ -18,46 +21,64 @@ class ZoomeyeClient(BaseApiClient):
         _IP_KWORD (str): Key to retrieve IP addresses from the API response.
         _RESULTS_PER_PAGE (int): Maximum number of results per page.
         _TOTAL_ITEMS_KWORD (str): Key to retrieve the total number of items in the API response.
+        _COUNT_FROM_SEARCH (bool): The count is read from the first search page, which is reused.
+        _MINIMAL_FIELDS (list[str]): Fields needed to extract IP addresses.
+        _HOST_FIELDS (list[str]): Fields needed to build host records.
+        _MAX_PAGES (int): Deepest page served by the API.
+        _SHARD_FACETS (list[str]): Facets used to split large queries.
     """
 
-    def __init__(self, api_key: str):
+    DEFAULT_CONCURRENCY = 4
+
+    def __init__(self, api_key: str, base_url: str = None, **kwargs):
         """
-        Initializes the ZoomeyeClient object.
+        Initializes the ZoomeyeEngine object.
 
         Args:
-            api_key (str): ZoomEye client's API key.
+            api_key (str | list[str]): ZoomEye client's API key, or several keys to spread the requests across.
+            base_url (str): Base URL of the API, e.g. of a local mock server.
+            **kwargs: Options passed to the client backend (e.g. concurrency).
         """
-        super().__init__(api_key)
-        self.BASE_URL = 'https://api.zoomeye.org/host/'
+        super().__init__(api_key, **kwargs)
+        self.BASE_URL = base_url or 'https://api.zoomeye.org/host/'
         self.COUNT_ENDPOINT = urljoin(self.BASE_URL, 'search')
         self.SEARCH_ENDPOINT = urljoin(self.BASE_URL, 'search')
+        self.QUOTA_ENDPOINT = urljoin(self.BASE_URL, '/resources-info')
         self.HEADERS['API-KEY'] = self.api_key
         self._IP_KWORD = 'ip'
         self._COUNT_KWORD = 'total'
         self._QUERY_KWORD = 'query'
         self._RESULTS_PER_PAGE = 20
         self._TOTAL_ITEMS_KWORD = 'matches'
+        self._COUNT_FROM_SEARCH = True
+        # host/search has no field selection parameter, minimal mode does not change its requests
+        # and only trims the decoded matches to these fields.
+        self._MINIMAL_FIELDS = ['ip']
+        self._HOST_FIELDS = ['portinfo', 'protocol', 'timestamp']
+        self._MAX_PAGES = 2500
+        self._SHARD_FACETS = ['country', 'port']
 
-    def get_request_page_list(self, query: str, count: int) -> list:
+    def get_request_page_list(self, query: str, count: int, limits: SearchLimits = None) -> list:
         """
         Get a list of requests for paging the results.
 
         Args:
             query (str): Search query.
             count (int): Number of items matching the query.
+            limits (SearchLimits): Limits of the search, the pages beyond its result target are left out.
 
         Returns:
-            list[grequests.Request]: List of requests for searching by pages.
+            list: List of requests for searching by pages.
         """
         request_list = []
         if count > 0:
-            pages = min(self.get_page_count(count), 2500)
+            pages = min(self.get_page_count(count, limits), self._MAX_PAGES)
             params = self.PARAMS.copy()
             params['query'] = query
             for page in range(1, pages + 1):
                 params = params.copy()
                 params.update({self._PAGE_KWORD: page})
-                request_list.append(grequests.get(self.SEARCH_ENDPOINT, params=params, headers=self.HEADERS))
+                request_list.append(self.build_request(self.SEARCH_ENDPOINT, params))
         return request_list
 
     def get_parsed_ip_list(self, results: list) -> set:
@@ -72,5 +93,58 @@ class ZoomeyeClient(BaseApiClient):
         """
         return set([_.get('ip') for _ in results])
 
+    def get_parsed_hosts(self, results: list) -> list[HostRecord]:
+        """
+        Build a host record from every match of the query results.
+
+        Args:
+            results (list): Query results.
+
+        Returns:
+            list[HostRecord]: Host records, the protocol is the service of the port (e.g. http).
+        """
+        hosts = []
+        for _ in results:
+            portinfo = _.get('portinfo') or {}
+            protocol = portinfo.get('service') or (_.get('protocol') or {}).get('application')
+            hosts.append(HostRecord(_.get('ip'), parse_port(portinfo.get('port')), protocol,
+                                    first_hostname(portinfo.get('hostname'), _.get('ip')), 'zoomeye',
+                                    _.get('timestamp')))
+        return hosts
+
+    def _facet_request(self, query: str, facet: str):
+        """
+        Build a search endpoint request for the most common values of a facet.
+
+        Args:
+            query (str): Search query.
+            facet (str): Facet name.
+
+        Returns:
+            Facet request.
+        """
+        return self.build_request(self.SEARCH_ENDPOINT, {self._QUERY_KWORD: query, 'facets': facet})
+
+    def _read_facet_counts(self, payload: dict, facet: str) -> list[tuple[str, int]]:
+        return [(str(_['name']), _['count']) for _ in payload.get('facets', {}).get(facet, [])]
+
+    def _key_credentials(self, index: int, api_key: str) -> tuple[dict, dict]:
+        return {}, {'API-KEY': api_key}
+
+    def _quota_request(self):
+        return self.build_request(self.QUOTA_ENDPOINT)
+
+    def _read_quota(self, payload: dict) -> float | None:
+        return payload.get('resources', {}).get('search')
+
+    def refine_query(self, query: str, facet: str, value: str) -> str:
+        return f'{query} +{facet}:"{value}"'
+
+    def exclude_query(self, query: str, facet: str, values: list[str]) -> str:
+        return ' '.join([query] + [f'-{facet}:"{value}"' for value in values])
+
+    def since_query(self, query: str, since: date) -> str:
+        return f'{query} +after:"{since:%Y-%m-%d}"'
+
     def __str__(self) -> str:
         return 'zoomeye'
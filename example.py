@@ -1,19 +1,35 @@
+from jixer_CLI import init_settings
+from utils.helper import save_results
+
+
+def search_and_save(engine, query):
+    count = engine.count(query)
+    if count:
+        servers = engine.search(query, count)
+        save_results(query, servers, file_name=f'{engine}_example')
+
+
+def shodan_test(engines):
+    query = 'http.favicon.hash:2141724739 country:SN'
+    search_and_save(engines.get('shodan'), query)
+
+
 def netlas_test(engines):
-    engine_arg = '-n'
     query = 'http.favicon.hash_sha256:50836e4dd679302c8477bb1cc3667a605f16d998709ef2f68ed1fb9d2be8ea7d AND geo.country:SN'
-    engine = engines.get(engine_arg)
-    engine.search_and_save_ip_list(query)
+    search_and_save(engines.get('netlas'), query)
 
 
 def zoomeye_test(engines):
-    engine_arg = '-z'
-    engine = engines.get(engine_arg)
-    engine.count(query)
-    engine.search_and_save_ip_list(query)
+    query = 'iconhash:"2141724739" +country:"SN"'
+    search_and_save(engines.get('zoomeye'), query)
 
 
 def fofa_test(engines):
-    engine_arg = '-f'
     query = 'icon_hash="2141724739" && country="SN"'
-    engine = engines.get(engine_arg)
-    engine.search_and_save_ip_list(query)
+    search_and_save(engines.get('fofa'), query)
+
+
+if __name__ == '__main__':
+    engines = init_settings()
+    netlas_test(engines)
+    fofa_test(engines)
@@ -2,8 +2,15 @@ import logging
 import os
 import dotenv
 
-from engine import ShodanClient, NetlasClient, FofaClient, ZoomeyeClient
-from utils.helper import save_results
+from engine.registry import ENGINES
+from utils.cache import ResponseCache
+from utils.delta import DeltaStore
+from utils.exceptions import IncompleteSearchException
+from utils.helper import save_delta_results, save_host_results, save_results, save_tagged_results, stream_results
+from utils.journal import PageJournal
+from utils.knownhosts import KnownHostIndex
+from utils.metrics import REGISTRY
+from utils.workqueue import WorkQueue
 
 # Configure logging
 logging.basicConfig(
@@ -14,16 +21,46 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-# Function to initialize settings and search engines
-def init_settings():
+# Function to initialize settings and search engines, each client is created on first use
+def init_settings(host_fields=False):
     dotenv.load_dotenv('.env')
-    engines = {
-        'shodan': ShodanClient(os.environ.get('SHODAN_API_KEY')),
-        'netlas': NetlasClient(os.environ.get('NETLAS_API_KEY')),
-        'fofa': FofaClient(api_key=os.environ.get('FOFA_API_KEY'), email=os.environ.get('FOFA_EMAIL')),
-        'zoomeye': ZoomeyeClient(os.environ.get('ZOOMEYE_API_KEY')),
-    }
-    return engines
+    cache_path = os.environ.get('JIXER_CACHE')
+    cache = ResponseCache(cache_path) if cache_path else None
+    options = {'host_fields': True} if host_fields else {}
+    return ENGINES.lazy(cache=cache, **options)
+
+
+# Function to log the engine metrics and write them to JIXER_METRICS if it is set
+def report_metrics(engines):
+    for engine in engines:
+        logger.info(f"{engine} metrics: {engine.metrics.summary()}")
+    metrics_path = os.environ.get('JIXER_METRICS')
+    if metrics_path:
+        with open(metrics_path, 'w') as file:
+            file.write(REGISTRY.to_prometheus() if metrics_path.endswith('.prom') else REGISTRY.to_json(indent=2))
+
+
+# Settings that each replace the normal single-engine search, and the settings they would silently ignore
+_CONFLICTING_SETTINGS = {
+    'JIXER_DELTA': ('JIXER_HOSTS', 'JIXER_QUEUE', 'JIXER_KNOWN', 'JIXER_JOURNAL'),
+    'JIXER_HOSTS': ('JIXER_QUEUE', 'JIXER_KNOWN', 'JIXER_JOURNAL'),
+    'JIXER_QUEUE': ('JIXER_JOURNAL',),
+}
+
+
+# Function to check the JIXER_* settings, returns why they cannot be used together or None
+def check_settings():
+    for name, conflicts in _CONFLICTING_SETTINGS.items():
+        if os.environ.get(name):
+            for other in conflicts:
+                if os.environ.get(other):
+                    return f"{name} cannot be combined with {other}, unset one of them"
+    known_mode = os.environ.get('JIXER_KNOWN_MODE')
+    if known_mode and known_mode not in ('new', 'tag'):
+        return f"JIXER_KNOWN_MODE must be 'new' or 'tag', not '{known_mode}'"
+    if known_mode and not os.environ.get('JIXER_KNOWN'):
+        return "JIXER_KNOWN_MODE needs JIXER_KNOWN"
+    return None
 
 
 # Function to display the search engine selection menu
@@ -32,20 +69,107 @@ def show_engine_menu(engines):
     for key in engines.keys():
         print(f'{count}) - {key}')
         count += 1
+    print(f'{count}) - all engines at once')
 
 
-# Function to perform search and save results
-def perform_search(engine, query):
+# Function to perform search and save results, the pages are fetched by the queue's workers if a queue is given.
+# Finished pages are journaled in journal_folder if it is set, so an interrupted search can be resumed
+def perform_search(engine, query, queue=None, journal_folder=None):
+    from engine.sharding import QuerySharder
+
     count = engine.count(query)
     if count:
         logger.info(f"Running the {engine} engine with the query: {query}")
-        servers = engine.search(query, count)
+        sharder = QuerySharder(engine)
+        if sharder.needs_sharding(count):
+            logger.info(f"The query exceeds the {engine} paging limit, splitting it into shards")
+            servers = sharder.search(query, count)
+        elif queue is not None:
+            from engine.distributed import distributed_search
+
+            servers = distributed_search(engine, query, queue, count)
+        else:
+            journal = PageJournal.for_job(str(engine), query, count, journal_folder) if journal_folder else None
+            try:
+                servers = engine.search(query, count, journal=journal)
+            except KeyboardInterrupt:
+                logger.warning("Search interrupted, run the same query again to resume it")
+                raise
         if servers:
             return servers
     else:
         logger.error("Please check the correctness of the query!")
 
 
+# Function to stream the host records of a query to a file, returns the number of written records
+def perform_host_search(engine, query, file_name, format):
+    from engine.sharding import QuerySharder
+
+    count = engine.count(query)
+    if not count:
+        logger.error("Please check the correctness of the query!")
+        return None
+    logger.info(f"Running the {engine} engine with the query: {query}")
+    sharder = QuerySharder(engine)
+    if sharder.needs_sharding(count):
+        logger.info(f"The query exceeds the {engine} paging limit, splitting it into shards")
+        hosts = sharder.iter_hosts(query, count)
+    else:
+        hosts = engine.iter_hosts(query, count)
+    written = save_host_results(query, hosts, file_name=file_name, format=format)
+    if written is None:
+        logger.error("An error occurred while saving the results.")
+    else:
+        logger.info("Results have been successfully saved.")
+    return written
+
+
+# Function to run a query incrementally and return the servers added and removed since its last run
+def perform_delta_search(engine, query, store):
+    from engine.delta import delta_search
+
+    try:
+        result = delta_search(engine, query, store)
+    except IncompleteSearchException as e:
+        logger.error(f"{e}, please run the query again.")
+        return None
+    if result is None:
+        logger.error("Please check the correctness of the query!")
+        return None
+    mode = "full" if result.full else "incremental"
+    logger.info(f"{mode.capitalize()} run of the {engine} engine: {result.fetched} servers fetched, "
+                f"{len(result.added)} added, {len(result.removed)} removed")
+    return result
+
+
+# Function to run one query per engine at the same time
+def perform_fan_out(engines, queries):
+    # Create the clients first: the gevent backend must patch the process before the fan-out imports gevent
+    engines = {key: engines[key] for key, query in queries.items() if query}
+    from engine.fanout import fan_out_search
+
+    servers = fan_out_search(engines, queries)
+    if any(servers.values()):
+        return servers
+    logger.error("Nothing was found, please check the correctness of the queries!")
+
+
+# Function to fill the placeholders of the fan-out queries, e.g. {favicon}, with values entered once for all engines
+def fill_query_templates(engines, templates):
+    # Create the clients first: the gevent backend must patch the process before the fan-out imports gevent
+    engines = {key: engines[key] for key, template in templates.items() if template}
+    from engine.fanout import render_queries, template_fields
+
+    try:
+        values = {}
+        for field in template_fields(templates):
+            print(f"Enter the value of {{{field}}} for every engine")
+            values[field] = input("> ").strip()
+        return render_queries(templates, **values)
+    except (IndexError, KeyError, ValueError) as e:
+        logger.error(f"Invalid query template: {e}")
+
+
 def save_to_file(query, servers, file_name):
     if save_results(query, servers, file_name=file_name):
         logger.info("Results have been successfully saved.")
@@ -53,9 +177,54 @@ def save_to_file(query, servers, file_name):
         logger.error("An error occurred while saving the results.")
 
 
+# Save only the servers never seen before ('new'), or every server tagged as new or known ('tag').
+# The servers are recorded as known only once they are saved.
+def save_known_to_file(query, servers, engine, known, mode, file_name):
+    if mode == 'tag':
+        lines = (f'{ip}\t{"new" if new else "known"}'
+                 for ip, new in known.classify(servers, str(engine), record=False))
+    else:
+        lines = known.filter_new(servers, str(engine), record=False)
+    written = stream_results(query, lines, file_name=file_name)
+    if written is None:
+        logger.error("An error occurred while saving the results.")
+    else:
+        known.record(servers, str(engine))
+        logger.info(f"Results have been successfully saved, {written} of {len(servers)} servers "
+                    f"{'tagged' if mode == 'tag' else 'were never seen before'}.")
+
+
+def save_delta_to_file(query, result, file_name):
+    if save_delta_results(query, result.added, result.removed, file_name=file_name):
+        logger.info("Results have been successfully saved.")
+    else:
+        logger.error("An error occurred while saving the results.")
+
+
+def save_tagged_to_file(query, servers, file_name):
+    if save_tagged_results(query, servers, file_name=file_name):
+        logger.info("Results have been successfully saved.")
+    else:
+        logger.error("An error occurred while saving the results.")
+
+
 # Main function
 def main():
-    engines = init_settings()
+    dotenv.load_dotenv('.env')
+    error = check_settings()
+    if error:
+        logger.error(error)
+        return
+    hosts_format = os.environ.get('JIXER_HOSTS')
+    engines = init_settings(host_fields=bool(hosts_format))
+    delta_path = os.environ.get('JIXER_DELTA')
+    delta_store = DeltaStore(delta_path) if delta_path else None
+    queue_path = os.environ.get('JIXER_QUEUE')
+    queue = WorkQueue(queue_path) if queue_path else None
+    known_path = os.environ.get('JIXER_KNOWN')
+    known = KnownHostIndex(known_path) if known_path else None
+    known_mode = os.environ.get('JIXER_KNOWN_MODE', 'new')
+    journal_folder = os.environ.get('JIXER_JOURNAL')
 
     while True:
         try:
@@ -66,19 +235,50 @@ def main():
             if engine_key == "exit":
                 break
 
-            if engine_key.isdigit() and 0 < int(engine_key) <= len(engines):
-                engine = list(engines.values())[int(engine_key) - 1]
+            if engine_key == str(len(engines) + 1):
+                queries = {}
+                for key in engines:
+                    print(f"Enter a valid query for the {key} engine, or simply press 'Enter' to skip it. "
+                          f"Placeholders like {{favicon}} are asked once for all engines")
+                    queries[key] = input("> ").strip()
+                queries = fill_query_templates(engines, queries)
+                if queries is None:
+                    continue
+                print("Enter the filename in which you want to save the results, or simply press 'Enter'")
+                file_name = input("> ")
+                servers = perform_fan_out(engines, queries)
+                report_metrics(engines[key] for key in engines if queries[key])
+                if servers:
+                    query = '; '.join(f'{key}: {query}' for key, query in queries.items() if query)
+                    save_tagged_to_file(query, servers, file_name)
+            elif engine_key.isdigit() and 0 < int(engine_key) <= len(engines):
+                engine = engines[list(engines)[int(engine_key) - 1]]
                 print(f"Enter a valid query for the {engine} engine")
                 query = input("> ")
                 print("Enter the filename in which you want to save the results, or simply press 'Enter'")
                 file_name = input("> ")
-                servers = perform_search(engine, query)
-                if servers:
+                if delta_store is not None:
+                    result = perform_delta_search(engine, query, delta_store)
+                    report_metrics([engine])
+                    if result:
+                        save_delta_to_file(query, result, file_name)
+                    continue
+                if hosts_format:
+                    perform_host_search(engine, query, file_name, hosts_format)
+                    report_metrics([engine])
+                    continue
+                servers = perform_search(engine, query, queue, journal_folder)
+                report_metrics([engine])
+                if servers and known is not None:
+                    save_known_to_file(query, servers, engine, known, known_mode, file_name)
+                elif servers:
                     save_to_file(query, servers, file_name)
             else:
-                logger.error(f"Input error. Enter a number from 1 to {len(engines)}")
+                logger.error(f"Input error. Enter a number from 1 to {len(engines) + 1}")
         except KeyboardInterrupt:
             continue
+    if known is not None:
+        known.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,451 @@
+"""
+Non-interactive batch runner for lists of search jobs.
+
+Every non-empty line of the job file (or stdin) is one job, either a JSON object
+    {"engine": "shodan", "query": "product:nginx country:SN", "output": "nginx.txt"}
+or tab-separated values
+    shodan<TAB>product:nginx country:SN<TAB>nginx.txt
+where the output is optional. Lines starting with '#' are ignored.
+
+At most --max-jobs jobs run at the same time across all engines. This caps jobs, not
+requests: every job keeps up to its client's `concurrency` pages in flight. Jobs of the
+same engine share one client, so they also share its rate limit and in-flight cap, and
+the requests in flight never exceed the sum of the clients' `concurrency`. Results are written to one file
+per job or as JSON lines, followed by a summary report. The exit code is 0 if every job
+succeeded, 1 if a job failed and 2 if the job list is invalid.
+
+With --delta, every job only fetches the hosts updated since its last run and writes the
+IP addresses added and removed since then (see engine.delta).
+
+With --known, only the IP addresses never returned before by any job of any batch are
+written (see utils.knownhosts). The new addresses of a job are recorded as known once the
+job succeeds, so a failed job writes them again when it is resumed, and jobs running at the
+same time may both write an address they share.
+
+With --hosts, one host record per service (ip, port, protocol, hostname, engine, timestamp)
+is written to a JSON lines, CSV or SQLite file instead of the IP addresses (see utils.sinks).
+
+Example:
+    python jixer_batch.py jobs.tsv --max-jobs 4 --format jsonl --output results.jsonl
+    python jixer_batch.py jobs.tsv --hosts sqlite --output inventory.sqlite
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from jixer_CLI import init_settings
+from utils.delta import DeltaStore
+from utils.helper import stream_results
+from utils.ipset import IPSet
+from utils.journal import PageJournal
+from utils.knownhosts import KnownHostIndex
+from utils.limits import SearchLimits
+from utils.sinks import open_record_sink
+
+logger = logging.getLogger('jixer_batch')
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INVALID = 2
+
+
+class BatchJob:
+    """
+    One search job of a batch and its outcome.
+
+    Attributes:
+        engine (str): Engine name.
+        query (str): Search query.
+        output (str): Output file name of the job, generated if empty.
+        line (int): Line of the job in the job list.
+        status (str): pending, ok or failed.
+        count (int | None): Number of items reported by the engine.
+        results (int): Number of written IP addresses, the added ones in delta mode.
+        removed (int | None): Number of removed IP addresses in delta mode.
+        seconds (float): Run time of the job.
+        error (str | None): Reason of a failure.
+    """
+
+    def __init__(self, engine: str, query: str, output: str = '', line: int = 0):
+        self.engine = engine
+        self.query = query
+        self.output = output
+        self.line = line
+        self.status = 'pending'
+        self.count = None
+        self.results = 0
+        self.removed = None
+        self.seconds = 0.0
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {
+            'line': self.line,
+            'engine': self.engine,
+            'query': self.query,
+            'output': self.output,
+            'status': self.status,
+            'count': self.count,
+            'results': self.results,
+            'removed': self.removed,
+            'seconds': round(self.seconds, 3),
+            'error': self.error,
+        }
+
+
+def parse_jobs(lines, engines: list[str]) -> list[BatchJob]:
+    """
+    Parse a job list.
+
+    Args:
+        lines: Lines of the job list.
+        engines (list[str]): Known engine names.
+
+    Returns:
+        list[BatchJob]: Jobs in list order.
+
+    Raises:
+        ValueError: If a line is malformed or names an unknown engine.
+    """
+    jobs = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f'Line {number}: invalid JSON: {e}')
+            engine, query, output = entry.get('engine', ''), entry.get('query', ''), entry.get('output', '')
+        else:
+            fields = line.split('\t')
+            if len(fields) not in (2, 3):
+                raise ValueError(f'Line {number}: expected "engine<TAB>query[<TAB>output]"')
+            engine, query, output = (fields + [''])[:3]
+        engine, query, output = str(engine).strip().lower(), str(query).strip(), str(output).strip()
+        if engine not in engines:
+            raise ValueError(f'Line {number}: unknown engine "{engine}", expected one of {", ".join(engines)}')
+        if not query:
+            raise ValueError(f'Line {number}: empty query')
+        jobs.append(BatchJob(engine, query, output, number))
+    return jobs
+
+
+class FileSink:
+    """
+    Write the results of every job to its own file, one IP address per line.
+
+    In delta mode the removed IP addresses go to a second file with a `_removed` suffix.
+    """
+
+    def __init__(self, folder_name: str):
+        self.folder_name = folder_name
+
+    def write(self, job: BatchJob, ips, change: str = None) -> int:
+        file_name = job.output
+        if change == 'removed':
+            stem, extension = os.path.splitext(file_name)
+            file_name = f'{stem}_removed{extension}'
+        written = stream_results(job.query, ips, file_name=file_name, folder_name=self.folder_name)
+        if written is None:
+            raise IOError(f'Failed to write the results to {self.folder_name}/{file_name}')
+        return written
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """
+    Write the results of all jobs to one stream of JSON lines,
+    `{"engine": ..., "query": ..., "ip": ...}` per IP address.
+
+    In delta mode every line also holds `"change": "added"` or `"change": "removed"`.
+    """
+
+    def __init__(self, path: str):
+        self._file = sys.stdout if path == '-' else open(path, 'w')
+
+    def write(self, job: BatchJob, ips, change: str = None) -> int:
+        written = 0
+        fields = {'engine': job.engine, 'query': job.query}
+        if change:
+            fields['change'] = change
+        prefix = json.dumps(fields)[:-1]
+        for ip in ips:
+            self._file.write(f'{prefix}, "ip": "{ip}"}}\n')
+            written += 1
+        self._file.flush()
+        return written
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class HostSink:
+    """
+    Write the host records of all jobs to one JSON lines, CSV or SQLite file,
+    with the query of the job in every row.
+    """
+
+    def __init__(self, path: str, format: str):
+        self._sink = open_record_sink(path, format)
+
+    def write(self, job: BatchJob, hosts, change: str = None) -> int:
+        return self._sink.write(hosts, query=job.query)
+
+    def close(self):
+        self._sink.close()
+
+
+def _collect(ips, collected: IPSet):
+    for ip in ips:
+        collected.add(ip)
+        yield ip
+
+
+def run_job(job: BatchJob, client, sink, delta: DeltaStore = None, hosts: bool = False,
+            known: KnownHostIndex = None):
+    """
+    Run one job and record its outcome in the job.
+
+    Queries over the engine's paging limit are sharded. Other queries are journaled, so
+    running the same batch again resumes the pages that could not be fetched. A job
+    missing pages writes what it fetched and fails.
+
+    Args:
+        job (BatchJob): Job to run.
+        client (BaseApiClient): Client of the job's engine.
+        sink (FileSink | JsonlSink | HostSink): Destination of the results.
+        delta (DeltaStore): State of the previous runs, write only the changes since them if given.
+        hosts (bool): Write host records instead of IP addresses.
+        known (KnownHostIndex): Index of the addresses seen before, write only the new ones if given.
+    """
+    if delta is not None:
+        return run_delta_job(job, client, sink, delta)
+    if hosts:
+        return run_hosts_job(job, client, sink)
+    from engine.sharding import QuerySharder
+
+    started = time.monotonic()
+    logger.info(f'Line {job.line}: running the {job.engine} engine with the query: {job.query}')
+    try:
+        job.count = client.count(job.query)
+        if job.count is None:
+            raise RuntimeError('the count request failed, please check the correctness of the query')
+        journal = None
+        limits = SearchLimits()
+        sharder = QuerySharder(client)
+        if sharder.needs_sharding(job.count):
+            ips = iter(sharder.search(job.query, job.count, limits))
+        else:
+            journal = PageJournal.for_job(job.engine, job.query, job.count)
+            ips = client.iter_ips(job.query, job.count, journal=journal, limits=limits)
+        new_ips = IPSet()
+        if known is not None:
+            ips = _collect(known.filter_new(ips, job.engine, record=False), new_ips)
+        job.results = sink.write(job, ips)
+        if journal is not None and os.path.exists(journal.path):
+            raise RuntimeError('some pages could not be fetched, run the batch again to resume them')
+        if not limits.complete:
+            raise RuntimeError(f'{limits.missing_pages} pages could not be fetched, run the batch again')
+        if known is not None:
+            known.record(new_ips, job.engine)
+        job.status = 'ok'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        logger.error(f'Line {job.line}: the job failed: {job.error}')
+    job.seconds = time.monotonic() - started
+
+
+def run_hosts_job(job: BatchJob, client, sink: HostSink):
+    """
+    Run one job writing host records and record its outcome in the job.
+
+    Host records are not journaled, a failed job is run again from the start. A job
+    missing pages writes the records it fetched and fails.
+
+    Args:
+        job (BatchJob): Job to run.
+        client (BaseApiClient): Client of the job's engine.
+        sink (HostSink): Destination of the host records.
+    """
+    from engine.sharding import QuerySharder
+
+    started = time.monotonic()
+    logger.info(f'Line {job.line}: running the {job.engine} engine with the query: {job.query}')
+    try:
+        job.count = client.count(job.query)
+        if job.count is None:
+            raise RuntimeError('the count request failed, please check the correctness of the query')
+        limits = SearchLimits()
+        sharder = QuerySharder(client)
+        if sharder.needs_sharding(job.count):
+            hosts = sharder.iter_hosts(job.query, job.count, limits)
+        else:
+            hosts = client.iter_hosts(job.query, job.count, limits)
+        job.results = sink.write(job, hosts)
+        if not limits.complete:
+            raise RuntimeError(f'{limits.missing_pages} pages could not be fetched, run the batch again')
+        job.status = 'ok'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        logger.error(f'Line {job.line}: the job failed: {job.error}')
+    job.seconds = time.monotonic() - started
+
+
+def run_delta_job(job: BatchJob, client, sink, delta: DeltaStore):
+    """
+    Run one job incrementally and record its outcome in the job.
+
+    A run missing pages fails without writing anything and keeps the state of the last
+    run, so running the batch again fetches the same window.
+
+    Args:
+        job (BatchJob): Job to run.
+        client (BaseApiClient): Client of the job's engine.
+        sink (FileSink | JsonlSink): Destination of the added and removed IP addresses.
+        delta (DeltaStore): State of the previous runs.
+    """
+    from engine.delta import delta_search
+
+    started = time.monotonic()
+    logger.info(f'Line {job.line}: running the {job.engine} engine incrementally with the query: {job.query}')
+    try:
+        result = delta_search(client, job.query, delta)
+        if result is None:
+            raise RuntimeError('the count request failed, please check the correctness of the query')
+        job.count = result.fetched
+        job.results = sink.write(job, result.added, change='added')
+        job.removed = sink.write(job, result.removed, change='removed')
+        job.status = 'ok'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        logger.error(f'Line {job.line}: the job failed: {job.error}')
+    job.seconds = time.monotonic() - started
+
+
+def run_batch(jobs: list[BatchJob], engines: dict, sink, workers: int = 4,
+              delta: DeltaStore = None, hosts: bool = False, known: KnownHostIndex = None) -> list[BatchJob]:
+    """
+    Run jobs in a bounded pool of workers.
+
+    Args:
+        jobs (list[BatchJob]): Jobs to run.
+        engines (dict): Clients by engine name, shared by the jobs of the engine.
+        sink (FileSink | JsonlSink | HostSink): Destination of the results.
+        workers (int): Maximum number of jobs running at the same time, across all engines.
+            Each job keeps up to its client's `concurrency` pages in flight.
+        delta (DeltaStore): State of the previous runs, write only the changes since them if given.
+        hosts (bool): Write host records instead of IP addresses.
+        known (KnownHostIndex): Index of the addresses seen before, write only the new ones if given.
+
+    Returns:
+        list[BatchJob]: The jobs with their outcome.
+    """
+    # Create the clients first: the gevent backend must patch the process before gevent.pool is imported
+    engines = {name: engines[name] for name in dict.fromkeys(job.engine for job in jobs)}
+    from gevent.pool import Pool
+
+    pool = Pool(max(1, workers))
+    try:
+        pool.map(lambda job: run_job(job, engines[job.engine], sink, delta, hosts, known), jobs)
+    finally:
+        pool.kill()
+    return jobs
+
+
+def print_summary(jobs: list[BatchJob], file=sys.stderr):
+    failed = [job for job in jobs if job.status != 'ok']
+    for job in jobs:
+        line = f'{job.status:>7}  line {job.line:<4} {job.engine:<8} {job.results:>9} results  {job.seconds:8.1f}s  {job.query}'
+        if job.removed is not None:
+            line += f'  ({job.removed} removed)'
+        if job.error:
+            line += f'  ({job.error})'
+        print(line, file=file)
+    print(f'{len(jobs) - len(failed)} of {len(jobs)} jobs succeeded, '
+          f'{sum(job.results for job in jobs)} results in total', file=file)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run a list of search jobs without interaction')
+    parser.add_argument('jobs', nargs='?', default='-', help="job list file, '-' for stdin")
+    parser.add_argument('--max-jobs', '--workers', dest='workers', type=int, default=4,
+                        help='maximum number of jobs running at the same time across all engines; '
+                             'the pages in flight are capped by the concurrency of each engine client')
+    parser.add_argument('--format', choices=['files', 'jsonl'], default='files',
+                        help='one results file per job or one stream of JSON lines')
+    parser.add_argument('--output', default=None,
+                        help="results folder (files) or file (jsonl, '-' for stdout)")
+    parser.add_argument('--summary', default=None, help='write the summary report to this JSON file')
+    parser.add_argument('--delta', default=None, metavar='STATE',
+                        help='state file of the incremental runs, write only the changes since the last run')
+    parser.add_argument('--known', default=None, metavar='INDEX',
+                        help='folder of the known-host index, write only the IP addresses never seen before')
+    parser.add_argument('--hosts', choices=['jsonl', 'csv', 'sqlite'], default=None,
+                        help="write one host record per service to --output in this format instead of IP addresses")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.hosts and args.delta:
+        logger.error('--hosts cannot be combined with --delta')
+        return EXIT_INVALID
+    if args.known and (args.hosts or args.delta):
+        logger.error('--known cannot be combined with --hosts or --delta')
+        return EXIT_INVALID
+    if args.hosts and args.hosts != 'jsonl' and not args.output:
+        logger.error(f'--hosts {args.hosts} needs an --output file')
+        return EXIT_INVALID
+    engines = init_settings(host_fields=bool(args.hosts))
+    try:
+        if args.jobs == '-':
+            jobs = parse_jobs(sys.stdin, list(engines))
+        else:
+            with open(args.jobs) as file:
+                jobs = parse_jobs(file, list(engines))
+    except (OSError, ValueError) as e:
+        logger.error(f'Invalid job list: {e}')
+        return EXIT_INVALID
+    if args.hosts:
+        sink = HostSink(args.output or '-', args.hosts)
+    elif args.format == 'files':
+        for index, job in enumerate(jobs, 1):
+            job.output = job.output or f'{index:04d}_{job.engine}.txt'
+        outputs = [job.output for job in jobs]
+        if len(set(outputs)) != len(outputs):
+            logger.error('Invalid job list: several jobs write to the same output file')
+            return EXIT_INVALID
+        sink = FileSink(args.output or 'results')
+    else:
+        sink = JsonlSink(args.output or '-')
+    delta = DeltaStore(args.delta) if args.delta else None
+    known = KnownHostIndex(args.known) if args.known else None
+    try:
+        run_batch(jobs, engines, sink, args.workers, delta, bool(args.hosts), known)
+    except KeyboardInterrupt:
+        logger.warning('Batch interrupted, run it again to resume the unfinished jobs')
+        return EXIT_FAILED
+    finally:
+        sink.close()
+        if known is not None:
+            known.close()
+    print_summary(jobs)
+    if args.summary:
+        with open(args.summary, 'w') as file:
+            json.dump([job.to_dict() for job in jobs], file, indent=2)
+    return EXIT_OK if all(job.status == 'ok' for job in jobs) else EXIT_FAILED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
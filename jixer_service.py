@@ -0,0 +1,661 @@
+"""
+Long-running HTTP/JSON service in front of the engine clients.
+
+The service keeps its clients, with their keep-alive connection pools, rate limits,
+API key pools and response cache (JIXER_CACHE), warm across requests. Identical
+in-flight searches are coalesced: a caller asking for an (engine, query) that is already
+being fetched joins the running search and receives every page from the start, so all
+callers share one upstream fetch. Results are streamed to the callers as pages arrive.
+
+Recurring queries are run on a schedule through the same searches, so they also coalesce
+with the callers. The schedules are read from --schedules, a file of JSON lines
+    {"engine": "shodan", "query": "product:nginx", "interval": 3600, "output": "nginx.txt"}
+where the output is optional, and schedules added or removed through the API are saved
+back to it.
+
+Endpoints:
+    GET    /engines                     engine names
+    GET    /count?engine=&query=        number of results of a query
+    GET    /search?engine=&query=       JSON lines, {"ips": [...]} per page then a summary line
+    GET    /search?...&format=text      one IP address per line
+    GET    /status                      running searches, schedules and client metrics
+    GET    /metrics                     client metrics in the Prometheus text format
+    GET    /schedules                   schedules and their last run
+    POST   /schedules                   add a schedule, same JSON object as in the file
+    GET    /schedules/<id>              one schedule
+    DELETE /schedules/<id>              remove a schedule
+    GET    /schedules/<id>/results      IP addresses of the last successful run
+
+Example:
+    python jixer_service.py --port 8080 --schedules schedules.jsonl
+    curl 'http://127.0.0.1:8080/search?engine=shodan&query=product:nginx'
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+import uuid
+from collections.abc import Iterator, Mapping
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+# The gevent backend patches the process, it is imported before gevent's modules
+import engine.base  # noqa: F401
+import gevent
+from gevent.event import AsyncResult, Event
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from jixer_CLI import init_settings
+from utils.helper import save_results
+from utils.ipset import IPSet
+from utils.limits import SearchLimits
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger('jixer_service')
+
+
+class SearchFlight:
+    """
+    One running search, shared by every caller asking for the same engine and query.
+
+    The new IP addresses of every page are kept in page order, so a caller joining
+    late still receives all of them.
+
+    Attributes:
+        engine (str): Engine name.
+        query (str): Search query.
+        count (int | None): Number of items reported by the engine.
+        batches (list[list[str]]): New IP addresses of every page, in page order.
+        results (int): Number of IP addresses found so far.
+        pages (int): Number of pages with new IP addresses so far.
+        missing_pages (int): Number of pages that could not be fetched.
+        truncated (int): Number of results beyond the engine's paging limit, never fetched.
+        done (bool): True once the search ended.
+        error (str | None): Reason of a failure.
+        subscribers (int): Number of callers receiving the results.
+    """
+
+    def __init__(self, engine: str, query: str):
+        self.engine = engine
+        self.query = query
+        self.count = None
+        self.batches = []
+        self.results = 0
+        self.pages = 0
+        self.missing_pages = 0
+        self.truncated = 0
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.started = time.time()
+        self.seconds = 0.0
+        self.counted = Event()
+        self._changed = Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, Event()
+        changed.set()
+
+    def publish(self, ips: list[str]):
+        self.batches.append(ips)
+        self.results += len(ips)
+        self._notify()
+
+    def finish(self, error: str = None):
+        self.error = error
+        self.done = True
+        self.seconds = time.time() - self.started
+        self.counted.set()
+        self._notify()
+
+    def follow(self) -> Iterator[list[str]]:
+        """
+        Yield the new IP addresses of every page, from the first page until the search ends.
+
+        Yields:
+            list[str]: New IP addresses of a page.
+        """
+        index = 0
+        while True:
+            changed = self._changed
+            if index < len(self.batches):
+                yield self.batches[index]
+                index += 1
+            elif self.done:
+                return
+            else:
+                changed.wait()
+
+    @property
+    def complete(self) -> bool:
+        return self.done and self.error is None and not self.missing_pages and not self.truncated
+
+    def to_dict(self) -> dict:
+        return {
+            'engine': self.engine,
+            'query': self.query,
+            'done': self.done,
+            'complete': self.complete,
+            'count': self.count,
+            'results': self.results,
+            'pages': self.pages,
+            'missing_pages': self.missing_pages,
+            'truncated': self.truncated,
+            'subscribers': self.subscribers,
+            'seconds': round(self.seconds if self.done else time.time() - self.started, 3),
+            'error': self.error,
+        }
+
+
+class Schedule:
+    """
+    Recurring search and the outcome of its last run.
+
+    Attributes:
+        id (str): Schedule id.
+        engine (str): Engine name.
+        query (str): Search query.
+        interval (float): Seconds between the starts of two runs.
+        output (str): Results file name written after every successful run, none if empty.
+        next_run (float): Time of the next run.
+        runs (int): Number of finished runs.
+        results (IPSet | None): IP addresses of the last successful run.
+        added (int | None): Number of IP addresses added by the last successful run.
+        removed (int | None): Number of IP addresses removed by the last successful run.
+        error (str | None): Reason of the failure of the last run.
+    """
+
+    def __init__(self, id: str, engine: str, query: str, interval: float, output: str = ''):
+        self.id = id
+        self.engine = engine
+        self.query = query
+        self.interval = interval
+        self.output = output
+        self.next_run = time.time()
+        self.running = False
+        self.runs = 0
+        self.last_run = None
+        self.seconds = 0.0
+        self.count = None
+        self.results = None
+        self.added = None
+        self.removed = None
+        self.error = None
+
+    @classmethod
+    def from_entry(cls, entry: dict, engines: list[str]) -> 'Schedule':
+        """
+        Create a schedule from its JSON object.
+
+        Args:
+            entry (dict): Schedule with the engine, query, interval and optional output and id.
+            engines (list[str]): Known engine names.
+
+        Returns:
+            Schedule: New schedule, run as soon as the scheduler starts.
+
+        Raises:
+            ValueError: If a field is missing or invalid.
+        """
+        if not isinstance(entry, dict):
+            raise ValueError('expected a JSON object')
+        engine = str(entry.get('engine', '')).strip().lower()
+        query = str(entry.get('query', '')).strip()
+        output = str(entry.get('output') or '').strip()
+        if engine not in engines:
+            raise ValueError(f'unknown engine "{engine}", expected one of {", ".join(engines)}')
+        if not query:
+            raise ValueError('empty query')
+        try:
+            interval = float(entry.get('interval'))
+        except (TypeError, ValueError):
+            raise ValueError('the interval must be a number of seconds')
+        if interval <= 0:
+            raise ValueError('the interval must be positive')
+        if output and os.path.basename(output) != output:
+            raise ValueError('the output must be a file name')
+        return cls(str(entry.get('id') or uuid.uuid4().hex[:8]), engine, query, interval, output)
+
+    def to_entry(self) -> dict:
+        return {'id': self.id, 'engine': self.engine, 'query': self.query, 'interval': self.interval,
+                'output': self.output}
+
+    def record(self, flight: SearchFlight, results: IPSet):
+        """
+        Record the outcome of a run, the results are only replaced by a complete run.
+
+        Args:
+            flight (SearchFlight): Finished search of the run.
+            results (IPSet): IP addresses found by the run.
+        """
+        self.runs += 1
+        self.seconds = flight.seconds
+        self.count = flight.count
+        self.error = flight.error
+        if flight.error is None and flight.missing_pages:
+            self.error = f'{flight.missing_pages} pages could not be fetched'
+        elif flight.error is None and flight.truncated:
+            self.error = f'{flight.truncated} results are beyond the paging limit of the engine'
+        if self.error is None:
+            if self.results is not None:
+                self.added = len(results.difference(self.results))
+                self.removed = len(self.results.difference(results))
+            self.results = results
+
+    def to_dict(self) -> dict:
+        return dict(self.to_entry(), **{
+            'running': self.running,
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'next_run': self.next_run,
+            'seconds': round(self.seconds, 3),
+            'count': self.count,
+            'results': len(self.results) if self.results is not None else None,
+            'added': self.added,
+            'removed': self.removed,
+            'error': self.error,
+        })
+
+
+class SearchService:
+    """
+    Searches and schedules sharing one set of warm clients.
+
+    Attributes:
+        clients (Mapping): Clients by engine name, e.g. `ENGINES.lazy()`.
+        folder_name (str): Folder of the results files of the schedules.
+        schedules (dict[str, Schedule]): Schedules by id.
+        schedules_path (str | None): File the schedules are saved to.
+    """
+
+    _SCHEDULE_TICK = 1.0
+    _BUSY_RETRY = 30.0
+
+    def __init__(self, clients: Mapping, max_searches: int = 8, folder_name: str = 'results',
+                 schedules_path: str = None):
+        """
+        Initializes the SearchService object.
+
+        Args:
+            clients (Mapping): Clients by engine name.
+            max_searches (int): Maximum number of searches fetching pages at the same time,
+                further searches are refused until a slot is free.
+            folder_name (str): Folder of the results files of the schedules.
+            schedules_path (str): JSON lines file to load the schedules from and save them to.
+        """
+        self.clients = clients
+        self.folder_name = folder_name
+        self.schedules = {}
+        self.schedules_path = schedules_path
+        self.started = time.time()
+        self._flights = {}
+        self._counts = {}
+        self._pool = Pool(max(1, max_searches))
+        self._scheduler = None
+        if schedules_path and os.path.exists(schedules_path):
+            with open(schedules_path) as file:
+                for number, line in enumerate(file, 1):
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    try:
+                        schedule = Schedule.from_entry(json.loads(line), list(clients))
+                    except ValueError as e:
+                        raise ValueError(f'{schedules_path}, line {number}: {e}')
+                    self.schedules[schedule.id] = schedule
+            logger.info(f'Loaded {len(self.schedules)} schedules from {schedules_path}')
+
+    def count(self, engine: str, query: str) -> int | None:
+        """
+        Get the number of results of a query, concurrent identical requests share one API call.
+
+        Args:
+            engine (str): Engine name.
+            query (str): Search query.
+
+        Returns:
+            int | None: Number of results, None if the request failed.
+        """
+        key = (engine, query.strip())
+        pending = self._counts.get(key)
+        if pending is None:
+            pending = self._counts[key] = AsyncResult()
+            try:
+                pending.set(self.clients[engine].count(key[1]))
+            except Exception as e:
+                pending.set_exception(e)
+            finally:
+                del self._counts[key]
+        return pending.get()
+
+    def search(self, engine: str, query: str) -> SearchFlight | None:
+        """
+        Start a search, or join the running search of the same engine and query.
+
+        A running search can always be joined. A new one is only started if a search slot
+        is free, so that callers are turned away instead of waiting for a slot.
+
+        Args:
+            engine (str): Engine name.
+            query (str): Search query.
+
+        Returns:
+            SearchFlight | None: Running search, follow it to receive the results,
+                None if all `max_searches` slots are busy.
+        """
+        key = (engine, query.strip())
+        flight = self._flights.get(key)
+        if flight is not None:
+            logger.info(f'Joining the running {engine} search of the query: {key[1]}')
+            return flight
+        if self._pool.full():
+            logger.warning(f'All {self._pool.size} search slots are busy, refusing the {engine} search '
+                           f'of the query: {key[1]}')
+            return None
+        flight = self._flights[key] = SearchFlight(*key)
+        logger.info(f'Starting the {engine} search of the query: {key[1]}')
+        self._pool.spawn(self._run, flight)
+        return flight
+
+    def _run(self, flight: SearchFlight):
+        """
+        Fetch the pages of a search and publish the new IP addresses of every page.
+
+        Queries over the engine's paging limit are sharded, the results of a shard that
+        cannot be split further are truncated and the flight is not complete.
+
+        Args:
+            flight (SearchFlight): Search to run.
+        """
+        from engine.sharding import QuerySharder
+
+        client = self.clients[flight.engine]
+        try:
+            flight.count = self.count(flight.engine, flight.query)
+            if flight.count is None:
+                raise RuntimeError('the count request failed, please check the correctness of the query')
+            flight.counted.set()
+            sharder = QuerySharder(client)
+            seen = IPSet()
+            limits = SearchLimits()
+            if sharder.needs_sharding(flight.count):
+                shards = sharder.plan(flight.query, flight.count, limits)
+            else:
+                shards = [(flight.query, flight.count)]
+            for shard_query, shard_count in shards:
+                for ips in client.iter_ip_pages(shard_query, shard_count, seen=seen, limits=limits):
+                    if ips:
+                        flight.pages += 1
+                        flight.publish(ips)
+                flight.missing_pages = limits.missing_pages
+                flight.truncated = limits.truncated
+            flight.finish()
+        except Exception as e:
+            logger.error(f'The {flight.engine} search of the query: {flight.query} failed: {e}')
+            flight.finish(str(e))
+        finally:
+            self._flights.pop((flight.engine, flight.query), None)
+        logger.info(f'The {flight.engine} search of the query: {flight.query} ended with {flight.results} results '
+                    f'in {flight.seconds:.1f}s')
+
+    def flights(self) -> list[SearchFlight]:
+        return list(self._flights.values())
+
+    def add_schedule(self, schedule: Schedule) -> Schedule:
+        if schedule.id in self.schedules:
+            raise ValueError(f'the schedule {schedule.id} already exists')
+        self.schedules[schedule.id] = schedule
+        self._save_schedules()
+        logger.info(f'Added the schedule {schedule.id}: {schedule.engine} {schedule.query} '
+                    f'every {schedule.interval:g}s')
+        return schedule
+
+    def remove_schedule(self, schedule_id: str) -> Schedule | None:
+        schedule = self.schedules.pop(schedule_id, None)
+        if schedule is not None:
+            self._save_schedules()
+            logger.info(f'Removed the schedule {schedule_id}')
+        return schedule
+
+    def _save_schedules(self):
+        if not self.schedules_path:
+            return
+        temporary_path = f'{self.schedules_path}.tmp'
+        with open(temporary_path, 'w') as file:
+            for schedule in self.schedules.values():
+                file.write(json.dumps(schedule.to_entry()) + '\n')
+        os.replace(temporary_path, self.schedules_path)
+
+    def start_scheduler(self):
+        if self._scheduler is None:
+            self._scheduler = gevent.spawn(self._schedule_loop)
+
+    def _schedule_loop(self):
+        while True:
+            now = time.time()
+            for schedule in list(self.schedules.values()):
+                if not schedule.running and schedule.next_run <= now:
+                    schedule.running = True
+                    gevent.spawn(self._run_schedule, schedule)
+            gevent.sleep(self._SCHEDULE_TICK)
+
+    def _run_schedule(self, schedule: Schedule):
+        """
+        Run a schedule once and write its results file.
+
+        Args:
+            schedule (Schedule): Schedule to run.
+        """
+        now = time.time()
+        try:
+            flight = self.search(schedule.engine, schedule.query)
+            if flight is None:
+                # Retry soon instead of skipping a whole interval, the run is not counted.
+                schedule.next_run = now + min(schedule.interval, self._BUSY_RETRY)
+                schedule.error = 'all search slots are busy'
+                return
+            schedule.last_run = now
+            schedule.next_run = now + schedule.interval
+            results = IPSet()
+            for ips in flight.follow():
+                results.update(ips)
+            schedule.record(flight, results)
+            if schedule.error is None and schedule.output:
+                if not save_results(schedule.query, results, schedule.output, self.folder_name):
+                    schedule.error = f'failed to write the results to {self.folder_name}/{schedule.output}'
+        except Exception as e:
+            schedule.error = str(e)
+            logger.error(f'The schedule {schedule.id} failed: {e}')
+        finally:
+            schedule.running = False
+
+    def close(self):
+        if self._scheduler is not None:
+            self._scheduler.kill()
+        self._pool.kill()
+        created = self.clients.created() if hasattr(self.clients, 'created') else dict(self.clients)
+        for client in created.values():
+            client.close()
+
+
+class ServiceApp:
+    """
+    WSGI application exposing a SearchService over HTTP/JSON.
+    """
+
+    def __init__(self, service: SearchService):
+        self.service = service
+
+    def __call__(self, environ: dict, start_response):
+        method = environ['REQUEST_METHOD']
+        parts = [part for part in environ.get('PATH_INFO', '').split('/') if part]
+        params = {name: values[-1] for name, values in parse_qs(environ.get('QUERY_STRING', '')).items()}
+        try:
+            if parts == ['engines'] and method == 'GET':
+                return self._json(start_response, HTTPStatus.OK, list(self.service.clients))
+            if parts == ['count'] and method == 'GET':
+                return self._count(start_response, params)
+            if parts == ['search'] and method == 'GET':
+                return self._search(start_response, params)
+            if parts == ['status'] and method == 'GET':
+                return self._json(start_response, HTTPStatus.OK, self._status())
+            if parts == ['metrics'] and method == 'GET':
+                start_response(self._status_line(HTTPStatus.OK), [('Content-Type', 'text/plain; version=0.0.4')])
+                return [REGISTRY.to_prometheus().encode()]
+            if parts and parts[0] == 'schedules':
+                return self._schedules(start_response, method, parts[1:], environ)
+            return self._error(start_response, HTTPStatus.NOT_FOUND, f'no route for {method} {environ["PATH_INFO"]}')
+        except ValueError as e:
+            return self._error(start_response, HTTPStatus.BAD_REQUEST, str(e))
+        except Exception as e:
+            logger.exception(f'Failed to handle {method} {environ.get("PATH_INFO")}')
+            return self._error(start_response, HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+
+    @staticmethod
+    def _status_line(status: HTTPStatus) -> str:
+        return f'{status.value} {status.phrase}'
+
+    def _json(self, start_response, status: HTTPStatus, payload) -> list[bytes]:
+        body = json.dumps(payload).encode()
+        start_response(self._status_line(status), [('Content-Type', 'application/json'),
+                                                   ('Content-Length', str(len(body)))])
+        return [body]
+
+    def _error(self, start_response, status: HTTPStatus, message: str) -> list[bytes]:
+        return self._json(start_response, status, {'error': message})
+
+    def _engine_query(self, params: dict) -> tuple[str, str]:
+        engine = params.get('engine', '').strip().lower()
+        query = params.get('query', '').strip()
+        if engine not in self.service.clients:
+            raise ValueError(f'unknown engine "{engine}", expected one of {", ".join(self.service.clients)}')
+        if not query:
+            raise ValueError('empty query')
+        return engine, query
+
+    def _count(self, start_response, params: dict) -> list[bytes]:
+        engine, query = self._engine_query(params)
+        count = self.service.count(engine, query)
+        if count is None:
+            return self._error(start_response, HTTPStatus.BAD_GATEWAY,
+                               'the count request failed, please check the correctness of the query')
+        return self._json(start_response, HTTPStatus.OK, {'engine': engine, 'query': query, 'count': count})
+
+    def _search(self, start_response, params: dict):
+        engine, query = self._engine_query(params)
+        text = params.get('format', 'jsonl') == 'text'
+        flight = self.service.search(engine, query)
+        if flight is None:
+            return self._error(start_response, HTTPStatus.SERVICE_UNAVAILABLE,
+                               'all search slots are busy, please retry later')
+        # The status is sent with the first line, so wait for the count request to tell a failed query.
+        flight.counted.wait()
+        if flight.done and flight.error and not flight.batches:
+            return self._error(start_response, HTTPStatus.BAD_GATEWAY, flight.error)
+        start_response(self._status_line(HTTPStatus.OK),
+                       [('Content-Type', 'text/plain' if text else 'application/x-ndjson')])
+        return self._stream(flight, text)
+
+    @staticmethod
+    def _stream(flight: SearchFlight, text: bool) -> Iterator[bytes]:
+        flight.subscribers += 1
+        try:
+            for ips in flight.follow():
+                if text:
+                    yield ''.join(ip + '\n' for ip in ips).encode()
+                else:
+                    yield (json.dumps({'ips': ips}) + '\n').encode()
+            if not text:
+                yield (json.dumps(flight.to_dict()) + '\n').encode()
+        finally:
+            flight.subscribers -= 1
+
+    def _status(self) -> dict:
+        clients = self.service.clients
+        return {
+            'uptime': round(time.time() - self.service.started, 3),
+            'searches': [flight.to_dict() for flight in self.service.flights()],
+            'schedules': len(self.service.schedules),
+            'clients': list(clients.created() if hasattr(clients, 'created') else clients),
+            'metrics': REGISTRY.snapshot(),
+        }
+
+    def _schedules(self, start_response, method: str, parts: list[str], environ: dict) -> list[bytes]:
+        service = self.service
+        if not parts:
+            if method == 'GET':
+                return self._json(start_response, HTTPStatus.OK,
+                                  [schedule.to_dict() for schedule in service.schedules.values()])
+            if method == 'POST':
+                try:
+                    length = int(environ.get('CONTENT_LENGTH') or 0)
+                    entry = json.loads(environ['wsgi.input'].read(length) or b'null')
+                except ValueError as e:
+                    raise ValueError(f'invalid JSON: {e}')
+                schedule = service.add_schedule(Schedule.from_entry(entry, list(service.clients)))
+                return self._json(start_response, HTTPStatus.CREATED, schedule.to_dict())
+            return self._error(start_response, HTTPStatus.METHOD_NOT_ALLOWED, f'{method} is not allowed')
+        schedule = service.schedules.get(parts[0])
+        if schedule is None:
+            return self._error(start_response, HTTPStatus.NOT_FOUND, f'no schedule {parts[0]}')
+        if len(parts) == 1 and method == 'GET':
+            return self._json(start_response, HTTPStatus.OK, schedule.to_dict())
+        if len(parts) == 1 and method == 'DELETE':
+            service.remove_schedule(schedule.id)
+            return self._json(start_response, HTTPStatus.OK, schedule.to_dict())
+        if parts[1:] == ['results'] and method == 'GET':
+            if schedule.results is None:
+                return self._error(start_response, HTTPStatus.NOT_FOUND, f'the schedule {schedule.id} has no results yet')
+            start_response(self._status_line(HTTPStatus.OK), [('Content-Type', 'text/plain')])
+            return (''.join(ip + '\n' for ip in ips).encode() for ips in _batched(schedule.results))
+        return self._error(start_response, HTTPStatus.NOT_FOUND, f'no route for {method} {environ["PATH_INFO"]}')
+
+
+def _batched(ips: IPSet, size: int = 10000) -> Iterator[list[str]]:
+    batch = []
+    for ip in ips:
+        batch.append(ip)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve searches over HTTP/JSON with shared clients')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--max-searches', type=int, default=8,
+                        help='maximum number of searches fetching pages at the same time')
+    parser.add_argument('--schedules', default=None, metavar='FILE',
+                        help='JSON lines file of the recurring queries, API changes are saved to it')
+    parser.add_argument('--output', default='results', help='folder of the results files of the schedules')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        service = SearchService(init_settings(), args.max_searches, args.output, args.schedules)
+    except (OSError, ValueError) as e:
+        logger.error(f'Invalid schedules: {e}')
+        return 2
+    server = WSGIServer((args.host, args.port), ServiceApp(service), log=None)
+    gevent.signal_handler(signal.SIGTERM, server.stop)
+    service.start_scheduler()
+    logger.info(f'Serving on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The gevent backend patches the process, it is imported before the modules under test.
+import engine.base  # noqa: E402,F401
+from bench.mock_server import BASE_PATHS, start_mock_server  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def mock_server():
+    """
+    Start mock servers with the given MockConfig options, they are stopped after the test.
+
+    Returns the base URL of the engines: `mock_server(results=300)['shodan']`.
+    """
+    processes = []
+
+    def start(**options) -> dict[str, str]:
+        port = free_port()
+        processes.append(start_mock_server(port, **{'latency': 0, **options}))
+        return {engine: f'http://127.0.0.1:{port}{path}' for engine, path in BASE_PATHS.items()}
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.wait()
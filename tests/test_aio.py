@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from utils.limits import SearchLimits
+
+pytest.importorskip('aiohttp')
+
+from engine.aio import AsyncNetlasClient, AsyncShodanClient, AsyncZoomeyeClient  # noqa: E402
+
+
+def test_async_search_collects_every_page(mock_server):
+    urls = mock_server(results=1000, latency=0.05)
+
+    async def run():
+        async with AsyncShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=5) as client:
+            count = await client.count('product:nginx')
+            return count, await client.search('product:nginx', count)
+
+    count, servers = asyncio.run(run())
+    assert count == 1000
+    assert len(servers) == 1000 and servers.complete
+
+
+@pytest.mark.parametrize('engine, client_class', [('zoomeye', AsyncZoomeyeClient), ('netlas', AsyncNetlasClient)])
+def test_async_iter_ips_stops_at_the_result_target(mock_server, engine, client_class):
+    urls = mock_server(results=500)
+
+    async def run():
+        limits = SearchLimits(max_results=50)
+        async with client_class('key', base_url=urls[engine], rate_limit=1000) as client:
+            ips = [ip async for ip in client.iter_ips('product:nginx', 500, limits=limits)]
+        return ips, limits
+
+    ips, limits = asyncio.run(run())
+    assert len(ips) == len(set(ips)) == 50
+    assert limits.stopped == 'max_results'
@@ -0,0 +1,53 @@
+from engine.clients import ShodanClient
+from jixer_batch import BatchJob, JsonlSink, run_job
+from utils.knownhosts import KnownHostIndex
+from tests.test_sharding import FlakyShodanClient
+
+
+class SecondPageFailingShodanClient(ShodanClient):
+    def _fetch_page(self, request) -> list:
+        if request.kwargs['params'].get('page') == 2:
+            return []
+        return super()._fetch_page(request)
+
+
+def run(client, tmp_path, known: KnownHostIndex = None) -> tuple[BatchJob, list[str]]:
+    job = BatchJob('shodan', 'product:nginx', line=1)
+    sink = JsonlSink(str(tmp_path / 'results.jsonl'))
+    run_job(job, client, sink, known=known)
+    sink.close()
+    return job, (tmp_path / 'results.jsonl').read_text().splitlines()
+
+
+def test_job_is_ok(mock_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    urls = mock_server(results=300)
+    job, lines = run(ShodanClient('key', base_url=urls['shodan'], rate_limit=1000), tmp_path)
+    assert job.status == 'ok', job.error
+    assert job.results == len(lines) > 0
+
+
+def test_sharded_job_missing_pages_fails(mock_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    urls = mock_server(results=3000)
+    client = FlakyShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    client._MAX_PAGES = 10
+    job, lines = run(client, tmp_path)
+    assert job.status == 'failed'
+    assert 'pages could not be fetched' in job.error
+    assert job.results == len(lines) > 0
+
+
+def test_resumed_job_writes_the_new_addresses_again(mock_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    urls = mock_server(results=300)
+    known = KnownHostIndex(str(tmp_path / 'known'), capacity=10_000)
+    job, lines = run(SecondPageFailingShodanClient('key', base_url=urls['shodan'], rate_limit=1000), tmp_path, known)
+    assert job.status == 'failed'
+    assert len(lines) == 200
+    assert len(known) == 0
+
+    job, lines = run(ShodanClient('key', base_url=urls['shodan'], rate_limit=1000), tmp_path, known)
+    assert job.status == 'ok', job.error
+    assert job.results == len(lines) == len(known) == 300
+    known.close()
@@ -0,0 +1,66 @@
+import time
+import zlib
+from urllib.parse import urljoin
+
+import requests
+
+from engine.clients import ShodanClient
+from utils.cache import ResponseCache, make_cache_key
+
+
+def engine_requests(urls: dict, engine: str) -> int:
+    return requests.get(urljoin(urls[engine], '/_stats')).json().get(engine, {}).get('requests', 0)
+
+
+def test_repeated_search_is_answered_from_the_cache(mock_server, tmp_path):
+    urls = mock_server(results=300)
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    first = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, cache=cache)
+    assert len(first.search('product:nginx', 300)) == 300
+    sent = engine_requests(urls, 'shodan')
+    # The API key is not part of the cache key, another key reuses the responses.
+    second = ShodanClient('other', base_url=urls['shodan'], rate_limit=1000, cache=cache)
+    assert len(second.search('product:nginx', 300)) == 300
+    assert engine_requests(urls, 'shodan') == sent
+    assert second.metrics.cache_hits >= 3
+
+
+def test_cache_key_depends_on_the_request():
+    key = make_cache_key('shodan', 'GET https://api/search', {'query': 'a', 'page': 1})
+    assert key == make_cache_key('shodan', 'GET https://api/search', {'page': 1, 'query': 'a'})
+    assert key != make_cache_key('shodan', 'GET https://api/search', {'query': 'a', 'page': 2})
+    assert key != make_cache_key('fofa', 'GET https://api/search', {'query': 'a', 'page': 1})
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    cache.set('key', 'shodan', '{}')
+    assert cache.get('key', ttl=60) == '{}'
+    time.sleep(0.02)
+    assert cache.get('key', ttl=0.01) is None
+    assert cache.get('key', ttl=60) is None
+
+
+def test_overwrite_keeps_the_size(tmp_path):
+    path = str(tmp_path / 'responses.sqlite')
+    cache = ResponseCache(path)
+    cache.set('key', 'shodan', 'a' * 1000)
+    cache.set('key', 'shodan', 'b' * 1000)
+    size = len(zlib.compress(b'b' * 1000))
+    assert cache._size == size
+    cache.close()
+    assert ResponseCache(path)._size == size
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    size = len(zlib.compress(b'a' * 1000))
+    cache = ResponseCache(str(tmp_path / 'responses.sqlite'), max_size=3 * size)
+    for key in 'abc':
+        cache.set(key, 'shodan', key * 1000)
+        time.sleep(0.01)
+    assert cache.get('a', ttl=60) == 'a' * 1000
+    time.sleep(0.01)
+    # Going over the maximum evicts down to 90% of it: the two least recently used entries.
+    cache.set('d', 'shodan', 'd' * 1000)
+    assert [key for key in 'abcd' if cache.get(key, ttl=60) is not None] == ['a', 'd']
+    assert cache._size == 2 * size
@@ -0,0 +1,35 @@
+import pytest
+
+from jixer_CLI import check_settings
+
+SETTINGS = ('JIXER_DELTA', 'JIXER_HOSTS', 'JIXER_QUEUE', 'JIXER_KNOWN', 'JIXER_KNOWN_MODE', 'JIXER_JOURNAL')
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    for name in SETTINGS:
+        monkeypatch.delenv(name, raising=False)
+
+    def set_settings(**values):
+        for name, value in values.items():
+            monkeypatch.setenv(name, value)
+        return check_settings()
+
+    return set_settings
+
+
+def test_compatible_settings_are_accepted(settings):
+    assert settings() is None
+    assert settings(JIXER_QUEUE='.queue/tasks.sqlite', JIXER_KNOWN='.known', JIXER_KNOWN_MODE='tag') is None
+
+
+@pytest.mark.parametrize('values, error', [
+    ({'JIXER_DELTA': '.delta/state.sqlite', 'JIXER_HOSTS': 'jsonl'}, 'JIXER_DELTA cannot be combined with JIXER_HOSTS'),
+    ({'JIXER_DELTA': '.delta/state.sqlite', 'JIXER_KNOWN': '.known'}, 'JIXER_DELTA cannot be combined with JIXER_KNOWN'),
+    ({'JIXER_HOSTS': 'csv', 'JIXER_QUEUE': '.queue/tasks.sqlite'}, 'JIXER_HOSTS cannot be combined with JIXER_QUEUE'),
+    ({'JIXER_QUEUE': '.queue/tasks.sqlite', 'JIXER_JOURNAL': '.journal'}, 'JIXER_QUEUE cannot be combined'),
+    ({'JIXER_KNOWN_MODE': 'tag'}, 'JIXER_KNOWN_MODE needs JIXER_KNOWN'),
+    ({'JIXER_KNOWN': '.known', 'JIXER_KNOWN_MODE': 'all'}, "must be 'new' or 'tag'"),
+])
+def test_conflicting_settings_are_rejected(settings, values, error):
+    assert error in settings(**values)
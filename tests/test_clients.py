@@ -0,0 +1,80 @@
+import time
+from urllib.parse import urljoin
+
+import pytest
+import requests
+
+from engine.clients import FofaClient, ShodanClient, ZoomeyeClient
+from utils.helper import stream_results
+
+
+def test_pages_are_fetched_concurrently_and_yielded_in_order(mock_server):
+    urls = mock_server(results=1000, latency=0.2)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=10)
+    started = time.monotonic()
+    pages = list(client.iter_pages('product:nginx', 1000))
+    # Ten pages of 0.2 s each take 2 s one after another.
+    assert time.monotonic() - started < 1.0
+    first_ips = [client.get_parsed_ip_list(page[:1]).pop() for page in pages]
+    assert first_ips == [f'10.0.{index * 100 // 256}.{index * 100 % 256}' for index in range(10)]
+
+
+def test_concurrency_caps_the_requests_in_flight(mock_server):
+    urls = mock_server(results=600, latency=0.2)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=2)
+    started = time.monotonic()
+    assert len(client.search('product:nginx', 600)) == 600
+    # Six pages two at a time take three rounds of 0.2 s.
+    assert time.monotonic() - started >= 0.6
+
+
+def engine_requests(urls: dict, engine: str) -> int:
+    stats_url = urljoin(urls[engine], '/_stats')
+    return requests.get(stats_url).json().get(engine, {}).get('requests', 0)
+
+
+@pytest.mark.parametrize('engine, client_class, args', [('fofa', FofaClient, ('user@example.com',)),
+                                                       ('zoomeye', ZoomeyeClient, ())])
+def test_search_reuses_the_first_page_of_count(mock_server, engine, client_class, args):
+    urls = mock_server(results=100)
+    client = client_class('key', *args, base_url=urls[engine], rate_limit=1000)
+    count = client.count('product:nginx')
+    assert engine_requests(urls, engine) == 1
+    assert len(client.search('product:nginx', count)) == 100
+    assert engine_requests(urls, engine) == client.get_page_count(count)
+    # The kept page is handed out once, another search fetches every page.
+    client.search('product:nginx', count)
+    assert engine_requests(urls, engine) == 2 * client.get_page_count(count)
+
+
+def test_iter_ips_yields_before_the_last_page_is_requested(mock_server):
+    urls = mock_server(results=1000, latency=0.1)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=1)
+    ips = client.iter_ips('product:nginx', 1000)
+    assert next(ips) in {f'10.0.0.{index}' for index in range(100)}
+    assert engine_requests(urls, 'shodan') < 5
+    assert len(list(ips)) == 999
+
+
+def test_streamed_results_match_the_search(mock_server, tmp_path):
+    urls = mock_server(results=450)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=3)
+    written = stream_results('q', client.iter_ips('product:nginx', 450), 'out.txt', str(tmp_path), flush_every=100)
+    assert written == 450
+    streamed = (tmp_path / 'out.txt').read_text().split()
+    assert sorted(streamed) == sorted(client.search('product:nginx', 450))
+
+
+def test_requests_share_the_keep_alive_connections_of_the_session(mock_server):
+    urls = mock_server(results=1000)
+    with ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=2) as client:
+        adapter = client.session.get_adapter(urls['shodan'])
+        assert adapter._pool_maxsize == 3
+        client.count('product:nginx')
+        assert len(client.search('product:nginx', 1000)) == 1000
+        pools = adapter.poolmanager.pools
+        assert len(pools) == 1
+        pool = pools[next(iter(pools.keys()))]
+        # Eleven requests over at most one connection per in-flight page plus one for count().
+        assert pool.num_requests == 11
+        assert pool.num_connections <= 3
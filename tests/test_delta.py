@@ -0,0 +1,67 @@
+import pytest
+
+from engine.clients import ShodanClient, ZoomeyeClient
+from engine.delta import delta_search
+from utils.delta import DeltaStore
+from utils.exceptions import IncompleteSearchException
+from utils.limits import MISSING_PAGES, TRUNCATED
+
+
+class FlakyShodanClient(ShodanClient):
+    """
+    Shodan client failing every page but the first one while `flaky` is set.
+    """
+
+    flaky = False
+
+    def _fetch_page(self, request) -> list:
+        if self.flaky and request.kwargs['params'].get('page', 1) != 1:
+            return []
+        return super()._fetch_page(request)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DeltaStore(str(tmp_path / 'state.sqlite'))
+    yield store
+    store.close()
+
+
+def test_first_run_records_the_state(mock_server, store):
+    urls = mock_server(results=300)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    result = delta_search(client, 'product:nginx', store)
+    assert result.full
+    assert result.added and not result.removed
+    assert store.known('shodan', 'product:nginx') == set(result.added)
+    assert store.last_run('shodan', 'product:nginx') is not None
+
+
+def test_incomplete_run_keeps_the_state(mock_server, store):
+    urls = mock_server(results=300)
+    client = FlakyShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    first = delta_search(client, 'product:nginx', store)
+    last_run = store.last_run('shodan', 'product:nginx')
+
+    client.flaky = True
+    with pytest.raises(IncompleteSearchException) as error:
+        delta_search(client, 'product:nginx', store, full=True)
+    assert error.value.reason == MISSING_PAGES
+    assert store.last_run('shodan', 'product:nginx') == last_run
+    assert store.known('shodan', 'product:nginx') == set(first.added)
+
+
+def test_capped_run_keeps_the_state(mock_server, store):
+    urls = mock_server(results=300)
+    client = ZoomeyeClient('key', base_url=urls['zoomeye'], rate_limit=1000)
+    first = delta_search(client, 'app:nginx', store)
+    last_run = store.last_run('zoomeye', 'app:nginx')
+
+    # The results now exceed the page cap and cannot be split by a facet.
+    client._MAX_PAGES = 5
+    client._SHARD_FACETS = []
+    with pytest.raises(IncompleteSearchException) as error:
+        delta_search(client, 'app:nginx', store, full=True)
+    assert error.value.reason == TRUNCATED
+    assert store.last_run('zoomeye', 'app:nginx') == last_run
+    assert store.known('zoomeye', 'app:nginx') == set(first.added)
@@ -0,0 +1,39 @@
+from engine.clients import NetlasClient, ShodanClient, ZoomeyeClient
+from engine.fanout import fan_out_search, render_queries, template_fields
+
+
+class FailingZoomeyeClient(ZoomeyeClient):
+    def _fetch_page(self, request) -> list:
+        if request.kwargs['params'].get('page') == 2:
+            raise RuntimeError('connection reset')
+        return super()._fetch_page(request)
+
+
+def test_templates_render_one_query_per_engine():
+    templates = {'shodan': 'http.favicon.hash:{favicon}', 'fofa': 'icon_hash="{favicon}"', 'netlas': ''}
+    assert template_fields(templates) == ['favicon']
+    assert render_queries(templates, favicon='42') == {
+        'shodan': 'http.favicon.hash:42', 'fofa': 'icon_hash="42"', 'netlas': ''}
+
+
+def test_fan_out_collects_every_engine(mock_server):
+    urls = mock_server(results=250)
+    engines = {
+        'shodan': ShodanClient('key', base_url=urls['shodan'], rate_limit=1000),
+        'netlas': NetlasClient('key', base_url=urls['netlas'], rate_limit=1000),
+        'zoomeye': ZoomeyeClient('key', base_url=urls['zoomeye'], rate_limit=1000),
+    }
+    found = fan_out_search(engines, {'shodan': 'product:nginx', 'netlas': 'port:443', 'zoomeye': 'app:nginx',
+                                     'fofa': 'app="nginx"'})
+    assert sorted(found) == ['netlas', 'shodan', 'zoomeye']
+    assert len(found['shodan']) == len(found['netlas']) == len(found['zoomeye']) == 250
+
+
+def test_failed_engine_is_left_out(mock_server):
+    urls = mock_server(results=250)
+    engines = {
+        'shodan': ShodanClient('key', base_url=urls['shodan'], rate_limit=1000),
+        'zoomeye': FailingZoomeyeClient('key', base_url=urls['zoomeye'], rate_limit=1000),
+    }
+    found = fan_out_search(engines, {'shodan': 'product:nginx', 'zoomeye': 'app:nginx'})
+    assert list(found) == ['shodan']
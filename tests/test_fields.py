@@ -0,0 +1,26 @@
+from engine.clients import NetlasClient, ShodanClient
+
+
+def test_minimal_mode_requests_only_the_ip_fields():
+    shodan = ShodanClient('key')
+    assert shodan.PARAMS['minify'] == 'true'
+    assert shodan.PARAMS['fields'] == 'ip_str'
+    assert ShodanClient('key', extra_fields=['port', 'ip_str']).PARAMS['fields'] == 'ip_str,port'
+    assert ShodanClient('key', host_fields=True).get_fields()[:2] == ['ip_str', 'port']
+    full = ShodanClient('key', minimal=False)
+    assert 'fields' not in full.PARAMS and 'minify' not in full.PARAMS
+    assert NetlasClient('key').PARAMS['fields'] == 'ip'
+    assert NetlasClient('key')._bulk_request('q', 5000).kwargs['json']['fields'] == ['ip']
+    assert 'fields' not in NetlasClient('key', minimal=False)._bulk_request('q', 5000).kwargs['json']
+
+
+def test_items_are_trimmed_to_the_requested_fields(mock_server):
+    urls = mock_server(results=150)
+    minimal = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, extra_fields=['location.country_code'])
+    records = list(minimal.iter_records('product:nginx', 150))
+    assert len(records) == 150
+    assert records[0] == {'ip_str': '10.0.0.0', 'location': {'country_code': records[0]['location']['country_code']}}
+    full = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, minimal=False)
+    assert 'data' in next(full.iter_records('product:nginx', 150))
+    netlas = NetlasClient('key', base_url=urls['netlas'], rate_limit=1000, bulk=False)
+    assert next(netlas.iter_records('product:nginx', 150)) == {'data': {'ip': '10.0.0.0'}}
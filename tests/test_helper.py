@@ -0,0 +1,20 @@
+from utils.helper import save_results, save_tagged_results, stream_results
+from utils.ipset import IPSet
+
+
+def test_save_results(tmp_path):
+    servers = ['10.0.0.1', '10.0.0.2']
+    assert save_results('q', servers, 'out.txt', str(tmp_path))
+    assert (tmp_path / 'out.txt').read_text().splitlines() == servers
+
+
+def test_stream_results_writes_every_batch(tmp_path):
+    servers = [f'10.0.{index // 256}.{index % 256}' for index in range(2500)]
+    assert stream_results('q', iter(servers), 'out.txt', str(tmp_path), flush_every=1000) == 2500
+    assert (tmp_path / 'out.txt').read_text().splitlines() == servers
+
+
+def test_save_tagged_results(tmp_path):
+    servers = {'shodan': IPSet(['10.0.0.2', '10.0.0.1']), 'fofa': IPSet(['10.0.0.1'])}
+    assert save_tagged_results('q', servers, 'out.txt', str(tmp_path))
+    assert (tmp_path / 'out.txt').read_text().splitlines() == ['10.0.0.1\tfofa,shodan', '10.0.0.2\tshodan']
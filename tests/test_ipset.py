@@ -0,0 +1,80 @@
+import pytest
+
+import utils.ipset
+from utils.ipset import IPSet, _PackedColumn
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def merge_backend(request, monkeypatch):
+    """
+    Run a test with the numpy merges and with the streamed Python merges.
+    """
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(utils.ipset, 'numpy', None)
+    return request.param
+
+
+def test_add_deduplicates_and_sorts():
+    ips = IPSet()
+    assert ips.add('10.0.0.2')
+    assert ips.add('10.0.0.1')
+    assert not ips.add('10.0.0.2')
+    assert ips.add('::1')
+    assert not ips.add('')
+    assert list(ips) == ['10.0.0.1', '10.0.0.2', '::1']
+    assert len(ips) == 3
+    assert '10.0.0.1' in ips and '10.0.0.3' not in ips and 'bogus' not in ips
+
+
+def test_add_rejects_malformed_address():
+    with pytest.raises(ValueError):
+        IPSet().add('300.1.1.1')
+
+
+def test_update_skips_and_counts_malformed_addresses():
+    ips = IPSet()
+    assert ips.update(['1.1.1.1', 'nope', '', '1.1.1.1', '2001:db8::1', '2001:db8::zz']) == 2
+    assert list(ips) == ['1.1.1.1', '2001:db8::1']
+
+
+def test_set_operations(merge_backend):
+    left = IPSet(['1.1.1.1', '2.2.2.2', '3.3.3.3', '2001:db8::1'])
+    right = IPSet(['2.2.2.2', '4.4.4.4', '2001:db8::1', '2001:db8::2'])
+    assert list(left | right) == ['1.1.1.1', '2.2.2.2', '3.3.3.3', '4.4.4.4', '2001:db8::1', '2001:db8::2']
+    assert list(left & right) == ['2.2.2.2', '2001:db8::1']
+    assert list(left - right) == ['1.1.1.1', '3.3.3.3']
+    assert list(right - left) == ['4.4.4.4', '2001:db8::2']
+    assert left.union(IPSet()) == left
+    assert len(left.intersection(IPSet())) == 0
+
+
+def test_large_sets_match_python_sets(merge_backend):
+    left_ips = {f'10.{i % 256}.{i // 256 % 256}.{i % 7}' for i in range(0, 60000, 3)}
+    right_ips = {f'10.{i % 256}.{i // 256 % 256}.{i % 7}' for i in range(0, 60000, 5)}
+    left, right = IPSet(left_ips), IPSet(right_ips)
+    assert set(left | right) == left_ips | right_ips
+    assert set(left & right) == left_ips & right_ips
+    assert set(left - right) == left_ips - right_ips
+
+
+def test_buffered_additions_are_merged_in_order(merge_backend, monkeypatch):
+    monkeypatch.setattr(_PackedColumn, '_MIN_BUFFER', 4)
+    ips = IPSet(f'10.0.{i % 7}.{i}' for i in range(0, 200, 2))
+    expected = set(ips)
+    for i in range(199, 0, -3):
+        ip = f'10.0.{i % 7}.{i}'
+        assert ips.add(ip) == (ip not in expected)
+        expected.add(ip)
+    ips.update(['10.0.0.0', '10.0.9.9', '2001:db8::1'])
+    expected.update(['10.0.0.0', '10.0.9.9', '2001:db8::1'])
+    assert list(ips) == sorted(expected, key=utils.ipset.ip_sort_key)
+
+
+def test_save_and_load(tmp_path):
+    ips = IPSet(['9.9.9.9', '1.1.1.1', '::2'])
+    path = tmp_path / 'ips.txt'
+    ips.save(str(path))
+    assert path.read_text() == '1.1.1.1\n9.9.9.9\n::2\n'
+    assert IPSet.load(str(path)) == ips
@@ -0,0 +1,31 @@
+import json
+import os
+
+from utils.journal import PageJournal
+
+
+def test_journal_resumes_the_same_count(tmp_path):
+    journal = PageJournal.for_job('shodan', 'product:nginx', 300, folder_name=str(tmp_path))
+    journal.record(0, ['10.0.0.1'])
+    journal.close()
+    assert PageJournal.for_job('shodan', 'product:nginx ', 300, folder_name=str(tmp_path)).load() == {0: ['10.0.0.1']}
+
+
+def test_journal_is_discarded_on_a_count_change_or_when_old(tmp_path):
+    journal = PageJournal.for_job('shodan', 'product:nginx', 300, folder_name=str(tmp_path))
+    journal.record(0, ['10.0.0.1'])
+    journal.close()
+    changed = PageJournal.for_job('shodan', 'product:nginx', 301, folder_name=str(tmp_path))
+    assert changed.load() == {}
+    assert not os.path.exists(changed.path)
+
+    journal.record(0, ['10.0.0.1'])
+    journal.close()
+    assert PageJournal.for_job('shodan', 'product:nginx', 300, folder_name=str(tmp_path), max_age=-1).load() == {}
+
+
+def test_journal_without_header_is_discarded(tmp_path):
+    path = tmp_path / 'old.jsonl'
+    path.write_text(json.dumps({'page': 0, 'ips': ['10.0.0.1']}) + '\n')
+    assert PageJournal(str(path)).load() == {}
+    assert not path.exists()
@@ -0,0 +1,91 @@
+import json
+import random
+
+import pytest
+
+from utils import jsonstream
+from utils.jsonstream import JsonItemParser, iter_json_items
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    kind = rng.randrange(7 if depth < 2 else 4)
+    if kind == 0:
+        return rng.choice([0, -2.5, 1e-7, -12345678901234, 3.0, 17])
+    if kind == 1:
+        return rng.choice([True, False, None])
+    if kind == 2:
+        return rng.choice(['', 'a,b', '},{', '"quoted"', 'ünïcødé ✓', '\\', 'x' * 50])
+    if kind == 3:
+        return rng.uniform(-1000, 1000)
+    if kind == 4:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f'k{i}': random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+def random_chunks(data: bytes, rng: random.Random) -> list[bytes]:
+    cuts = sorted(rng.sample(range(1, len(data)), min(len(data) - 1, rng.randrange(1, 12))))
+    return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+
+def parse(chunks, key=None) -> list:
+    parser = JsonItemParser(key)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+@pytest.mark.parametrize('chunks, expected', [
+    ([b'[-2.', b'5]'], [-2.5]),
+    ([b'[1', b'2, 3', b'4]'], [12, 34]),
+    ([b'[tr', b'ue, fal', b'se, nu', b'll]'], [True, False, None]),
+    ([b'[1e', b'-7, 1', b'.0E+2]'], [1e-7, 100.0]),
+    ([b'["a', b'\\u00e9", "\xc3', b'\xa9"]'], ['aé', 'é']),
+])
+def test_split_values(chunks, expected):
+    assert list(iter_json_items(chunks)) == expected
+    assert parse(chunks) == expected
+
+
+def test_random_chunkings_of_random_documents():
+    rng = random.Random(1234)
+    for _ in range(1500):
+        items = [random_value(rng) for _ in range(rng.randrange(1, 8))]
+        data = json.dumps(items, separators=rng.choice([(',', ':'), (', ', ': ')])).encode()
+        chunks = random_chunks(data, rng)
+        assert list(iter_json_items(chunks)) == items, chunks
+        assert parse(chunks) == items, chunks
+        assert parse([b'{"total": 3, "matches": '] + chunks + [b', "x": -1.5}'], key='matches') == items, chunks
+
+
+def test_parser_without_orjson(monkeypatch):
+    monkeypatch.setattr(jsonstream, 'orjson', None)
+    rng = random.Random(99)
+    items = [{'ip': f'10.0.0.{i}', 'port': i, 'data': 'x' * rng.randrange(100)} for i in range(200)]
+    data = json.dumps({'matches': items, 'total': 200}).encode()
+    for size in (1, 7, 4096):
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        assert parse(chunks, key='matches') == items
+
+
+def test_parser_projects_items():
+    parser = JsonItemParser('items', lambda item: item['ip'])
+    parser.feed(b'{"items": [{"ip": "1.1.1.1", "port": 80}, ')
+    parser.feed(b'{"ip": "2.2.2.2", "port": 443}]}')
+    assert parser.close() == ['1.1.1.1', '2.2.2.2']
+
+
+def test_concatenated_documents():
+    assert list(iter_json_items([b'{"a": 1}\n{"a"', b': 2}\n3\n'])) == [{'a': 1}, {'a': 2}, 3]
+
+
+@pytest.mark.parametrize('chunks', [[b'[{"a": 1}, {"a"'], [b'[1x]'], [b'["abc']])
+def test_truncated_items_and_invalid_documents(chunks):
+    with pytest.raises(ValueError):
+        list(iter_json_items(chunks))
+    with pytest.raises(ValueError):
+        parse(chunks)
+
+
+def test_parser_rejects_unclosed_document():
+    with pytest.raises(ValueError):
+        parse([b'{"matches": [1, 2'], key='matches')
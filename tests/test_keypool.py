@@ -0,0 +1,67 @@
+import pytest
+
+from engine.clients import ShodanClient
+from utils.exceptions import KeyPoolExhaustedException
+from utils.keypool import KeyPool, PooledKey, split_keys
+from utils.limits import MISSING_PAGES, SearchLimits
+from utils.ratelimit import RateLimiter
+
+
+def make_pool(size: int) -> KeyPool:
+    return KeyPool('mock', [PooledKey(f'#{index}', {}, {}, RateLimiter(max_concurrency=2)) for index in range(size)])
+
+
+def test_split_keys():
+    assert split_keys('a, b,,c ') == ['a', 'b', 'c']
+    assert split_keys(['a', '', 'b']) == ['a', 'b']
+    assert split_keys(None) == [None]
+    assert split_keys('') == [None]
+
+
+def test_requests_spread_over_the_keys():
+    pool = make_pool(2)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    pool.release(first)
+    pool.release(second)
+
+
+def test_used_up_quota_retires_the_key():
+    pool = make_pool(2)
+    first, second = pool.keys
+    pool.set_quota(first, 2)
+    pool.charge(first)
+    assert not first.exhausted
+    pool.charge(first)
+    assert first.exhausted
+    assert pool.active() == [second]
+    for _ in range(3):
+        key = pool.acquire()
+        assert key is second
+        pool.release(key)
+
+
+def test_zero_quota_retires_the_key():
+    pool = make_pool(1)
+    pool.set_quota(pool.keys[0], 0)
+    assert pool.active() == []
+
+
+def test_exhausted_pool_raises():
+    pool = make_pool(2)
+    for key in pool.keys:
+        pool.retire(key, 'rejected')
+    with pytest.raises(KeyPoolExhaustedException):
+        pool.try_acquire()
+
+
+def test_keys_are_retired_when_the_quota_runs_out(mock_server):
+    urls = mock_server(results=1000, quota=2)
+    client = ShodanClient('key1,key2', base_url=urls['shodan'], rate_limit=1000)
+    count = client.count('product:nginx')
+    servers = client.search('product:nginx', count, limits=SearchLimits())
+    assert all(key.exhausted for key in client.keys)
+    assert not servers.complete and servers.reason == MISSING_PAGES
+    # Two pages per key before the quota runs out.
+    assert 0 < len(servers) <= 4 * 100
@@ -0,0 +1,52 @@
+import math
+import struct
+
+from utils.knownhosts import BloomFilter, KnownHostIndex, pack_ip
+
+
+def test_capacity_is_kept_in_the_file(tmp_path):
+    path = str(tmp_path / 'bloom.bin')
+    bloom = BloomFilter(path, capacity=1000, error_rate=0.01)
+    assert bloom.capacity == 1000
+    bloom.add(pack_ip('10.0.0.1'))
+    bloom.close()
+    bloom = BloomFilter(path, capacity=5)
+    assert (bloom.capacity, len(bloom)) == (1000, 1)
+    assert pack_ip('10.0.0.1') in bloom
+    bloom.close()
+
+
+def test_first_format_is_still_read(tmp_path):
+    path = str(tmp_path / 'bloom.bin')
+    bits, hashes = 64 * 16, 7
+    with open(path, 'wb') as file:
+        file.write(struct.pack('<8sQQQ', b'JXBLOOM1', bits, hashes, 0))
+        file.truncate(32 + bits // 8)
+    bloom = BloomFilter(path)
+    assert bloom.capacity == round(bits / 1.3 * math.log(2) / hashes)
+    assert bloom.add(pack_ip('10.0.0.1'))
+    bloom.close()
+    bloom = BloomFilter(path)
+    assert len(bloom) == 1 and pack_ip('10.0.0.1') in bloom
+    bloom.close()
+    with open(path, 'rb') as file:
+        assert file.read(8) == b'JXBLOOM1'
+
+
+def test_index_reports_new_addresses_once(tmp_path):
+    index = KnownHostIndex(str(tmp_path / 'known'), capacity=10_000)
+    assert list(index.filter_new(['10.0.0.1', '10.0.0.2', '10.0.0.1', 'bad'], 'shodan')) == ['10.0.0.1', '10.0.0.2']
+    assert list(index.classify(['10.0.0.2', '::1'])) == [('10.0.0.2', False), ('::1', True)]
+    assert '10.0.0.1' in index and '10.0.0.3' not in index
+    assert len(index) == 3
+    index.close()
+
+
+def test_lookup_without_record_leaves_the_index_unchanged(tmp_path):
+    index = KnownHostIndex(str(tmp_path / 'known'), capacity=10_000)
+    index.record(['10.0.0.1'])
+    assert list(index.filter_new(['10.0.0.1', '10.0.0.2'], record=False)) == ['10.0.0.2']
+    assert '10.0.0.2' not in index and len(index) == 1
+    assert index.record(['10.0.0.1', '10.0.0.2'], 'shodan') == 1
+    assert list(index.filter_new(['10.0.0.2'], record=False)) == []
+    index.close()
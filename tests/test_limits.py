@@ -0,0 +1,125 @@
+import time
+
+import gevent
+import pytest
+import requests
+
+from engine.clients import FofaClient, NetlasClient, ShodanClient, ZoomeyeClient
+from engine.distributed import PageWorker, distributed_search
+from utils.limits import CANCELLED, DEADLINE, MAX_RESULTS, TRUNCATED, CancelToken, SearchLimits, SearchResult
+from utils.workqueue import WorkQueue
+
+
+def stats(urls: dict) -> dict:
+    return requests.get(urls['shodan'].split('/shodan/')[0] + '/_stats').json()
+
+
+def test_take_cuts_to_the_target():
+    limits = SearchLimits(max_results=250)
+    assert len(limits.take(list(range(100)))) == 100
+    assert len(limits.take(list(range(100)))) == 100
+    assert len(limits.take(list(range(100)))) == 50
+    assert limits.take([1]) == []
+    assert limits.results == 250
+    assert limits.exceeded() == MAX_RESULTS
+
+
+def test_pages_needed():
+    limits = SearchLimits(max_results=250)
+    assert limits.pages_needed(100) == 3
+    limits.results = 240
+    assert limits.pages_needed(100) == 1
+    limits.results = 250
+    assert limits.pages_needed(100) == 0
+    assert SearchLimits().pages_needed(100) is None
+
+
+def test_deadline_and_cancel():
+    assert SearchLimits(timeout=0).exceeded() == DEADLINE
+    assert SearchLimits(timeout=60, deadline=time.monotonic() - 1).exceeded() == DEADLINE
+    token = CancelToken()
+    limits = SearchLimits(timeout=60, cancel=token)
+    assert limits.exceeded() is None
+    assert limits.wait_timeout() == SearchLimits.CANCEL_POLL
+    token.cancel()
+    assert limits.exceeded() == CANCELLED
+    with pytest.raises(ValueError):
+        SearchLimits(max_results=-1)
+
+
+def test_result_records_why_it_is_partial():
+    limits = SearchLimits()
+    assert SearchResult(['10.0.0.1']).finish(limits, 1).complete
+    limits.stop(DEADLINE)
+    limits.stop(CANCELLED)
+    result = SearchResult().finish(limits, 10)
+    assert (result.complete, result.reason, result.count) == (False, DEADLINE, 10)
+
+
+@pytest.mark.parametrize('client_class, args', [(ShodanClient, ()), (FofaClient, ('user@example.com',)),
+                                                (ZoomeyeClient, ()), (NetlasClient, ())])
+def test_page_plan_is_trimmed_to_the_target(client_class, args):
+    client = client_class('key', *args)
+    per_page = client._RESULTS_PER_PAGE
+    full = len(client.get_request_page_list('q', per_page * 10))
+    assert full == 10
+    assert len(client.get_request_page_list('q', per_page * 10, SearchLimits(max_results=per_page * 2 + 1))) == 3
+    assert len(client.get_request_page_list('q', per_page * 10, SearchLimits())) == 10
+    assert len(client.get_request_page_list('q', per_page, SearchLimits(max_results=per_page * 5))) == 1
+
+
+def test_search_stops_at_the_result_target(mock_server):
+    urls = mock_server(results=1000)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    servers = client.search('product:nginx', 1000, limits=SearchLimits(max_results=250))
+    assert len(servers) == 250
+    assert not servers.complete and servers.reason == MAX_RESULTS
+    # The mock server returns distinct addresses, three pages reach the target.
+    assert stats(urls)['shodan']['requests'] == 3
+
+
+def test_page_cap_marks_the_result_truncated(mock_server):
+    urls = mock_server(results=700)
+    client = ZoomeyeClient('key', base_url=urls['zoomeye'], rate_limit=1000)
+    client._MAX_PAGES = 5
+    count = client.count('q')
+    limits = SearchLimits()
+    servers = client.search('q', count, limits=limits)
+    assert len(servers) == client.get_max_results() < count
+    assert not servers.complete and servers.reason == TRUNCATED
+    assert limits.truncated == count - client.get_max_results()
+
+
+def test_search_stops_at_the_deadline(mock_server):
+    urls = mock_server(results=3000, latency=0.2)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=1)
+    started = time.monotonic()
+    servers = client.search('product:nginx', 3000, limits=SearchLimits(timeout=0.5))
+    assert time.monotonic() - started < 1.5
+    assert servers.reason == DEADLINE
+    assert len(servers) < 3000
+
+
+def test_search_stops_when_cancelled(mock_server):
+    urls = mock_server(results=3000, latency=0.2)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=1)
+    token = CancelToken()
+    gevent.spawn_later(0.3, token.cancel)
+    servers = client.search('product:nginx', 3000, limits=SearchLimits(cancel=token))
+    assert servers.reason == CANCELLED
+    assert len(servers) < 3000
+
+
+def test_distributed_search_queues_the_pages_of_the_target(mock_server, tmp_path):
+    urls = mock_server(results=1000)
+    queue = WorkQueue(str(tmp_path / 'tasks.sqlite'))
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    worker = PageWorker(queue, {'shodan': ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)})
+    greenlet = gevent.spawn(worker.run, idle_exit=0.5, poll=0.05)
+    servers = distributed_search(client, 'product:nginx', queue, 1000, poll=0.05,
+                                 limits=SearchLimits(max_results=250, timeout=10))
+    greenlet.join()
+    queue.close()
+    assert worker.completed == 3
+    assert len(servers) == 250
+    assert servers.reason == MAX_RESULTS
@@ -0,0 +1,53 @@
+from engine.clients import ShodanClient
+from utils.metrics import Histogram, MetricsHook, MetricsRegistry
+
+
+class PageCounter(MetricsHook):
+    def __init__(self):
+        self.items = []
+        self.requests = 0
+
+    def on_request_start(self, engine, request):
+        return engine
+
+    def on_request_end(self, engine, request, context, response=None, error=None, seconds=0.0):
+        assert context == engine
+        self.requests += 1
+
+    def on_page(self, engine, items, decode_seconds):
+        self.items.append(items)
+
+
+def test_histogram_quantiles_interpolate_inside_the_bucket():
+    histogram = Histogram(buckets=(1, 2, 4))
+    assert histogram.quantile(0.5) == 0
+    for value in (0.5, 1.5, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(1, 1), (2, 3), (4, 4), (float('inf'), 4)]
+    assert histogram.quantile(0.5) == 1.5
+    assert histogram.quantile(1.0) == 4
+    overflow = Histogram(buckets=(1, 2, 4))
+    overflow.observe(10)
+    # Nothing is known above the last bound, its value is the estimate.
+    assert overflow.quantile(0.99) == 4
+
+
+def test_search_metrics_are_exported_to_prometheus(mock_server):
+    urls = mock_server(results=300)
+    metrics = MetricsRegistry()
+    hook = PageCounter()
+    metrics.add_hook(hook)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, metrics=metrics)
+    assert len(client.search('product:nginx', 300)) == 300
+    assert hook.items == [100, 100, 100] and hook.requests == 3
+    text = metrics.to_prometheus()
+    lines = text.splitlines()
+    assert '# HELP jixer_requests_total Requests sent to the API.' in lines
+    assert '# TYPE jixer_requests_total counter' in lines
+    assert 'jixer_requests_total{engine="shodan"} 3' in lines
+    assert 'jixer_results_total{engine="shodan"} 300' in lines
+    assert 'jixer_responses_total{engine="shodan",status="200"} 3' in lines
+    assert '# TYPE jixer_request_duration_seconds histogram' in lines
+    assert 'jixer_request_duration_seconds_bucket{engine="shodan",le="+Inf"} 3' in lines
+    assert 'jixer_request_duration_seconds_count{engine="shodan"} 3' in lines
+    assert text.endswith('\n')
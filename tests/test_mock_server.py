@@ -0,0 +1,43 @@
+import time
+
+import gevent
+import requests
+
+
+def root(urls: dict) -> str:
+    return urls['shodan'].split('/shodan/')[0]
+
+
+def test_pages_and_stats(mock_server):
+    urls = mock_server(results=250, page_size=50)
+    page = requests.get(urls['shodan'] + 'search', params={'query': 'q', 'page': 5}).json()
+    assert page['total'] == 250
+    assert [match['ip_str'] for match in page['matches']][:2] == ['10.0.0.200', '10.0.0.201']
+    assert requests.get(urls['shodan'] + 'search', params={'query': 'q', 'page': 6}).json()['matches'] == []
+    assert requests.get(root(urls) + '/_stats').json() == {'shodan': {'requests': 2, 'throttled': 0, 'errors': 0}}
+
+
+def test_injected_failures(mock_server):
+    throttled = mock_server(throttle_rate=1.0, retry_after=7)
+    response = requests.get(throttled['shodan'] + 'search', params={'query': 'q'})
+    assert response.status_code == 429 and response.headers['Retry-After'] == '7'
+    failing = mock_server(error_rate=1.0)
+    assert requests.get(failing['zoomeye'] + 'search', params={'query': 'q'}).status_code >= 500
+    assert requests.get(root(failing) + '/_stats').json()['zoomeye']['errors'] == 1
+
+
+def test_key_rate_limits_each_key(mock_server):
+    urls = mock_server(key_rate=1)
+    statuses = [requests.get(urls['shodan'] + 'search', params={'query': 'q', 'key': key}).status_code
+                for key in ('a', 'a', 'b')]
+    assert statuses == [200, 429, 200]
+
+
+def test_many_connections_are_accepted_at_once(mock_server):
+    urls = mock_server(results=100, latency=0.3)
+    started = time.monotonic()
+    jobs = [gevent.spawn(requests.get, urls['shodan'] + 'search', params={'query': 'q'}) for _ in range(50)]
+    gevent.joinall(jobs)
+    assert all(job.value.status_code == 200 for job in jobs)
+    # Connections beyond the listen backlog would wait a second for the SYN retransmission.
+    assert time.monotonic() - started < 1.0
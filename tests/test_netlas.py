@@ -0,0 +1,38 @@
+from engine.clients import NetlasClient
+from utils.journal import PageJournal
+from utils.limits import SearchLimits
+
+
+def make_client(urls: dict) -> NetlasClient:
+    return NetlasClient('key', base_url=urls['netlas'], rate_limit=1000, bulk_threshold=2000)
+
+
+def test_bulk_download_requests_the_result_target(mock_server):
+    urls = mock_server(results=5000)
+    client = make_client(urls)
+    sizes = []
+    bulk_request = client._bulk_request
+    client._bulk_request = lambda query, count: sizes.append(count) or bulk_request(query, count)
+    servers = client.search('port:443', 5000, limits=SearchLimits(max_results=3000))
+    assert sizes == [3000]
+    assert len(servers) == 3000
+
+
+def test_bulk_download_yields_a_reordered_page_again(mock_server):
+    urls = mock_server(results=2500)
+    client = make_client(urls)
+    pages = dict(client._iter_bulk_batches('port:443', 2500))
+    first = client.get_parsed_ip_list(pages[0])
+    assert [index for index, _ in client._iter_bulk_batches('port:443', 2500, skip={0: first, 1: []})] == [1, 2]
+    assert [index for index, _ in client._iter_bulk_batches('port:443', 2500, skip=(0, 1))] == [2]
+
+
+def test_paged_journal_is_not_resumed_by_the_bulk_download(mock_server, tmp_path):
+    urls = mock_server(results=2500)
+    client = make_client(urls)
+    journal = PageJournal.for_job('netlas', 'port:443', 2500, folder_name=str(tmp_path))
+    journal.page_size = client._RESULTS_PER_PAGE
+    journal.record(0, ['192.0.2.1'])
+    journal.close()
+    servers = client.search('port:443', 2500, journal=journal)
+    assert len(servers) == 2500 and '192.0.2.1' not in servers
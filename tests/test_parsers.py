@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from engine.clients import FofaClient, NetlasClient, ShodanClient, ZoomeyeClient
+
+ENGINES = [
+    ('shodan', ShodanClient, ()),
+    ('fofa', FofaClient, ('user@example.com',)),
+    ('zoomeye', ZoomeyeClient, ()),
+    ('netlas', NetlasClient, ()),
+]
+
+
+@pytest.mark.parametrize('stream_pages', [True, False], ids=['streamed', 'whole'])
+@pytest.mark.parametrize('name, client_class, args', ENGINES, ids=[name for name, *_ in ENGINES])
+def test_pages_are_parsed(mock_server, name, client_class, args, stream_pages):
+    urls = mock_server(results=250)
+    client = client_class('key', *args, base_url=urls[name], rate_limit=1000, host_fields=True,
+                          stream_pages=stream_pages)
+    count = client.count('q')
+    assert count == 250
+    hosts = list(client.iter_hosts('q', count))
+    assert len(hosts) == 250
+    first = hosts[0]
+    assert (first.ip, first.port, first.protocol, first.hostname, first.engine) == \
+        ('10.0.0.0', 80, 'http', 'host0.example.com', name)
+    assert first.timestamp.startswith('2024-01-01')
+    servers = client.search('q', count)
+    assert servers.complete
+    assert sorted(servers) == sorted({host.ip for host in hosts})
+
+
+@pytest.mark.parametrize('name, client_class, args', ENGINES, ids=[name for name, *_ in ENGINES])
+def test_async_pages_are_parsed(mock_server, name, client_class, args):
+    pytest.importorskip('aiohttp')
+    import engine.aio as aio
+
+    urls = mock_server(results=250)
+    async_class = getattr(aio, f'Async{client_class.__name__}')
+
+    async def search():
+        async with async_class('key', *args, base_url=urls[name], rate_limit=1000) as client:
+            count = await client.count('q')
+            return await client.search('q', count)
+
+    servers = asyncio.run(search())
+    assert servers.complete and len(servers) == 250
@@ -0,0 +1,84 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import requests
+
+from engine.clients import ShodanClient
+from utils.metrics import MetricsRegistry
+from utils.ratelimit import RateLimiter, parse_retry_after
+
+
+def make_response(status: int, headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return response
+
+
+def test_retry_waits_the_longer_of_retry_after_and_backoff():
+    client = ShodanClient('key', rate_limit=1000)
+    client.limiter.backoff_base, client.limiter.backoff_max = 1.0, 4.0
+    assert client._retry_delay(1, make_response(429, {'Retry-After': '30'})) == 30
+    assert 0.5 <= client._retry_delay(3, make_response(429, {'Retry-After': '0'})) <= 4
+    assert 0.5 <= client._retry_delay(3, make_response(500, {'Retry-After': '30'})) <= 4
+    assert 0.5 <= client._retry_delay(3) <= 4
+
+
+def test_throttle_halves_the_limit_and_success_raises_it_additively():
+    limiter = RateLimiter(max_concurrency=8, min_concurrency=2)
+    assert limiter.on_throttle() is None
+    assert limiter.limit == 4
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == 2
+    limiter.on_success()
+    assert limiter.limit == 2.5
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.limit == 8
+
+
+def test_throttle_pauses_for_the_announced_delay():
+    limiter = RateLimiter(max_concurrency=4)
+    assert limiter.on_throttle({'Retry-After': '5'}) == 5
+    assert 4.9 < limiter.try_acquire() <= 5
+    assert limiter.in_flight == 0
+
+
+def test_try_acquire_respects_the_bucket_and_the_in_flight_limit():
+    limiter = RateLimiter(rate=10, burst=2, max_concurrency=3)
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    # The bucket is empty, the next token arrives after a tenth of a second.
+    assert 0.05 < limiter.try_acquire() <= 0.1
+    unlimited = RateLimiter(max_concurrency=2)
+    assert unlimited.try_acquire() == unlimited.try_acquire() == 0
+    assert unlimited.try_acquire() > 0
+    unlimited.release()
+    assert unlimited.try_acquire() == 0
+
+
+def test_backoff_grows_up_to_the_maximum():
+    limiter = RateLimiter(backoff_base=1.0, backoff_max=4.0)
+    assert all(0.5 <= limiter.backoff(1) <= 1 for _ in range(20))
+    assert all(0.5 <= limiter.backoff(10) <= 4 for _ in range(20))
+
+
+def test_parse_retry_after_forms():
+    assert parse_retry_after({'Retry-After': '12'}) == 12
+    moment = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 < parse_retry_after({'Retry-After': moment}) <= 60
+    assert parse_retry_after({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '7'}) == 7
+    assert 25 < parse_retry_after({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(time.time() + 30)}) <= 30
+    assert parse_retry_after({'X-RateLimit-Remaining': '3', 'X-RateLimit-Reset': '7'}) is None
+    assert parse_retry_after({}) is None
+
+
+def test_throttled_search_retries_and_completes(mock_server):
+    urls = mock_server(results=1000, throttle_rate=0.3, retry_after=0, seed=3)
+    metrics = MetricsRegistry()
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000, concurrency=4, metrics=metrics)
+    client.limiter.backoff_base, client.limiter.backoff_max = 0.01, 0.05
+    assert len(client.search('product:nginx', 1000)) == 1000
+    assert metrics.get('shodan').retries['throttled'] > 0
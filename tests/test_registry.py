@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from engine.clients import FofaClient, ShodanClient
+from engine.registry import ENGINES, EngineRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RecordingClient:
+    def __init__(self, api_key=None, region=None, **options):
+        self.api_key = api_key
+        self.region = region
+        self.options = options
+
+
+def test_registry_imports_no_backend():
+    code = ('import sys; from engine.registry import ENGINES; ENGINES.lazy(["shodan"]); '
+            'print(sorted(name for name in ("gevent", "requests", "aiohttp") if name in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == '[]'
+
+
+def test_lazy_clients_are_created_on_first_access(monkeypatch):
+    monkeypatch.setenv('SHODAN_API_KEY', 'shodan-key')
+    monkeypatch.setenv('FOFA_API_KEY', 'fofa-key')
+    monkeypatch.setenv('FOFA_EMAIL', 'user@example.com')
+    engines = ENGINES.lazy(['shodan', 'fofa'], rate_limit=5)
+    assert list(engines) == ['shodan', 'fofa'] and engines.created() == {}
+    shodan = engines['shodan']
+    assert isinstance(shodan, ShodanClient) and shodan.api_key == 'shodan-key'
+    assert engines['shodan'] is shodan
+    assert list(engines.created()) == ['shodan']
+    fofa = engines['fofa']
+    assert isinstance(fofa, FofaClient) and fofa.PARAMS['email'] == 'user@example.com'
+    with pytest.raises(KeyError):
+        engines['zoomeye']
+
+
+def test_unknown_engines_and_backends_are_key_errors():
+    with pytest.raises(KeyError):
+        ENGINES.create('censys')
+    assert ENGINES.names('asyncio') == ['shodan', 'netlas', 'fofa', 'zoomeye']
+    registry = EngineRegistry()
+    registry.register('custom', client='tests.test_registry:RecordingClient')
+    with pytest.raises(KeyError):
+        registry.create('custom', backend='asyncio')
+
+
+def test_registered_engine_reads_its_settings(monkeypatch):
+    monkeypatch.setenv('CUSTOM_API_KEY', 'custom-key')
+    monkeypatch.setenv('CUSTOM_REGION', 'eu')
+    registry = EngineRegistry()
+    registry.register('custom', client='tests.test_registry:RecordingClient')
+    assert registry.names() == ['custom'] and registry.names('asyncio') == []
+    client = registry.create('custom', timeout=3)
+    assert (client.api_key, client.region, client.options) == ('custom-key', None, {'timeout': 3})
+    registry.register('custom', settings={'api_key': 'CUSTOM_API_KEY', 'region': 'CUSTOM_REGION'})
+    assert registry.create('custom').region == 'eu'
@@ -0,0 +1,73 @@
+import json
+from http import HTTPStatus
+
+import gevent
+
+from engine.clients import ShodanClient, ZoomeyeClient
+from jixer_service import Schedule, SearchService, ServiceApp
+
+
+def make_service(urls: dict, max_searches: int = 8) -> SearchService:
+    return SearchService({'shodan': ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)}, max_searches)
+
+
+def call(app: ServiceApp, path: str, query: str = '') -> tuple[str, bytes]:
+    status = []
+    body = b''.join(app({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query},
+                        lambda line, headers: status.append(line)))
+    return status[0], body
+
+
+def test_search_publishes_one_batch_per_page(mock_server):
+    urls = mock_server(results=450)
+    service = make_service(urls)
+    flight = service.search('shodan', 'product:nginx')
+    batches = list(flight.follow())
+    assert flight.complete
+    assert flight.pages == len(batches) == 5
+    ips = [ip for batch in batches for ip in batch]
+    assert len(ips) == len(set(ips)) == flight.results
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    assert set(ips) == set(client.search('product:nginx', 450))
+    service.close()
+
+
+def test_busy_service_refuses_new_searches(mock_server):
+    urls = mock_server(results=300, latency=0.2)
+    service = make_service(urls, max_searches=1)
+    app = ServiceApp(service)
+    flight = service.search('shodan', 'product:nginx')
+    assert service.search('shodan', 'product:nginx') is flight
+    assert service.search('shodan', 'product:apache') is None
+    status, body = call(app, '/search', 'engine=shodan&query=product:apache')
+    assert status == f'{HTTPStatus.SERVICE_UNAVAILABLE.value} {HTTPStatus.SERVICE_UNAVAILABLE.phrase}'
+    assert 'busy' in json.loads(body)['error']
+    list(flight.follow())
+    # Let the finished search free its slot.
+    gevent.sleep(0.01)
+    assert service.search('shodan', 'product:apache') is not None
+    service.close()
+
+
+def test_capped_run_keeps_the_schedule_results(mock_server):
+    urls = mock_server(results=300)
+    client = ZoomeyeClient('key', base_url=urls['zoomeye'], rate_limit=1000)
+    service = SearchService({'zoomeye': client})
+    schedule = service.add_schedule(Schedule('nginx', 'zoomeye', 'app:nginx', 3600))
+    service._run_schedule(schedule)
+    assert schedule.error is None
+    results = schedule.results
+    assert len(results) == 300
+
+    # The results now exceed the page cap and cannot be split by a facet.
+    client._MAX_PAGES = 5
+    client._SHARD_FACETS = []
+    flight = service.search('zoomeye', 'app:nginx')
+    list(flight.follow())
+    assert not flight.complete
+    assert flight.truncated == 200
+    gevent.sleep(0.01)
+    service._run_schedule(schedule)
+    assert 'paging limit' in schedule.error
+    assert schedule.results is results
+    service.close()
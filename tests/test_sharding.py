@@ -0,0 +1,68 @@
+import ipaddress
+import zlib
+
+from engine.clients import ShodanClient
+from engine.sharding import QuerySharder
+from utils.limits import MAX_RESULTS, MISSING_PAGES, TRUNCATED, SearchLimits
+
+
+class FlakyShodanClient(ShodanClient):
+    """
+    Shodan client failing the pages of the shard of one country.
+    """
+
+    def _fetch_page(self, request) -> list:
+        if 'country:"US"' in request.kwargs['params'].get('query', ''):
+            return []
+        return super()._fetch_page(request)
+
+
+class DisjointShodanClient(ShodanClient):
+    """
+    Shodan client giving every shard query its own addresses, the mock server returns the same ones for all.
+    """
+
+    def _fetch_page(self, request) -> list:
+        items = super()._fetch_page(request)
+        offset = zlib.crc32(request.kwargs['params'].get('query', '').encode()) % 200 * 65536
+        for item in items:
+            item['ip_str'] = str(ipaddress.IPv4Address(item['ip_str']) + offset)
+        return items
+
+
+def test_sharded_search_is_complete(mock_server):
+    urls = mock_server(results=1000)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    sharder = QuerySharder(client, max_results=300)
+    assert sharder.needs_sharding(1000)
+    servers = sharder.search('product:nginx', 1000)
+    assert servers.complete and servers.reason is None
+    assert len(servers) > 0
+
+
+def test_sharded_search_reports_missing_pages(mock_server):
+    urls = mock_server(results=1000)
+    client = FlakyShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    servers = QuerySharder(client, max_results=300).search('product:nginx', 1000)
+    assert not servers.complete
+    assert servers.reason == MISSING_PAGES
+
+
+def test_unsplittable_shard_is_truncated(mock_server):
+    urls = mock_server(results=1000)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    client._SHARD_FACETS = []
+    limits = SearchLimits()
+    servers = QuerySharder(client, max_results=300).search('product:nginx', 1000, limits)
+    assert len(servers) == 300
+    assert not servers.complete and servers.reason == TRUNCATED
+    assert limits.truncated == 700
+
+
+def test_sharded_search_stops_at_the_result_target(mock_server):
+    urls = mock_server(results=1000)
+    client = DisjointShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    limits = SearchLimits(max_results=250)
+    servers = QuerySharder(client, max_results=300).search('product:nginx', 1000, limits)
+    assert len(servers) == limits.results == 250
+    assert servers.reason == MAX_RESULTS
@@ -0,0 +1,101 @@
+import time
+
+import gevent
+import pytest
+
+from engine.clients import ShodanClient
+from engine.distributed import PageWorker, distributed_search
+from utils.limits import DEADLINE, SearchLimits
+from utils.workqueue import DONE, FAILED, LEASED, PENDING, WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'tasks.sqlite'))
+    yield queue
+    queue.close()
+
+
+def test_pages_are_leased_once(queue):
+    job = queue.submit('shodan', 'q', 300, 3)
+    tasks = [queue.claim('a'), queue.claim('b'), queue.claim('c')]
+    assert [task.page for task in tasks] == [0, 1, 2]
+    assert queue.claim('d') is None
+    assert queue.progress(job)[LEASED] == 3
+
+
+def test_expired_lease_is_leased_again(queue):
+    job = queue.submit('shodan', 'q', 100, 1, max_attempts=2)
+    first = queue.claim('a', lease=0.05)
+    assert queue.claim('b') is None
+    time.sleep(0.1)
+    second = queue.claim('b', lease=0.05)
+    assert (second.page, second.attempts) == (first.page, 2)
+    time.sleep(0.1)
+    # The lease of the last attempt expired, the page is given up.
+    assert queue.claim('c') is None
+    assert queue.progress(job)[FAILED] == 1
+
+
+def test_failed_pages_are_retried_until_max_attempts(queue):
+    job = queue.submit('shodan', 'q', 100, 1, max_attempts=2)
+    queue.fail(queue.claim('a'), 'boom')
+    assert queue.progress(job)[PENDING] == 1
+    queue.fail(queue.claim('a'), 'boom')
+    assert queue.progress(job)[FAILED] == 1
+    assert queue.claim('a') is None
+
+
+def test_completed_pages_hold_their_results(queue):
+    job = queue.submit('shodan', 'q', 200, 2, done={0: ['10.0.0.1']})
+    task = queue.claim('a')
+    assert task.page == 1
+    queue.complete(task, ['10.0.0.2'])
+    assert queue.progress(job)[DONE] == 2
+    assert sorted(queue.results(job)) == ['10.0.0.1', '10.0.0.2']
+
+
+def test_claim_filters_engines(queue):
+    queue.submit('fofa', 'q', 100, 1)
+    assert queue.claim('a', engines=['shodan']) is None
+    assert queue.claim('a', engines=['fofa']).engine == 'fofa'
+
+
+def test_same_search_resumes_the_job(queue):
+    job = queue.submit('shodan', 'q', 200, 2)
+    queue.fail(queue.claim('a'), 'boom')
+    assert queue.submit('shodan', 'q', 200, 2) == job
+
+
+def test_stale_job_is_replaced(queue):
+    queue.submit('shodan', 'q', 200, 2)
+    queue.complete(queue.claim('a'), ['10.0.0.1'])
+    job = queue.submit('shodan', 'q', 300, 3)
+    assert queue.connection.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 1
+    assert queue.progress(job) == {PENDING: 3, LEASED: 0, DONE: 0, FAILED: 0}
+    assert list(queue.results(job)) == []
+
+
+def test_coordinator_stops_at_the_deadline(mock_server, queue):
+    urls = mock_server(results=500)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    started = time.monotonic()
+    servers = distributed_search(client, 'product:nginx', queue, poll=0.05, limits=SearchLimits(timeout=0.3))
+    assert time.monotonic() - started < 2
+    assert not servers.complete and servers.reason == DEADLINE
+    assert len(servers) == 0
+    # The job stays queued for the next run.
+    assert queue.claim('a') is not None
+
+
+def test_workers_fetch_the_queued_pages(mock_server, queue):
+    urls = mock_server(results=500)
+    client = ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)
+    worker = PageWorker(queue, {'shodan': ShodanClient('key', base_url=urls['shodan'], rate_limit=1000)},
+                        concurrency=2)
+    greenlet = gevent.spawn(worker.run, idle_exit=0.5, poll=0.05)
+    servers = distributed_search(client, 'product:nginx', queue, poll=0.05, limits=SearchLimits(timeout=10))
+    greenlet.join()
+    assert servers.complete
+    assert worker.completed == 5
+    assert len(servers) == len(client.search('product:nginx', 500))
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(engine: str, url: str, params: dict) -> str:
+    """
+    Build a cache key for an API request.
+
+    Args:
+        engine (str): Engine name.
+        url (str): Request URL.
+        params (dict): Query string parameters without credentials.
+
+    Returns:
+        str: Hex digest identifying the request.
+    """
+    raw = json.dumps([engine, url, params], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class CachedResponse:
+    """
+    Minimal stand-in for `requests.Response` built from a cached body.
+
+    Attributes:
+        status_code (int): Always 200, only successful responses are cached.
+        text (str): Response body.
+        headers (dict): Empty headers.
+    """
+
+    def __init__(self, text: str):
+        self.status_code = 200
+        self.text = text
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache:
+    """
+    Persistent cache of API response bodies stored in a local SQLite file.
+
+    Bodies are stored zlib-compressed. Each lookup takes the caller's TTL, so every engine
+    can keep its own freshness window in one shared file. When the total stored size
+    exceeds `max_size`, the least recently used entries are evicted.
+
+    Attributes:
+        path (str): Path of the SQLite database.
+        max_size (int): Maximum total size of the stored bodies in bytes.
+    """
+
+    def __init__(self, path: str = '.cache/responses.sqlite', max_size: int = 256 * 1024 * 1024):
+        """
+        Initializes the ResponseCache object.
+
+        Args:
+            path (str): Path of the SQLite database, created if missing.
+            max_size (int): Maximum total size of the stored bodies in bytes.
+        """
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = path
+        self.max_size = max_size
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, engine TEXT, body BLOB, size INTEGER, created REAL, accessed REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, key: str, ttl: float) -> str | None:
+        """
+        Get a cached response body.
+
+        Args:
+            key (str): Cache key.
+            ttl (float): Maximum age of the entry in seconds.
+
+        Returns:
+            str | None: Response body, None if missing or expired.
+        """
+        row = self.connection.execute('SELECT body, created FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        body, created = row
+        now = time.time()
+        if now - created > ttl:
+            self.delete(key)
+            return None
+        self.connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+        return zlib.decompress(body).decode()
+
+    def set(self, key: str, engine: str, body: str):
+        """
+        Store a response body.
+
+        Args:
+            key (str): Cache key.
+            engine (str): Engine name, used by clear().
+            body (str): Response body.
+        """
+        compressed = zlib.compress(body.encode())
+        now = time.time()
+        self.delete(key)
+        self.connection.execute(
+            'INSERT INTO responses (key, engine, body, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+            (key, engine, compressed, len(compressed), now, now))
+        self._size += len(compressed)
+        if self._size > self.max_size:
+            self._evict()
+
+    def delete(self, key: str):
+        """
+        Remove an entry if present.
+
+        Args:
+            key (str): Cache key.
+        """
+        row = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._size -= row[0]
+
+    def _evict(self):
+        """
+        Remove least recently used entries until the cache fits into max_size.
+        """
+        target = self.max_size * 0.9
+        while self._size > target:
+            rows = self.connection.execute(
+                'SELECT key, size FROM responses ORDER BY accessed LIMIT 100').fetchall()
+            if not rows:
+                self._size = 0
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                self._size -= size
+                if self._size <= target:
+                    break
+            self.connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+        logger.info(f'Response cache evicted down to {self._size} bytes')
+
+    def clear(self, engine: str = None):
+        """
+        Remove all entries, or only the entries of one engine.
+
+        Args:
+            engine (str): Engine name, all engines if omitted.
+        """
+        if engine is None:
+            self.connection.execute('DELETE FROM responses')
+        else:
+            self.connection.execute('DELETE FROM responses WHERE engine = ?', (engine,))
+        self._size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaStore:
+    """
+    State of the incremental runs of (engine, query) pairs, stored in a local SQLite file.
+
+    For every pair the store keeps the start time of the last run and the known IP
+    addresses with the time each one was last returned by the engine.
+
+    Attributes:
+        path (str): Path of the SQLite database.
+    """
+
+    def __init__(self, path: str = '.delta/state.sqlite'):
+        """
+        Initializes the DeltaStore object.
+
+        Args:
+            path (str): Path of the SQLite database, created if missing.
+        """
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, engine TEXT, query TEXT, last_run REAL)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS hosts (key TEXT, ip TEXT, last_seen REAL, PRIMARY KEY (key, ip)) '
+            'WITHOUT ROWID')
+
+    @staticmethod
+    def _key(engine: str, query: str) -> str:
+        return hashlib.sha1(f'{engine}\n{query.strip()}'.encode()).hexdigest()
+
+    def last_run(self, engine: str, query: str) -> float | None:
+        """
+        Get the start time of the last run of a query.
+
+        Args:
+            engine (str): Engine name.
+            query (str): Search query.
+
+        Returns:
+            float | None: Unix timestamp, None if the query was never run.
+        """
+        row = self.connection.execute('SELECT last_run FROM runs WHERE key = ?', (self._key(engine, query),)).fetchone()
+        return row[0] if row else None
+
+    def known(self, engine: str, query: str) -> set[str]:
+        """
+        Get the IP addresses known for a query.
+
+        Args:
+            engine (str): Engine name.
+            query (str): Search query.
+
+        Returns:
+            set[str]: Known IP addresses.
+        """
+        rows = self.connection.execute('SELECT ip FROM hosts WHERE key = ?', (self._key(engine, query),))
+        return {ip for ip, in rows}
+
+    def update(self, engine: str, query: str, ips, started: float, full: bool,
+               expire_after: float) -> tuple[list[str], list[str]]:
+        """
+        Merge the results of a run into the state and compute the changes.
+
+        After a full run every known address missing from the results is removed. After an
+        incremental run the results only hold the hosts updated since the last run, so an
+        address is removed once the engine has not returned it for `expire_after` seconds.
+
+        Args:
+            engine (str): Engine name.
+            query (str): Search query.
+            ips: IP addresses returned by the run.
+            started (float): Unix timestamp of the start of the run.
+            full (bool): The run fetched the complete result set of the query.
+            expire_after (float): Seconds after which an address not returned again is removed.
+
+        Returns:
+            tuple[list[str], list[str]]: Added and removed IP addresses.
+        """
+        key = self._key(engine, query)
+        known = self.known(engine, query)
+        current = set(ips)
+        added = [ip for ip in current if ip not in known]
+        self.connection.execute('BEGIN')
+        try:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO hosts (key, ip, last_seen) VALUES (?, ?, ?)',
+                ((key, ip, started) for ip in current))
+            if full:
+                removed = [ip for ip in known if ip not in current]
+            else:
+                removed = [ip for ip, in self.connection.execute(
+                    'SELECT ip FROM hosts WHERE key = ? AND last_seen < ?', (key, started - expire_after))]
+            self.connection.executemany('DELETE FROM hosts WHERE key = ? AND ip = ?', ((key, ip) for ip in removed))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO runs (key, engine, query, last_run) VALUES (?, ?, ?, ?)',
+                (key, engine, query.strip(), started))
+            self.connection.execute('COMMIT')
+        except sqlite3.Error:
+            self.connection.execute('ROLLBACK')
+            raise
+        logger.info(f'{engine}: {len(added)} added and {len(removed)} removed servers for the query: {query}')
+        return added, removed
+
+    def forget(self, engine: str, query: str):
+        """
+        Drop the state of a query, its next run is a full run.
+
+        Args:
+            engine (str): Engine name.
+            query (str): Search query.
+        """
+        key = self._key(engine, query)
+        self.connection.execute('DELETE FROM hosts WHERE key = ?', (key,))
+        self.connection.execute('DELETE FROM runs WHERE key = ?', (key,))
+
+    def close(self):
+        self.connection.close()
@@ -1,3 +1,14 @@
 class NullResultException(Exception):
     def __init__(self):
         super().__init__('Number of results should be greater than zero')
+
+
+class KeyPoolExhaustedException(Exception):
+    def __init__(self, engine: str):
+        super().__init__(f'No API key of the {engine} engine has quota left')
+
+
+class IncompleteSearchException(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f'The search stopped before all its pages were fetched ({reason})')
+        self.reason = reason
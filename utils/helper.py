@@ -1,9 +1,15 @@
 import base64
 import os
 import logging
+import sqlite3
+from collections.abc import Iterable
 
 from datetime import datetime
 
+from utils.hosts import HostRecord
+from utils.ipset import IPSet
+from utils.sinks import EXTENSIONS, open_record_sink
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,21 +28,23 @@ def query_to_bs64(query_str: str) -> str:
     return encoded_query.decode()
 
 
-def ipv4_sort(ip_list):
+def get_results_path(file_name='', folder_name='results') -> str:
     """
-    Sort a list of IPV4 addresses.
+    Build the path of a results file, creating the folder if needed.
+
     Args:
-        ip_list (list): A list of IPV4 addresses.
+        file_name (str): File name, a timestamped name is generated if empty.
+        folder_name (str): Folder name to save results.
 
     Returns:
-        list : A sorted list of IPV4 addresses.
+        str: Path of the results file.
     """
-
-    def ip_key(ip):
-        parts = ip.split('.')
-        return [int(part) for part in parts]
-
-    return sorted(ip_list, key=ip_key)
+    if not os.path.exists(folder_name):
+        os.makedirs(folder_name)
+    if not file_name:
+        current_datetime = datetime.now()
+        file_name = f'{current_datetime.strftime("%Y_%m_%d_%H_%M_%S")}.txt'
+    return f'{folder_name}/{file_name}'
 
 
 def save_results(query: str, servers: list[str], file_name='', folder_name='results') -> bool:
@@ -52,16 +60,134 @@ def save_results(query: str, servers: list[str], file_name='', folder_name='resu
     Returns:
         bool: True if the results were successfully saved, False in case of an error.
     """
-    if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
+    file_path = get_results_path(file_name, folder_name)
+    try:
+        with open(file_path, 'w') as file:
+            file.writelines(f'{server}\n' for server in servers)
+        logger.info(
+            f'Results for the query {query} were successfully written to the file "{file_path}".')
+        return True
+    except IOError as e:
+        logger.error(f'An error occurred while writing results to the file: {e}')
+
+
+def save_delta_results(query: str, added: list[str], removed: list[str], file_name='', folder_name='results') -> bool:
+    """
+    Save the servers added and removed since the last run of a query to two files.
+
+    The files are named after `file_name` with an `_added` and a `_removed` suffix.
+
+    Args:
+        query (str): Search query.
+        added (list[str]): IP addresses added since the last run.
+        removed (list[str]): IP addresses removed since the last run.
+        file_name (str): File name to derive the names of both files from.
+        folder_name (str): Folder name to save results.
+
+    Returns:
+        bool: True if both files were successfully saved, False in case of an error.
+    """
     if not file_name:
-        current_datetime = datetime.now()
-        file_name = f'{current_datetime.strftime("%Y_%m_%d_%H_%M_%S")}.txt'
-    file_path = f'{folder_name}/{file_name}'
+        file_name = f'{datetime.now().strftime("%Y_%m_%d_%H_%M_%S")}.txt'
+    stem, extension = os.path.splitext(file_name)
+    extension = extension or '.txt'
+    return bool(save_results(query, added, file_name=f'{stem}_added{extension}', folder_name=folder_name)
+                and save_results(query, removed, file_name=f'{stem}_removed{extension}', folder_name=folder_name))
+
+
+def stream_results(query: str, servers: Iterable[str], file_name='', folder_name='results',
+                   flush_every=1000) -> int | None:
+    """
+    Write search results to a file while they are being produced.
+
+    Unlike save_results, the servers are consumed lazily (e.g. from `client.iter_ips`),
+    so memory usage does not depend on the size of the result set. Lines are written in
+    batches of `flush_every`, each followed by a flush.
+
+    Args:
+        query (str): Search query.
+        servers (Iterable[str]): IP addresses to save.
+        file_name (str): File name to save results to.
+        folder_name (str): Folder name to save results.
+        flush_every (int): Number of lines written at once and flushed to disk.
+
+    Returns:
+        int | None: Number of written lines, None in case of an error.
+    """
+    file_path = get_results_path(file_name, folder_name)
+    written = 0
     try:
         with open(file_path, 'w') as file:
+            batch = []
             for server in servers:
-                file.write(server + '\n')
+                batch.append(f'{server}\n')
+                if len(batch) >= flush_every:
+                    file.writelines(batch)
+                    file.flush()
+                    written += len(batch)
+                    batch = []
+            if batch:
+                file.writelines(batch)
+                written += len(batch)
+        logger.info(
+            f'{written} results for the query {query} were written to the file "{file_path}".')
+        return written
+    except IOError as e:
+        logger.error(f'An error occurred while writing results to the file: {e}')
+
+
+def save_host_results(query: str, hosts: Iterable[HostRecord], file_name='', folder_name='results',
+                      format: str = None) -> int | None:
+    """
+    Stream host records to a JSON lines, CSV or SQLite file.
+
+    Args:
+        query (str): Search query, stored with every record.
+        hosts (Iterable[HostRecord]): Host records to save, e.g. from `client.iter_hosts`.
+        file_name (str): File name to save results to, a timestamped name is generated if empty.
+        folder_name (str): Folder name to save results.
+        format (str): jsonl, csv or sqlite, guessed from the file extension if omitted.
+
+    Returns:
+        int | None: Number of written records, None in case of an error.
+    """
+    if not file_name:
+        extension = next(extension for extension, name in EXTENSIONS.items() if name == (format or 'jsonl'))
+        file_name = f'{datetime.now().strftime("%Y_%m_%d_%H_%M_%S")}{extension}'
+    file_path = get_results_path(file_name, folder_name)
+    try:
+        with open_record_sink(file_path, format) as sink:
+            written = sink.write(hosts, query=query)
+        logger.info(f'{written} host records for the query {query} were written to the file "{file_path}".')
+        return written
+    except (IOError, sqlite3.Error, ValueError) as e:
+        logger.error(f'An error occurred while writing host records to the file: {e}')
+
+
+def save_tagged_results(query: str, servers: dict[str, IPSet], file_name='', folder_name='results') -> bool:
+    """
+    Save merged search results with the engines that found each server.
+
+    Every line holds an IP address and a comma-separated list of engines, separated by a tab.
+
+    Args:
+        query (str): Search query.
+        servers (dict[str, IPSet]): IP addresses found by each engine.
+        file_name (str): File name to save results to.
+        folder_name (str): Folder name to save results.
+
+    Returns:
+        bool: True if the results were successfully saved, False in case of an error.
+    """
+    file_path = get_results_path(file_name, folder_name)
+    merged = IPSet()
+    for ips in servers.values():
+        merged = merged | ips
+    names = sorted(servers)
+    try:
+        with open(file_path, 'w') as file:
+            file.writelines(f'{server}\t{",".join(name for name in names if server in servers[name])}\n'
+                            for server in merged)
         logger.info(
             f'Results for the query {query} were successfully written to the file "{file_path}".')
         return True
@@ -0,0 +1,85 @@
+HOST_FIELDS = ('ip', 'port', 'protocol', 'hostname', 'engine', 'timestamp')
+
+
+class HostRecord:
+    """
+    One service of a host found by an engine.
+
+    Records are kept small with `__slots__`, so millions of them can be streamed to a sink
+    without the overhead of a dict per record.
+
+    Attributes:
+        ip (str): IP address.
+        port (int | None): Port of the service.
+        protocol (str | None): Protocol of the service as reported by the engine, e.g. http.
+        hostname (str | None): Host name of the service, None if the engine only knows the IP address.
+        engine (str | None): Engine that found the service.
+        timestamp (str | None): Time the engine last saw the service, in the engine's format.
+    """
+
+    __slots__ = HOST_FIELDS
+
+    def __init__(self, ip: str, port: int = None, protocol: str = None, hostname: str = None,
+                 engine: str = None, timestamp: str = None):
+        self.ip = ip
+        self.port = port
+        self.protocol = protocol
+        self.hostname = hostname
+        self.engine = engine
+        self.timestamp = timestamp
+
+    def as_tuple(self) -> tuple:
+        return self.ip, self.port, self.protocol, self.hostname, self.engine, self.timestamp
+
+    def as_dict(self) -> dict:
+        return dict(zip(HOST_FIELDS, self.as_tuple()))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, HostRecord) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self) -> int:
+        return hash(self.as_tuple())
+
+    def __repr__(self) -> str:
+        return f'HostRecord({", ".join(f"{name}={value!r}" for name, value in self.as_dict().items())})'
+
+
+def parse_port(value) -> int | None:
+    """
+    Convert a port reported by an engine to an integer.
+
+    Args:
+        value: Port as a number or a string.
+
+    Returns:
+        int | None: Port, None if it is missing or invalid.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def first_hostname(value, ip: str = None) -> str | None:
+    """
+    Pick the host name of a service from an engine field.
+
+    Args:
+        value: Host name, list of host names or URL-like host (e.g. Fofa's `https://example.com:8443`).
+        ip (str): IP address of the service, a host name equal to it is dropped.
+
+    Returns:
+        str | None: First host name, None if there is none.
+    """
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    if not value or not isinstance(value, str):
+        return None
+    hostname = value.split('://', 1)[-1].split('/', 1)[0]
+    if hostname.startswith('['):
+        hostname = hostname[1:].split(']', 1)[0]
+    elif hostname.count(':') == 1:
+        hostname = hostname.split(':', 1)[0]
+    if not hostname or hostname == ip:
+        return None
+    return hostname
@@ -0,0 +1,455 @@
+import socket
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+from heapq import merge
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Typecode of a 4-byte unsigned integer, 'I' on every common platform.
+_V4_TYPECODE = next(code for code in ('I', 'L') if array(code).itemsize == 4)
+_V6_HALF = 1 << 64
+_V6_MASK = _V6_HALF - 1
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+_CHUNK = 1 << 16
+
+
+def ip_to_int(ip: str) -> tuple[int, int]:
+    """
+    Convert an IP address to its version and integer value.
+
+    Args:
+        ip (str): IPv4 or IPv6 address.
+
+    Returns:
+        tuple[int, int]: IP version (4 or 6) and the address as an integer.
+
+    Raises:
+        ValueError: If the address is not a valid IPv4 or IPv6 address.
+    """
+    try:
+        if ':' in ip:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip.strip()), 'big')
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip.strip()), 'big')
+    except (OSError, TypeError):
+        raise ValueError(f'Invalid IP address: {ip!r}')
+
+
+def int_to_ip(version: int, value: int) -> str:
+    """
+    Convert an integer back to the text form of an IP address.
+
+    Args:
+        version (int): IP version (4 or 6).
+        value (int): Address as an integer.
+
+    Returns:
+        str: IP address.
+    """
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, 'big'))
+    return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, 'big'))
+
+
+def ip_sort_key(ip: str) -> tuple[int, int]:
+    """
+    Sort key placing IPv4 addresses in numeric order before IPv6 addresses.
+
+    Args:
+        ip (str): IP address.
+
+    Returns:
+        tuple[int, int]: IP version and integer value.
+    """
+    return ip_to_int(ip)
+
+
+def _parse_v4_bulk(ips: list[str]) -> tuple[array, int]:
+    """
+    Convert a batch of IPv4 addresses to packed integers in one pass.
+
+    Args:
+        ips (list[str]): IPv4 addresses.
+
+    Returns:
+        tuple[array, int]: Packed addresses and the number of malformed ones.
+    """
+    values = array(_V4_TYPECODE)
+    try:
+        values.frombytes(b''.join([socket.inet_pton(socket.AF_INET, ip) for ip in ips]))
+        invalid = 0
+    except (OSError, TypeError):
+        # Slow path: a malformed address in the batch, convert one by one.
+        invalid = 0
+        for ip in ips:
+            try:
+                values.append(ip_to_int(ip)[1])
+            except ValueError:
+                invalid += 1
+        return values, invalid
+    if _LITTLE_ENDIAN:
+        values.byteswap()
+    return values, invalid
+
+
+def _unique(values: Iterable[int]) -> Iterator[int]:
+    """
+    Drop repeated values from a sorted iterable.
+    """
+    previous = None
+    for value in values:
+        if value != previous:
+            previous = value
+            yield value
+
+
+def _to_numpy(values) -> 'numpy.ndarray':
+    """
+    View packed IPv4 addresses as a numpy array, or convert a list of them.
+    """
+    if isinstance(values, array):
+        return numpy.frombuffer(values, dtype=numpy.uint32)
+    return numpy.array(values, dtype=numpy.uint32)
+
+
+def _from_numpy(values: 'numpy.ndarray') -> array:
+    packed = array(_V4_TYPECODE)
+    packed.frombytes(values.astype(numpy.uint32, copy=False).tobytes())
+    return packed
+
+
+def _use_numpy(*values) -> bool:
+    # The packed IPv4 arrays are handed to numpy, the IPv6 values are Python integers.
+    return numpy is not None and all(isinstance(value, array) for value in values)
+
+
+def _union(left: '_PackedColumn', right: '_PackedColumn') -> Iterable[int]:
+    """
+    Sorted unique values of two columns of the same IP version.
+    """
+    if numpy is not None and left.version == 4:
+        return _from_numpy(numpy.union1d(_to_numpy(left.values()), _to_numpy(right.values())))
+    return _unique(merge(left, right))
+
+
+def _intersect(left, right) -> Iterable[int]:
+    """
+    Values of two sorted sequences of unique values found in both.
+    """
+    if _use_numpy(left, right):
+        return _from_numpy(numpy.intersect1d(_to_numpy(left), _to_numpy(right), assume_unique=True))
+    return _iter_intersect(left, right)
+
+
+def _subtract(left, right) -> Iterable[int]:
+    """
+    Values of a sorted sequence of unique values not found in another one.
+    """
+    if _use_numpy(left, right):
+        return _from_numpy(numpy.setdiff1d(_to_numpy(left), _to_numpy(right), assume_unique=True))
+    return _iter_subtract(left, right)
+
+
+def _iter_intersect(left, right) -> Iterator[int]:
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] < right[j]:
+            i += 1
+        elif left[i] > right[j]:
+            j += 1
+        else:
+            yield left[i]
+            i += 1
+            j += 1
+
+
+def _iter_subtract(left, right) -> Iterator[int]:
+    j = 0
+    for value in left:
+        while j < len(right) and right[j] < value:
+            j += 1
+        if j == len(right) or right[j] != value:
+            yield value
+
+
+class _PackedColumn:
+    """
+    Sorted unique integers of one IP version with a hash set buffer for new values.
+
+    Compacted values live in an array of 4-byte integers (IPv4) or of pairs of 8-byte
+    integers (IPv6). New values are buffered in a set and merged into the array in bulk
+    once the buffer grows past a quarter of the array, which keeps additions amortized
+    O(log n) while the bulk of the data stays packed.
+
+    Merges never unpack the array into a list: IPv4 columns are merged by numpy if it is
+    installed, otherwise (and for IPv6) the sorted values are streamed into a new array.
+    """
+
+    _MIN_BUFFER = 1 << 16
+
+    def __init__(self, version: int):
+        self.version = version
+        self._packed = array(_V4_TYPECODE if version == 4 else 'Q')
+        self._pending = set()
+
+    def _unpack(self) -> Iterator[int]:
+        if self.version == 4:
+            return iter(self._packed)
+        packed = self._packed
+        return (packed[i] << 64 | packed[i + 1] for i in range(0, len(packed), 2))
+
+    def _pack(self, values: Iterable[int]) -> array:
+        if self.version == 4:
+            return array(_V4_TYPECODE, values)
+        packed = array('Q')
+        for value in values:
+            packed.append(value >> 64)
+            packed.append(value & _V6_MASK)
+        return packed
+
+    def _packed_len(self) -> int:
+        return len(self._packed) if self.version == 4 else len(self._packed) // 2
+
+    def _packed_get(self, index: int) -> int:
+        if self.version == 4:
+            return self._packed[index]
+        return self._packed[2 * index] << 64 | self._packed[2 * index + 1]
+
+    def _packed_contains(self, value: int) -> bool:
+        if self.version == 4:
+            index = bisect_left(self._packed, value)
+            return index < len(self._packed) and self._packed[index] == value
+        low, high = 0, self._packed_len()
+        while low < high:
+            middle = (low + high) // 2
+            if self._packed_get(middle) < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self._packed_len() and self._packed_get(low) == value
+
+    def compact(self):
+        if self._pending:
+            self._merge(sorted(self._pending))
+            self._pending = set()
+
+    def _merge(self, values):
+        """
+        Merge new values into the packed array.
+
+        Args:
+            values: Values, sorted unless they are a packed IPv4 array and numpy is installed.
+        """
+        if self.version == 4 and numpy is not None:
+            self._packed = _from_numpy(numpy.union1d(_to_numpy(self._packed), _to_numpy(values)))
+        else:
+            self._packed = self._pack(_unique(merge(self._unpack(), values)))
+
+    def values(self):
+        """
+        Sorted unique values as a sequence (the packed array for IPv4).
+        """
+        self.compact()
+        return self._packed if self.version == 4 else list(self._unpack())
+
+    def replace(self, values: Iterable[int]):
+        self._packed = self._pack(values)
+        self._pending = set()
+
+    def add(self, value: int) -> bool:
+        if value in self._pending or self._packed_contains(value):
+            return False
+        self._pending.add(value)
+        if len(self._pending) > max(self._MIN_BUFFER, self._packed_len() // 4):
+            self.compact()
+        return True
+
+    def extend(self, values: Iterable[int]):
+        self.compact()
+        if not (self.version == 4 and _use_numpy(values)):
+            values = sorted(values)
+        self._merge(values)
+
+    def __contains__(self, value: int) -> bool:
+        return value in self._pending or self._packed_contains(value)
+
+    def __len__(self) -> int:
+        self.compact()
+        return self._packed_len()
+
+    def __iter__(self) -> Iterator[int]:
+        self.compact()
+        return self._unpack()
+
+    @property
+    def nbytes(self) -> int:
+        return self._packed.itemsize * len(self._packed)
+
+
+class IPSet:
+    """
+    Compact set of IP addresses backed by packed integer arrays.
+
+    IPv4 addresses take 4 bytes each and IPv6 addresses 16 bytes each, instead of a
+    Python string object per address. Iteration yields the addresses in numeric order,
+    IPv4 first, so no separate sorting step is needed. Deduplication, sorting and the set
+    operations work in bulk on sorted arrays.
+
+    Empty values are ignored by add() and update(); malformed addresses raise ValueError
+    from add() and are skipped (and counted) by update().
+    """
+
+    def __init__(self, ips: Iterable[str] = ()):
+        """
+        Initializes the IPSet object.
+
+        Args:
+            ips (Iterable[str]): Initial IP addresses.
+        """
+        self._columns = {4: _PackedColumn(4), 6: _PackedColumn(6)}
+        self.update(ips)
+
+    def add(self, ip: str) -> bool:
+        """
+        Add an IP address.
+
+        Args:
+            ip (str): IP address.
+
+        Returns:
+            bool: True if the address was not in the set yet.
+        """
+        if not ip:
+            return False
+        version, value = ip_to_int(ip)
+        return self._columns[version].add(value)
+
+    def update(self, ips: Iterable[str]) -> int:
+        """
+        Add many IP addresses at once.
+
+        Args:
+            ips (Iterable[str]): IP addresses.
+
+        Returns:
+            int: Number of skipped malformed addresses.
+        """
+        v4, v6 = array(_V4_TYPECODE), []
+        batch = []
+        skipped = 0
+        for ip in ips:
+            if not ip:
+                continue
+            if ':' in ip:
+                try:
+                    v6.append(ip_to_int(ip)[1])
+                except ValueError:
+                    skipped += 1
+                continue
+            batch.append(ip)
+            if len(batch) >= _CHUNK:
+                values, invalid = _parse_v4_bulk(batch)
+                v4.extend(values)
+                skipped += invalid
+                batch = []
+        if batch:
+            values, invalid = _parse_v4_bulk(batch)
+            v4.extend(values)
+            skipped += invalid
+        if v4:
+            self._columns[4].extend(v4)
+        if v6:
+            self._columns[6].extend(v6)
+        return skipped
+
+    @classmethod
+    def _from_columns(cls, v4: Iterable[int], v6: Iterable[int]) -> 'IPSet':
+        result = cls()
+        result._columns[4].replace(v4)
+        result._columns[6].replace(v6)
+        return result
+
+    def union(self, other: 'IPSet') -> 'IPSet':
+        return self._from_columns(*(
+            _union(self._columns[version], other._columns[version]) for version in (4, 6)))
+
+    def intersection(self, other: 'IPSet') -> 'IPSet':
+        return self._from_columns(*(
+            _intersect(self._columns[version].values(), other._columns[version].values()) for version in (4, 6)))
+
+    def difference(self, other: 'IPSet') -> 'IPSet':
+        return self._from_columns(*(
+            _subtract(self._columns[version].values(), other._columns[version].values()) for version in (4, 6)))
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def __contains__(self, ip: str) -> bool:
+        try:
+            version, value = ip_to_int(ip)
+        except ValueError:
+            return False
+        return value in self._columns[version]
+
+    def __len__(self) -> int:
+        return len(self._columns[4]) + len(self._columns[6])
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[str]:
+        packed = self._columns[4].values()
+        for start in range(0, len(packed), _CHUNK):
+            chunk = packed[start:start + _CHUNK]
+            if _LITTLE_ENDIAN:
+                chunk.byteswap()
+            raw = chunk.tobytes()
+            yield from map(socket.inet_ntoa, (raw[i:i + 4] for i in range(0, len(raw), 4)))
+        for value in self._columns[6]:
+            yield int_to_ip(6, value)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, IPSet):
+            return NotImplemented
+        return all(list(self._columns[version]) == list(other._columns[version]) for version in (4, 6))
+
+    def __repr__(self) -> str:
+        return f'IPSet(ipv4={len(self._columns[4])}, ipv6={len(self._columns[6])})'
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the packed address arrays in bytes.
+        """
+        return sum(column.nbytes for column in self._columns.values())
+
+    @classmethod
+    def load(cls, path: str) -> 'IPSet':
+        """
+        Read IP addresses from a text file with one address per line.
+
+        Args:
+            path (str): File path.
+
+        Returns:
+            IPSet: Addresses read from the file.
+        """
+        result = cls()
+        with open(path) as file:
+            result.update(line.strip() for line in file)
+        return result
+
+    def save(self, path: str):
+        """
+        Write the addresses in sorted order to a text file, one address per line.
+
+        Args:
+            path (str): File path.
+        """
+        with open(path, 'w') as file:
+            file.writelines(f'{ip}\n' for ip in self)
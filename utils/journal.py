@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PageJournal:
+    """
+    Append-only journal of the finished pages of one (engine, query) job.
+
+    Every finished page is written as one JSON line with its index and extracted IP
+    addresses and flushed right away, so an interrupted pull can be resumed from the
+    pages that are still missing. A truncated last line left by a crash is ignored.
+
+    The first line holds the number of items the query matched, the number of items per
+    page index and the time the journal was created. The pages of a query shift when its
+    count changes, so a journal is discarded instead of resumed when the count or the page
+    size differs or when it is older than `max_age`.
+
+    Attributes:
+        path (str): Path of the journal file.
+        count (int | None): Number of items matching the query, not checked if None.
+        max_age (float): Seconds after which the journal is discarded.
+        page_size (int | None): Number of items per page index, set by the client, not checked if None.
+    """
+
+    _MAX_AGE = 24 * 3600
+
+    def __init__(self, path: str, count: int = None, max_age: float = _MAX_AGE):
+        """
+        Initializes the PageJournal object.
+
+        Args:
+            path (str): Path of the journal file, created on the first record.
+            count (int): Number of items matching the query, not checked if None.
+            max_age (float): Seconds after which the journal is discarded.
+        """
+        self.path = path
+        self.count = count
+        self.max_age = max_age
+        self.page_size = None
+        self._file = None
+
+    @classmethod
+    def for_job(cls, engine: str, query: str, count: int = None, folder_name='.journal',
+                max_age: float = _MAX_AGE) -> 'PageJournal':
+        """
+        Get the journal of a job.
+
+        Args:
+            engine (str): Engine name.
+            query (str): Search query.
+            count (int): Number of items matching the query, not checked if None.
+            folder_name (str): Folder where journals are kept.
+            max_age (float): Seconds after which the journal is discarded.
+
+        Returns:
+            PageJournal: Journal of the job.
+        """
+        digest = hashlib.sha1(f'{engine}\n{query.strip()}'.encode()).hexdigest()[:16]
+        return cls(os.path.join(folder_name, f'{engine}_{digest}.jsonl'), count, max_age)
+
+    def _stale(self, header: dict) -> str | None:
+        """
+        Tell why the journal cannot be resumed.
+
+        Args:
+            header (dict): First line of the journal.
+
+        Returns:
+            str | None: Reason, None if the journal can be resumed.
+        """
+        if 'created' not in header:
+            return 'it has no header'
+        if time.time() - header['created'] > self.max_age:
+            return f'it is older than {self.max_age:.0f}s'
+        if self.count is not None and header.get('count') != self.count:
+            return f'the query now matches {self.count} items instead of {header.get("count")}'
+        if self.page_size is not None and header.get('page_size') != self.page_size:
+            return f'its pages hold {header.get("page_size")} items instead of {self.page_size}'
+        return None
+
+    def load(self) -> dict[int, list[str]]:
+        """
+        Read the finished pages, a stale journal is removed.
+
+        A page recorded more than once, e.g. by a download retried in a different order,
+        holds the addresses of all its records.
+
+        Returns:
+            dict[int, list[str]]: IP addresses of every finished page, by page index.
+        """
+        pages = {}
+        if not os.path.exists(self.path):
+            return pages
+        with open(self.path) as file:
+            try:
+                header = json.loads(file.readline())
+            except json.JSONDecodeError:
+                header = {}
+            reason = self._stale(header)
+            if reason is None:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f'Skipping a damaged line in the journal "{self.path}"')
+                        continue
+                    pages.setdefault(entry['page'], []).extend(entry['ips'])
+        if reason is not None:
+            logger.info(f'Discarding the journal "{self.path}", {reason}')
+            self.remove()
+        return pages
+
+    def record(self, page: int, ips):
+        """
+        Append a finished page and flush it to disk.
+
+        Args:
+            page (int): Page index.
+            ips: IP addresses extracted from the page.
+        """
+        if self._file is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            new = not os.path.exists(self.path)
+            self._file = open(self.path, 'a')
+            if new:
+                self._file.write(json.dumps({'count': self.count, 'page_size': self.page_size,
+                                             'created': time.time()}) + '\n')
+        self._file.write(json.dumps({'page': page, 'ips': list(ips)}) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """
+        Delete the journal once the job is complete.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
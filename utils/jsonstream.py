@@ -0,0 +1,289 @@
+import codecs
+import json
+import re
+import time
+from collections.abc import Callable, Iterable, Iterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_WHITESPACE = ' \t\n\r'
+_SKIP_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DELIMITERS = _WHITESPACE + ',]}'
+# Separators of two object, array or string items in compact JSON and in the default output of json.dumps.
+_ITEM_BOUNDARIES = {'{': ('},{', '}, {'), '[': ('],[', '], ['), '"': ('","', '", "')}
+
+
+def iter_json_items(chunks: Iterable[bytes | str]) -> Iterator:
+    """
+    Decode the items of a JSON array from a stream of chunks.
+
+    Items are yielded as soon as they are complete, so only the current item and the
+    undecoded tail of the stream are kept in memory. A stream of concatenated or
+    newline-delimited JSON documents is accepted as well.
+
+    Args:
+        chunks (Iterable[bytes | str]): Parts of the response body, e.g. `response.iter_content()`.
+
+    Yields:
+        Decoded array items.
+
+    Raises:
+        ValueError: If the stream ends in the middle of an item or contains invalid JSON.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    in_array = None
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = text_decoder.decode(chunk)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and (buffer[position] in _WHITESPACE or buffer[position] == ','):
+                position += 1
+            if position >= len(buffer):
+                break
+            if in_array is None:
+                in_array = buffer[position] == '['
+                if in_array:
+                    position += 1
+                    continue
+            if in_array and buffer[position] == ']':
+                position += 1
+                in_array = False
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The item is not complete yet, wait for the next chunk.
+                break
+            if not isinstance(item, (dict, list, str)) and (end == len(buffer) or buffer[end] not in _DELIMITERS):
+                # A number or literal not followed by a delimiter may continue in the next chunk.
+                break
+            yield item
+            position = end
+    buffer = buffer[position:] + text_decoder.decode(b'', final=True)
+    position = 0
+    while position < len(buffer) and (buffer[position] in _WHITESPACE or buffer[position] in ',]'):
+        position += 1
+    if position < len(buffer):
+        item, end = decoder.raw_decode(buffer, position)
+        yield item
+        if buffer[end:].strip(_WHITESPACE + ',]'):
+            raise ValueError('Unexpected data at the end of the JSON stream')
+
+
+
+_START, _KEY, _VALUE, _ITEMS, _END = range(5)
+
+
+class JsonItemParser:
+    """
+    Push parser collecting the items of one array of a JSON document.
+
+    The document is fed chunk by chunk while it is received. Only the items of the array
+    under `key` of the top-level object (or of a top-level array if `key` is None) are
+    kept, each one passed through `project` as soon as it is decoded, so the whole
+    document is never held in memory, neither as text nor as decoded objects. The other
+    values of the object are decoded and dropped.
+
+    The complete items of a chunk are decoded together in one call, by orjson if it is
+    installed (`pip install orjson`) or by the standard decoder. The buffer is cut at
+    its last `},{`, `],[` or `","`: if the cut is not between two items the batch is not
+    valid JSON, and after a few cuts the items are decoded one at a time instead.
+
+    Attributes:
+        key (str | None): Key of the array in the top-level object.
+        items (list): Projected items decoded so far.
+        seconds (float): Time spent decoding.
+    """
+
+    _BATCH_ATTEMPTS = 3
+
+    def __init__(self, key: str | None, project: Callable = None):
+        """
+        Initializes the JsonItemParser object.
+
+        Args:
+            key (str | None): Key of the array in the top-level object, None for a top-level array.
+            project (Callable): Function applied to every item, e.g. to keep only some fields.
+        """
+        self.key = key
+        self.items = []
+        self.seconds = 0.0
+        self._project = project
+        self._loads = orjson.loads if orjson is not None else json.loads
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._position = 0
+        self._pending = []
+        self._pending_size = 0
+        self._needed = 0
+        self._state = _START
+        self._name = None
+
+    def feed(self, data: bytes | str):
+        """
+        Decode the items completed by a chunk of the document.
+
+        Args:
+            data (bytes | str): Next chunk of the document.
+
+        Raises:
+            ValueError: If the document is not valid JSON.
+        """
+        started = time.monotonic()
+        if isinstance(data, bytes):
+            data = self._text_decoder.decode(data)
+        self._pending.append(data)
+        self._pending_size += len(data)
+        # An incomplete item is decoded again only once the buffer doubled, so items
+        # spread over many small chunks are not rescanned for every chunk.
+        if self._pending_size >= self._needed:
+            self._parse(False)
+        self.seconds += time.monotonic() - started
+
+    def close(self) -> list:
+        """
+        Finish the document.
+
+        Returns:
+            list: Projected items of the array.
+
+        Raises:
+            ValueError: If the document is truncated or not valid JSON.
+        """
+        started = time.monotonic()
+        self._pending.append(self._text_decoder.decode(b'', final=True))
+        self._parse(True)
+        self.seconds += time.monotonic() - started
+        if self._state != _END:
+            raise ValueError('The JSON document ended unexpectedly')
+        if self._buffer[self._position:].strip(_WHITESPACE):
+            raise ValueError('Unexpected data at the end of the JSON document')
+        return self.items
+
+    def _decode_batch(self, buffer: str, position: int) -> int:
+        """
+        Decode the complete items at the start of the buffer at once.
+
+        Args:
+            buffer (str): Buffer positioned on an item of the array.
+            position (int): Position of the item.
+
+        Returns:
+            int: Position after the decoded items, `position` if none was decoded.
+        """
+        boundaries = _ITEM_BOUNDARIES.get(buffer[position])
+        if boundaries is None:
+            return position
+        end = len(buffer)
+        # The last cuts may be in the incomplete item, between objects of a nested list.
+        for _ in range(self._BATCH_ATTEMPTS):
+            cut = buffer.rfind(boundaries[0], position, end)
+            if cut < position:
+                cut = buffer.rfind(boundaries[1], position, end)
+            if cut < position:
+                break
+            try:
+                batch = self._loads('[' + buffer[position:cut + 1] + ']')
+            except ValueError:
+                end = cut
+                continue
+            self.items.extend(batch if self._project is None else map(self._project, batch))
+            return cut + 1
+        return position
+
+    def _parse(self, final: bool):
+        """
+        Decode what the buffer holds, stopping at the first incomplete value.
+
+        Args:
+            final (bool): No more data will be fed.
+        """
+        buffer = self._buffer[self._position:] + ''.join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        self._needed = 0
+        position, state, size, batched = 0, self._state, len(buffer), False
+        raw_decode, skip, items, project = self._decoder.raw_decode, _SKIP_WHITESPACE.match, self.items, self._project
+        while True:
+            position = skip(buffer, position).end()
+            if position >= size or state == _END:
+                break
+            char = buffer[position]
+            if state == _ITEMS:
+                if char == ',':
+                    position += 1
+                    continue
+                if char == ']':
+                    position += 1
+                    state = _END if self.key is None else _KEY
+                    continue
+                if not batched:
+                    batched = True
+                    decoded = self._decode_batch(buffer, position)
+                    if decoded > position and not final:
+                        # The rest is most likely an incomplete item, it is decoded with the next chunk.
+                        position = decoded
+                        self._needed = size - position
+                        break
+                    position = decoded
+                    continue
+            elif state == _START:
+                if char == '{' and self.key is not None:
+                    state = _KEY
+                elif char == '[' and self.key is None:
+                    state = _ITEMS
+                else:
+                    raise ValueError(f'Expected a JSON {"object" if self.key is not None else "array"}, got {char!r}')
+                position += 1
+                continue
+            elif state == _KEY:
+                if char == ',':
+                    position += 1
+                    continue
+                if char == '}':
+                    position += 1
+                    state = _END
+                    continue
+                if char != '"':
+                    raise ValueError(f'Expected a key of the JSON object, got {char!r}')
+            elif char == '[' and self._name == self.key:
+                position += 1
+                state = _ITEMS
+                continue
+            try:
+                value, end = raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if final:
+                    raise ValueError(f'Invalid JSON document: {e}') from e
+                # The value is not complete yet, wait for more data.
+                self._needed = size - position
+                break
+            if not final and not isinstance(value, (dict, list, str)) and (
+                    end == size or buffer[end] not in _DELIMITERS):
+                # A number or literal not followed by a delimiter may continue in the next chunk.
+                break
+            if state == _ITEMS:
+                items.append(value if project is None else project(value))
+                position = end
+            elif state == _KEY:
+                colon = skip(buffer, end).end()
+                if colon >= size:
+                    break
+                if buffer[colon] != ':':
+                    raise ValueError(f'Expected a colon after the key {value!r}')
+                self._name = value
+                position = colon + 1
+                state = _VALUE
+            else:
+                position = end
+                state = _KEY
+        self._buffer, self._position, self._state = buffer, position, state
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+
+from utils.exceptions import KeyPoolExhaustedException
+from utils.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+def split_keys(value) -> list:
+    """
+    Split a credential setting into a list of credentials.
+
+    Args:
+        value: A list of credentials, a comma-separated string or None.
+
+    Returns:
+        list: Credentials, `[None]` if none are set, so that a client always has one key.
+    """
+    if isinstance(value, (list, tuple)):
+        keys = [key for key in value if key]
+    elif isinstance(value, str):
+        keys = [key.strip() for key in value.split(',') if key.strip()]
+    else:
+        keys = []
+    return keys or [None]
+
+
+class PooledKey:
+    """
+    One API key of a pool, with its own request budget and quota.
+
+    Attributes:
+        name (str): Masked key for logs.
+        params (dict): Request parameters holding the credentials.
+        headers (dict): Request headers holding the credentials.
+        limiter (RateLimiter): Request budget of the key.
+        remaining (float | None): Estimated page requests left, None if unknown.
+        exhausted (bool): The key is out of rotation.
+        requests (int): Number of requests sent with the key.
+    """
+
+    def __init__(self, name: str, params: dict, headers: dict, limiter: RateLimiter):
+        self.name = name
+        self.params = params
+        self.headers = headers
+        self.limiter = limiter
+        self.remaining = None
+        self.exhausted = False
+        self.requests = 0
+
+    def snapshot(self) -> dict:
+        return {
+            'remaining': self.remaining,
+            'exhausted': self.exhausted,
+            'requests': self.requests,
+            'limit': round(self.limiter.limit, 2),
+        }
+
+
+class KeyPool:
+    """
+    API keys of one client, spreading in-flight requests across the keys.
+
+    Every request goes to the least loaded key whose own rate limit allows it, so the
+    throughput of the client grows with the number of keys. A throttled key only slows
+    itself down. A key that is rejected by the API or whose quota is used up is taken
+    out of rotation.
+
+    Attributes:
+        engine (str): Engine name, for logs.
+        keys (list[PooledKey]): Keys of the pool.
+        refreshed (bool): The quotas were requested from the API.
+    """
+
+    def __init__(self, engine: str, keys: list[PooledKey]):
+        self.engine = engine
+        self.keys = keys
+        self.refreshed = False
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def active(self) -> list[PooledKey]:
+        return [key for key in self.keys if not key.exhausted]
+
+    def try_acquire(self) -> tuple[PooledKey | None, float]:
+        """
+        Take a slot of the least loaded key that may send a request right away.
+
+        Returns:
+            tuple[PooledKey | None, float]: The key, or None and the seconds to wait before trying again.
+
+        Raises:
+            KeyPoolExhaustedException: If every key is out of rotation.
+        """
+        active = self.active()
+        if not active:
+            raise KeyPoolExhaustedException(self.engine)
+        wait = None
+        for key in sorted(active, key=lambda key: key.limiter.in_flight / key.limiter.limit):
+            key_wait = key.limiter.try_acquire()
+            if key_wait <= 0:
+                key.requests += 1
+                return key, 0.0
+            wait = key_wait if wait is None else min(wait, key_wait)
+        return None, wait
+
+    def acquire(self) -> PooledKey:
+        """
+        Block until one of the keys may send a request.
+
+        Returns:
+            PooledKey: Key to send the request with, release it when the request is done.
+        """
+        key, wait = self.try_acquire()
+        while key is None:
+            time.sleep(wait)
+            key, wait = self.try_acquire()
+        return key
+
+    async def acquire_async(self) -> PooledKey:
+        """
+        Wait on the event loop until one of the keys may send a request.
+
+        Returns:
+            PooledKey: Key to send the request with, release it when the request is done.
+        """
+        key, wait = self.try_acquire()
+        while key is None:
+            await asyncio.sleep(wait)
+            key, wait = self.try_acquire()
+        return key
+
+    def release(self, key: PooledKey):
+        key.limiter.release()
+
+    def charge(self, key: PooledKey, requests: float = 1):
+        """
+        Subtract page requests from the estimated quota of a key.
+
+        Args:
+            key (PooledKey): Key that sent the requests.
+            requests (float): Number of page requests.
+        """
+        if key.remaining is None:
+            return
+        key.remaining -= requests
+        if key.remaining <= 0:
+            self.retire(key, 'the quota is used up')
+
+    def set_quota(self, key: PooledKey, remaining: float | None):
+        """
+        Set the quota reported by the API for a key.
+
+        Args:
+            key (PooledKey): Key.
+            remaining (float | None): Page requests left, None if unknown.
+        """
+        key.remaining = remaining
+        if remaining is not None:
+            logger.info(f'{self.engine} key {key.name}: {remaining:g} requests left')
+            if remaining <= 0:
+                self.retire(key, 'the quota is used up')
+
+    def retire(self, key: PooledKey, reason: str):
+        """
+        Take a key out of rotation.
+
+        Args:
+            key (PooledKey): Key.
+            reason (str): Reason for the logs.
+        """
+        if not key.exhausted:
+            key.exhausted = True
+            logger.warning(f'{self.engine} key {key.name} taken out of rotation: {reason} '
+                           f'({len(self.active())} of {len(self.keys)} keys left)')
+
+    def snapshot(self) -> dict:
+        return {key.name: key.snapshot() for key in self.keys}
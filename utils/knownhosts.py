@@ -0,0 +1,373 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import socket
+import sqlite3
+import struct
+import time
+from collections.abc import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Magic, bits, hashes, count and the capacity the filter was created for.
+_HEADER = struct.Struct('<8sQQQQ')
+_MAGIC = b'JXBLOOM2'
+# The first format has no capacity field, it is estimated from the size of the filter.
+_HEADER_V1 = struct.Struct('<8sQQQ')
+_MAGIC_V1 = b'JXBLOOM1'
+_WORD = struct.Struct('<Q')
+# Setting all bits of a key in one word costs some accuracy, the filter is made larger to make up for it.
+_BLOCKING_OVERHEAD = 1.3
+
+
+def pack_ip(ip: str) -> bytes:
+    """
+    Convert an IP address to its 4- or 16-byte network form.
+
+    Args:
+        ip (str): IPv4 or IPv6 address.
+
+    Returns:
+        bytes: Packed address.
+
+    Raises:
+        ValueError: If the address is not a valid IPv4 or IPv6 address.
+    """
+    try:
+        if ':' in ip:
+            return socket.inet_pton(socket.AF_INET6, ip.strip())
+        return socket.inet_pton(socket.AF_INET, ip.strip())
+    except (OSError, TypeError):
+        raise ValueError(f'Invalid IP address: {ip!r}')
+
+
+class BloomFilter:
+    """
+    Bloom filter stored in a memory-mapped file.
+
+    The file holds a small header followed by the bit array. It is created sparse and
+    mapped, not read, so opening even a filter of hundreds of megabytes is instant and only
+    the touched pages are loaded. The size follows from the capacity and the false
+    positive rate: about 1.5 bytes per key at 1%.
+
+    The filter is register-blocked: all bits of a key are in the same 64-bit word, so a
+    lookup reads one word instead of one byte per hash.
+
+    Attributes:
+        path (str): Path of the filter file.
+        bits (int): Number of bits of the filter.
+        hashes (int): Number of bits set per key.
+        count (int): Number of keys added.
+        capacity (int): Number of keys the filter was created for.
+    """
+
+    def __init__(self, path: str, capacity: int = 100_000_000, error_rate: float = 0.01):
+        """
+        Initializes the BloomFilter object, opening the file if it exists.
+
+        Args:
+            path (str): Path of the filter file.
+            capacity (int): Number of keys the filter is sized for, ignored if the file exists.
+            error_rate (float): False positive rate at capacity, ignored if the file exists.
+        """
+        self.path = path
+        if not os.path.exists(path):
+            optimal_bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+            hashes = min(16, max(1, round(optimal_bits / capacity * math.log(2))))
+            bits = max(64, math.ceil(optimal_bits * _BLOCKING_OVERHEAD / 64) * 64)
+            with open(path, 'wb') as file:
+                file.write(_HEADER.pack(_MAGIC, bits, hashes, 0, capacity))
+                file.truncate(_HEADER.size + bits // 8)
+            logger.info(f'Created a Bloom filter of {bits // 8 / 2 ** 20:.0f} MB for {capacity} keys at {path}')
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._header = None
+        magic = self._map[:8]
+        if magic == _MAGIC:
+            _, self.bits, self.hashes, self.count, self.capacity = _HEADER.unpack_from(self._map)
+            self._header = _HEADER
+        elif magic == _MAGIC_V1:
+            _, self.bits, self.hashes, self.count = _HEADER_V1.unpack_from(self._map)
+            self.capacity = round(self.bits / _BLOCKING_OVERHEAD * math.log(2) / self.hashes)
+            self._header = _HEADER_V1
+        else:
+            self.close()
+            raise ValueError(f'{path} is not a Bloom filter file')
+        self._words = self.bits // 64
+
+    def _locate(self, key: bytes) -> tuple[int, int]:
+        """
+        Get the word of a key and the bits of the key in the word.
+
+        Args:
+            key (bytes): Key.
+
+        Returns:
+            tuple[int, int]: Offset of the word in the file and bit mask.
+        """
+        digest = hashlib.blake2b(key, digest_size=8 + self.hashes).digest()
+        mask = 0
+        for byte in digest[8:]:
+            mask |= 1 << (byte & 63)
+        return self._header.size + int.from_bytes(digest[:8], 'little') % self._words * 8, mask
+
+    def add(self, key: bytes) -> bool:
+        """
+        Add a key.
+
+        Args:
+            key (bytes): Key.
+
+        Returns:
+            bool: True if the key was certainly not in the filter, False if it may have been.
+        """
+        offset, mask = self._locate(key)
+        word, = _WORD.unpack_from(self._map, offset)
+        if word & mask == mask:
+            return False
+        _WORD.pack_into(self._map, offset, word | mask)
+        self.count += 1
+        if self.count == self.capacity:
+            logger.warning(f'The Bloom filter {self.path} reached its capacity, false positives will increase')
+        return True
+
+    def add_many(self, keys: Iterable[bytes]) -> list[bool]:
+        """
+        Add many keys, `add` with the lookups inlined for large batches.
+
+        Args:
+            keys (Iterable[bytes]): Keys.
+
+        Returns:
+            list[bool]: For every key, True if it was certainly not in the filter.
+        """
+        data, blake2b, unpack_from, pack_into = self._map, hashlib.blake2b, _WORD.unpack_from, _WORD.pack_into
+        digest_size, words, header = 8 + self.hashes, self._words, self._header.size
+        added = []
+        for key in keys:
+            digest = blake2b(key, digest_size=digest_size).digest()
+            mask = 0
+            for byte in digest[8:]:
+                mask |= 1 << (byte & 63)
+            offset = header + int.from_bytes(digest[:8], 'little') % words * 8
+            word, = unpack_from(data, offset)
+            if word & mask == mask:
+                added.append(False)
+            else:
+                pack_into(data, offset, word | mask)
+                added.append(True)
+        previous, self.count = self.count, self.count + sum(added)
+        if previous < self.capacity <= self.count:
+            logger.warning(f'The Bloom filter {self.path} reached its capacity, false positives will increase')
+        return added
+
+    def __contains__(self, key: bytes) -> bool:
+        offset, mask = self._locate(key)
+        return _WORD.unpack_from(self._map, offset)[0] & mask == mask
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits // 8
+
+    def flush(self):
+        if self._header is _HEADER:
+            _HEADER.pack_into(self._map, 0, _MAGIC, self.bits, self.hashes, self.count, self.capacity)
+        else:
+            _HEADER_V1.pack_into(self._map, 0, _MAGIC_V1, self.bits, self.hashes, self.count)
+        self._map.flush()
+
+    def close(self):
+        if not self._map.closed:
+            if self._header is not None:
+                self.flush()
+            self._map.close()
+        self._file.close()
+
+
+class KnownHostIndex:
+    """
+    Persistent index of the IP addresses seen across runs, queries and engines.
+
+    A memory-mapped Bloom filter answers most lookups: an address it has never seen is
+    certainly new and costs no disk access. Addresses the filter may have seen are
+    confirmed in batches against an exact SQLite store, which also keeps when and by
+    which engine every address was first seen. With `exact=False` the store is not used
+    and a small share of new addresses (the filter's false positive rate) is reported as known.
+
+    The exact store grows with every new address and is never pruned: about 30 bytes per
+    IPv4 and 45 per IPv6 address, e.g. 3 GB for 100 million addresses, on top of the
+    filter (about 1.5 bytes per address at 1%). Use `exact=False` when the disk matters
+    more than the false positives, or delete the folder to start over.
+
+    Attributes:
+        path (str): Folder of the index.
+        bloom (BloomFilter): Filter of the known addresses.
+        exact (bool): Confirm the filter's hits in the exact store.
+    """
+
+    _BATCH_SIZE = 4096
+    _QUERY_SIZE = 500
+
+    def __init__(self, path: str = '.known', capacity: int = 100_000_000, error_rate: float = 0.01,
+                 exact: bool = True):
+        """
+        Initializes the KnownHostIndex object.
+
+        Args:
+            path (str): Folder of the index, created if missing.
+            capacity (int): Number of addresses the filter is sized for when it is created.
+            error_rate (float): False positive rate of the filter at capacity.
+            exact (bool): Keep the exact store and confirm the filter's hits in it.
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.bloom = BloomFilter(os.path.join(path, 'bloom.bin'), capacity, error_rate)
+        self.exact = exact
+        self.connection = None
+        if exact:
+            self.connection = sqlite3.connect(os.path.join(path, 'hosts.sqlite'), check_same_thread=False,
+                                              isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS hosts (ip BLOB PRIMARY KEY, first_seen REAL, engine TEXT) WITHOUT ROWID')
+
+    def _stored(self, keys: list[bytes]) -> set[bytes]:
+        stored = set()
+        for start in range(0, len(keys), self._QUERY_SIZE):
+            chunk = keys[start:start + self._QUERY_SIZE]
+            rows = self.connection.execute(f'SELECT ip FROM hosts WHERE ip IN ({", ".join("?" * len(chunk))})', chunk)
+            stored.update(ip for ip, in rows)
+        return stored
+
+    def _classify_batch(self, ips: list[str], engine: str | None, record: bool = True) -> list[tuple[str, bool]]:
+        """
+        Tell the new addresses of a batch and record them as known.
+
+        Args:
+            ips (list[str]): Addresses.
+            engine (str | None): Engine that found the addresses.
+            record (bool): Record the new addresses as known, only look them up if False.
+
+        Returns:
+            list[tuple[str, bool]]: Every valid address with True if it was never seen before.
+        """
+        keys = {}
+        for ip in ips:
+            if ip not in keys:
+                try:
+                    keys[ip] = pack_ip(ip)
+                except ValueError:
+                    logger.warning(f'Skipping the invalid IP address {ip!r}')
+        new = {}
+        maybe = []
+        if record:
+            unseen = self.bloom.add_many(keys.values())
+        else:
+            unseen = [key not in self.bloom for key in keys.values()]
+        for (ip, key), added in zip(keys.items(), unseen):
+            if added:
+                new[ip] = key
+            elif self.exact:
+                maybe.append(ip)
+        if maybe:
+            stored = self._stored([keys[ip] for ip in maybe])
+            new.update((ip, keys[ip]) for ip in maybe if keys[ip] not in stored)
+        if record and self.exact and new:
+            now = time.time()
+            with self.connection:
+                self.connection.execute('BEGIN')
+                self.connection.executemany('INSERT OR IGNORE INTO hosts VALUES (?, ?, ?)',
+                                            ((key, now, engine) for key in new.values()))
+        # An address repeated in the batch is only new the first time.
+        result = []
+        for ip in ips:
+            if ip in keys:
+                result.append((ip, new.pop(ip, None) is not None))
+        return result
+
+    def classify(self, ips: Iterable[str], engine: str = None, record: bool = True) -> Iterator[tuple[str, bool]]:
+        """
+        Tag addresses as new or known and record them as known.
+
+        Addresses are processed in batches while they are consumed, so results can be
+        streamed through the index. Invalid addresses are skipped.
+
+        With `record=False` the index is only looked up. Callers that write the new
+        addresses somewhere use it and call `record` once they are written, so an
+        interrupted run does not hide them from the next one.
+
+        Args:
+            ips (Iterable[str]): Addresses, e.g. from `client.iter_ips`.
+            engine (str): Engine that found the addresses, stored with the new ones.
+            record (bool): Record the new addresses as known.
+
+        Yields:
+            tuple[str, bool]: Address and True if it was never seen before.
+        """
+        batch = []
+        for ip in ips:
+            if not ip:
+                continue
+            batch.append(ip)
+            if len(batch) >= self._BATCH_SIZE:
+                yield from self._classify_batch(batch, engine, record)
+                batch = []
+        if batch:
+            yield from self._classify_batch(batch, engine, record)
+        if record:
+            self.bloom.flush()
+
+    def filter_new(self, ips: Iterable[str], engine: str = None, record: bool = True) -> Iterator[str]:
+        """
+        Keep the addresses never seen before and record all of them as known.
+
+        Args:
+            ips (Iterable[str]): Addresses.
+            engine (str): Engine that found the addresses.
+            record (bool): Record the new addresses as known, see `classify`.
+
+        Yields:
+            str: New address.
+        """
+        return (ip for ip, new in self.classify(ips, engine, record) if new)
+
+    def record(self, ips: Iterable[str], engine: str = None) -> int:
+        """
+        Record addresses as known, e.g. once the new ones of a run are written.
+
+        Args:
+            ips (Iterable[str]): Addresses.
+            engine (str): Engine that found the addresses, stored with the new ones.
+
+        Returns:
+            int: Number of addresses that were not known yet.
+        """
+        return sum(new for _, new in self.classify(ips, engine))
+
+    def __contains__(self, ip: str) -> bool:
+        try:
+            key = pack_ip(ip)
+        except ValueError:
+            return False
+        if key not in self.bloom:
+            return False
+        if not self.exact:
+            return True
+        return bool(self._stored([key]))
+
+    def __len__(self) -> int:
+        if self.exact:
+            return self.connection.execute('SELECT COUNT(*) FROM hosts').fetchone()[0]
+        return len(self.bloom)
+
+    def close(self):
+        self.bloom.close()
+        if self.connection is not None:
+            self.connection.close()
@@ -0,0 +1,239 @@
+import time
+from collections.abc import Iterable
+
+from utils.ipset import IPSet
+
+# Reasons a search stops before all its pages are fetched.
+MAX_RESULTS = 'max_results'
+DEADLINE = 'deadline'
+CANCELLED = 'cancelled'
+MISSING_PAGES = 'missing_pages'
+TRUNCATED = 'truncated'
+
+
+class CancelToken:
+    """
+    Flag telling running searches to stop, e.g. set by another greenlet, task or thread.
+
+    Searches check the token between pages and at least every `SearchLimits.CANCEL_POLL`
+    seconds while they wait for a page, then stop their in-flight requests. A token can be
+    shared by several searches to cancel them together.
+
+    Attributes:
+        cancelled (bool): True once `cancel` was called.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SearchLimits:
+    """
+    Result target, time budget and cancel token of one search, and how the search ended.
+
+    The limits are checked by the clients between pages and while they wait for a page.
+    With a result target only the pages needed to reach it are sent, assuming every item is
+    a new result; more pages are only sent if the fetched ones held duplicates. Once a
+    limit is hit the in-flight requests are stopped and the search returns what it has.
+
+    A SearchLimits object keeps the progress of the search it is passed to, so it must not
+    be shared by concurrent searches; share a CancelToken instead.
+
+    Attributes:
+        max_results (int | None): Number of results after which the search stops.
+        deadline (float | None): `time.monotonic()` time after which the search stops.
+        cancel (CancelToken | None): Token stopping the search when cancelled.
+        results (int): Number of results collected so far.
+        missing_pages (int): Number of pages that could not be fetched.
+        truncated (int): Number of matching items beyond the engine's paging limit, which
+            the search cannot reach.
+        stopped (str | None): Limit that stopped the search while pages were left
+            (max_results, deadline or cancelled), None if it ran to the end.
+    """
+
+    CANCEL_POLL = 0.25
+
+    def __init__(self, max_results: int = None, timeout: float = None, deadline: float = None,
+                 cancel: CancelToken = None):
+        """
+        Initializes the SearchLimits object.
+
+        Args:
+            max_results (int): Stop once this many results are collected.
+            timeout (float): Time budget in seconds, counted from now.
+            deadline (float): Stop at this `time.monotonic()` time, the earlier one wins with `timeout`.
+            cancel (CancelToken): Stop when the token is cancelled.
+        """
+        if max_results is not None and max_results < 0:
+            raise ValueError('max_results must not be negative')
+        if timeout is not None:
+            budget_end = time.monotonic() + timeout
+            deadline = budget_end if deadline is None else min(deadline, budget_end)
+        self.max_results = max_results
+        self.deadline = deadline
+        self.cancel = cancel
+        self.results = 0
+        self.missing_pages = 0
+        self.truncated = 0
+        self.stopped = None
+
+    def remaining(self) -> float | None:
+        """
+        Get the time left before the deadline.
+
+        Returns:
+            float | None: Seconds left, 0 once the deadline passed, None without a deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def wait_timeout(self) -> float | None:
+        """
+        Get how long a search may wait for a page before checking its limits again.
+
+        Returns:
+            float | None: Seconds, None to wait without a timeout.
+        """
+        timeouts = []
+        if self.deadline is not None:
+            timeouts.append(self.remaining())
+        if self.cancel is not None:
+            timeouts.append(self.CANCEL_POLL)
+        return min(timeouts) if timeouts else None
+
+    def exceeded(self) -> str | None:
+        """
+        Tell which limit is hit, if any.
+
+        Returns:
+            str | None: cancelled, deadline or max_results, None if the search may go on.
+        """
+        if self.cancel is not None and self.cancel.cancelled:
+            return CANCELLED
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return DEADLINE
+        if self.max_results is not None and self.results >= self.max_results:
+            return MAX_RESULTS
+        return None
+
+    def stop(self, reason: str) -> bool:
+        """
+        Record the limit that stopped the search, the first one is kept.
+
+        Args:
+            reason (str): Limit that was hit.
+
+        Returns:
+            bool: True if the search was not stopped before.
+        """
+        if self.stopped is not None:
+            return False
+        self.stopped = reason
+        return True
+
+    def pages_needed(self, results_per_page: int) -> int | None:
+        """
+        Get the number of pages still needed to reach the result target.
+
+        Args:
+            results_per_page (int): Number of items per page.
+
+        Returns:
+            int | None: Number of pages, None without a result target.
+        """
+        if self.max_results is None:
+            return None
+        return -(-max(0, self.max_results - self.results) // results_per_page)
+
+    def cap(self, count: int, max_results: int | None) -> bool:
+        """
+        Record the items of a query that the engine's paging limit puts out of reach.
+
+        Args:
+            count (int): Number of items matching the query.
+            max_results (int | None): Number of results reachable by paging, None without a limit.
+
+        Returns:
+            bool: True if the query exceeds the paging limit.
+        """
+        if max_results is None or count <= max_results:
+            return False
+        self.truncated += count - max_results
+        return True
+
+    def merge(self, other: 'SearchLimits'):
+        """
+        Add the progress of the limits of a concurrent part of the search, e.g. a shard.
+
+        Args:
+            other (SearchLimits): Limits of the part.
+        """
+        self.results += other.results
+        self.missing_pages += other.missing_pages
+        self.truncated += other.truncated
+        if other.stopped is not None:
+            self.stop(other.stopped)
+
+    def take(self, items: list) -> list:
+        """
+        Count the results of a page, cut to the result target.
+
+        Args:
+            items (list): Results of the page.
+
+        Returns:
+            list: The results within the target.
+        """
+        if self.max_results is not None and self.results + len(items) > self.max_results:
+            items = items[:max(0, self.max_results - self.results)]
+        self.results += len(items)
+        return items
+
+    @property
+    def complete(self) -> bool:
+        return self.stopped is None and not self.missing_pages and not self.truncated
+
+
+class SearchResult(IPSet):
+    """
+    IP addresses collected by a search, with whether the search fetched all its pages.
+
+    Attributes:
+        complete (bool): True if every page was fetched, False if a limit stopped the
+            search early, pages could not be fetched or the engine's paging limit cut the
+            results short.
+        reason (str | None): Why the result is partial: max_results, deadline, cancelled,
+            missing_pages or truncated, None if it is complete.
+        count (int | None): Number of items the engine reported for the query.
+    """
+
+    def __init__(self, ips: Iterable[str] = (), complete: bool = True, reason: str = None, count: int = None):
+        super().__init__(ips)
+        self.complete = complete
+        self.reason = reason
+        self.count = count
+
+    def finish(self, limits: SearchLimits, count: int = None) -> 'SearchResult':
+        """
+        Record how the search that collected the addresses ended.
+
+        Args:
+            limits (SearchLimits): Limits of the search.
+            count (int): Number of items reported for the query.
+
+        Returns:
+            SearchResult: The result itself.
+        """
+        self.complete = limits.complete
+        if limits.stopped is not None:
+            self.reason = limits.stopped
+        elif limits.missing_pages:
+            self.reason = MISSING_PAGES
+        else:
+            self.reason = TRUNCATED if limits.truncated else None
+        self.count = count
+        return self
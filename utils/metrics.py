@@ -0,0 +1,400 @@
+import bisect
+import json
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    Distribution of observed values in fixed cumulative buckets, as in Prometheus.
+
+    Attributes:
+        buckets (tuple[float]): Upper bounds of the buckets in increasing order.
+        count (int): Number of observed values.
+        sum (float): Sum of the observed values.
+    """
+
+    def __init__(self, buckets: tuple[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """
+        Get the number of values at or below each bucket bound.
+
+        Returns:
+            list[tuple[float, int]]: Bucket bound and cumulative count, ending with +Inf.
+        """
+        result, total = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self._counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, share: float) -> float:
+        """
+        Estimate a quantile by linear interpolation inside its bucket.
+
+        Args:
+            share (float): Quantile as a share, e.g. 0.99.
+
+        Returns:
+            float: Estimated quantile, 0 if nothing was observed.
+        """
+        if not self.count:
+            return 0.0
+        rank = share * self.count
+        lower, previous = 0.0, 0
+        for bound, total in self.cumulative():
+            if total >= rank:
+                if bound == float('inf'):
+                    return lower
+                inside = total - previous
+                return lower + (bound - lower) * ((rank - previous) / inside if inside else 1.0)
+            lower, previous = bound, total
+        return lower
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'p50': round(self.quantile(0.5), 6),
+            'p99': round(self.quantile(0.99), 6),
+            'buckets': {str(bound): total for bound, total in self.cumulative()},
+        }
+
+
+class MetricsHook:
+    """
+    Base class of tracers attached to the metrics of the engines.
+
+    All methods do nothing, subclasses override the events they need. The value returned
+    by on_request_start() is passed back to on_request_end() of the same hook, e.g. a span.
+    """
+
+    def on_request_start(self, engine: str, request):
+        """
+        Called before a request is sent.
+
+        Args:
+            engine (str): Engine name.
+            request (grequests.AsyncRequest): Request.
+
+        Returns:
+            Any value handed back to on_request_end().
+        """
+        return None
+
+    def on_request_end(self, engine: str, request, context, response=None, error: Exception = None,
+                       seconds: float = 0.0):
+        """
+        Called when a request finished or failed.
+
+        Args:
+            engine (str): Engine name.
+            request (grequests.AsyncRequest): Request.
+            context: Value returned by on_request_start().
+            response (requests.Response): Response, None if the request failed.
+            error (Exception): Error of a failed request.
+            seconds (float): Request duration, including the body unless it is streamed.
+        """
+
+    def on_retry(self, engine: str, cause: str, attempt: int, delay: float):
+        """
+        Called before a failed request is retried.
+
+        Args:
+            engine (str): Engine name.
+            cause (str): Retry cause, e.g. throttled, timeout, http_error.
+            attempt (int): Number of the failed attempt.
+            delay (float): Seconds until the retry.
+        """
+
+    def on_page(self, engine: str, items: int, decode_seconds: float | None):
+        """
+        Called when a result page was received and decoded.
+
+        Args:
+            engine (str): Engine name.
+            items (int): Number of items on the page.
+            decode_seconds (float | None): JSON decode time, None if decoded while streaming.
+        """
+
+
+class EngineMetrics:
+    """
+    Counters and histograms of the fetch pipeline of one engine.
+
+    Updates are plain attribute changes: the clients run in greenlets of one thread,
+    which never switch in the middle of an update.
+
+    Attributes:
+        engine (str): Engine name.
+        requests (int): Requests sent to the API.
+        responses (dict[int, int]): Responses by HTTP status.
+        errors (int): Requests that failed without a response.
+        bytes_received (int): Response body bytes received.
+        cache_hits (int): Requests answered from the response cache.
+        pages (int): Result pages received.
+        results (int): Result items received.
+        credits_used (float): Estimated API credits spent by the requests.
+        retries (dict[str, int]): Retries by cause.
+        request_seconds (Histogram): Request duration, including the body unless it is streamed.
+        decode_seconds (Histogram): JSON decode time of the result pages.
+        hooks (list[MetricsHook]): Attached tracers.
+    """
+
+    def __init__(self, engine: str, hooks: list[MetricsHook] = None):
+        self.engine = engine
+        self.hooks = hooks if hooks is not None else []
+        self.reset()
+
+    def reset(self):
+        """
+        Set all counters and histograms back to zero.
+        """
+        self.requests = 0
+        self.responses = {}
+        self.errors = 0
+        self.bytes_received = 0
+        self.cache_hits = 0
+        self.pages = 0
+        self.results = 0
+        self.credits_used = 0.0
+        self.retries = {}
+        self.request_seconds = Histogram()
+        self.decode_seconds = Histogram()
+        self._first_page_at = None
+        self._last_page_at = None
+
+    def request_started(self, request) -> list:
+        """
+        Count a request and notify the hooks.
+
+        Args:
+            request (grequests.AsyncRequest): Request.
+
+        Returns:
+            list: Hook contexts to pass to request_finished().
+        """
+        self.requests += 1
+        return [hook.on_request_start(self.engine, request) for hook in self.hooks]
+
+    def request_finished(self, request, contexts: list, response=None, error: Exception = None,
+                         seconds: float = 0.0):
+        """
+        Record the outcome of a request and notify the hooks.
+
+        Args:
+            request (grequests.AsyncRequest): Request.
+            contexts (list): Value returned by request_started().
+            response (requests.Response): Response, None if the request failed.
+            error (Exception): Error of a failed request.
+            seconds (float): Request duration, including the body unless it is streamed.
+        """
+        if response is None:
+            self.errors += 1
+        else:
+            self.responses[response.status_code] = self.responses.get(response.status_code, 0) + 1
+            self.request_seconds.observe(seconds)
+        for hook, context in zip(self.hooks, contexts):
+            hook.on_request_end(self.engine, request, context, response, error, seconds)
+
+    def record_cache_hit(self):
+        self.cache_hits += 1
+
+    def record_bytes(self, size: int):
+        self.bytes_received += size
+
+    def count_bytes(self, chunks):
+        """
+        Pass the chunks of a streamed body through while counting their size.
+
+        Args:
+            chunks: Iterable of body chunks.
+
+        Yields:
+            The chunks unchanged.
+        """
+        for chunk in chunks:
+            self.bytes_received += len(chunk)
+            yield chunk
+
+    def record_retry(self, cause: str, attempt: int, delay: float):
+        self.retries[cause] = self.retries.get(cause, 0) + 1
+        for hook in self.hooks:
+            hook.on_retry(self.engine, cause, attempt, delay)
+
+    def record_page(self, items: int, decode_seconds: float = None, credits: float = 0.0):
+        """
+        Record a received result page.
+
+        Args:
+            items (int): Number of items on the page.
+            decode_seconds (float): JSON decode time, None if decoded while streaming.
+            credits (float): Estimated API credits spent on the page.
+        """
+        now = time.monotonic()
+        if self._first_page_at is None:
+            self._first_page_at = now
+        self._last_page_at = now
+        self.pages += 1
+        self.results += items
+        self.credits_used += credits
+        if decode_seconds is not None:
+            self.decode_seconds.observe(decode_seconds)
+        for hook in self.hooks:
+            hook.on_page(self.engine, items, decode_seconds)
+
+    @property
+    def pages_per_sec(self) -> float:
+        """
+        Page rate between the first and the last received page.
+        """
+        if self.pages < 2 or self._last_page_at == self._first_page_at:
+            return 0.0
+        return (self.pages - 1) / (self._last_page_at - self._first_page_at)
+
+    def snapshot(self) -> dict:
+        return {
+            'requests': self.requests,
+            'responses': {str(status): total for status, total in sorted(self.responses.items())},
+            'errors': self.errors,
+            'bytes_received': self.bytes_received,
+            'cache_hits': self.cache_hits,
+            'pages': self.pages,
+            'results': self.results,
+            'credits_used': self.credits_used,
+            'retries': dict(sorted(self.retries.items())),
+            'pages_per_sec': round(self.pages_per_sec, 3),
+            'request_seconds': self.request_seconds.snapshot(),
+            'decode_seconds': self.decode_seconds.snapshot(),
+        }
+
+    def summary(self) -> str:
+        """
+        One-line summary for the logs.
+        """
+        return (f'{self.requests} requests, {self.pages} pages, {self.bytes_received / 2 ** 20:.1f} MiB, '
+                f'{sum(self.retries.values())} retries, {self.pages_per_sec:.1f} pages/s, '
+                f'p50/p99 latency {self.request_seconds.quantile(0.5) * 1000:.0f}/'
+                f'{self.request_seconds.quantile(0.99) * 1000:.0f} ms, '
+                f'decode {self.decode_seconds.sum:.2f} s, {self.credits_used:g} credits')
+
+
+class MetricsRegistry:
+    """
+    Metrics of all engines, exportable as a JSON snapshot or in the Prometheus text format.
+
+    Attributes:
+        hooks (list[MetricsHook]): Tracers attached to every engine.
+    """
+
+    _COUNTERS = [
+        ('requests', 'Requests sent to the API.'),
+        ('errors', 'Requests that failed without a response.'),
+        ('bytes_received', 'Response body bytes received.'),
+        ('cache_hits', 'Requests answered from the response cache.'),
+        ('pages', 'Result pages received.'),
+        ('results', 'Result items received.'),
+        ('credits_used', 'Estimated API credits spent.'),
+    ]
+
+    def __init__(self):
+        self.hooks = []
+        self._engines = {}
+
+    def get(self, engine: str) -> EngineMetrics:
+        """
+        Get the metrics of an engine, created on first use.
+
+        Args:
+            engine (str): Engine name.
+
+        Returns:
+            EngineMetrics: Metrics shared by all clients of the engine.
+        """
+        if engine not in self._engines:
+            self._engines[engine] = EngineMetrics(engine, self.hooks)
+        return self._engines[engine]
+
+    def add_hook(self, hook: MetricsHook):
+        """
+        Attach a tracer to all engines, including those created later.
+
+        Args:
+            hook (MetricsHook): Tracer.
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: MetricsHook):
+        self.hooks.remove(hook)
+
+    def reset(self):
+        for metrics in self._engines.values():
+            metrics.reset()
+
+    def snapshot(self) -> dict:
+        """
+        Get the current values of all metrics.
+
+        Returns:
+            dict: Metrics by engine name.
+        """
+        return {engine: metrics.snapshot() for engine, metrics in sorted(self._engines.items())}
+
+    def to_json(self, indent: int = None) -> str:
+        return json.dumps({'timestamp': time.time(), 'engines': self.snapshot()}, indent=indent)
+
+    def to_prometheus(self, prefix: str = 'jixer') -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Prefix of the metric names.
+
+        Returns:
+            str: Metrics text.
+        """
+        engines = sorted(self._engines.items())
+        lines = []
+        for name, help_text in self._COUNTERS:
+            lines += [f'# HELP {prefix}_{name}_total {help_text}', f'# TYPE {prefix}_{name}_total counter']
+            lines += [f'{prefix}_{name}_total{{engine="{engine}"}} {getattr(metrics, name)}'
+                      for engine, metrics in engines]
+        lines += [f'# HELP {prefix}_responses_total Responses by HTTP status.',
+                  f'# TYPE {prefix}_responses_total counter']
+        lines += [f'{prefix}_responses_total{{engine="{engine}",status="{status}"}} {total}'
+                  for engine, metrics in engines for status, total in sorted(metrics.responses.items())]
+        lines += [f'# HELP {prefix}_retries_total Retried requests by cause.',
+                  f'# TYPE {prefix}_retries_total counter']
+        lines += [f'{prefix}_retries_total{{engine="{engine}",cause="{cause}"}} {total}'
+                  for engine, metrics in engines for cause, total in sorted(metrics.retries.items())]
+        lines += [f'# HELP {prefix}_pages_per_second Page rate of the current pull.',
+                  f'# TYPE {prefix}_pages_per_second gauge']
+        lines += [f'{prefix}_pages_per_second{{engine="{engine}"}} {round(metrics.pages_per_sec, 6)}'
+                  for engine, metrics in engines]
+        for name, attribute, help_text in [
+            ('request_duration_seconds', 'request_seconds', 'Request duration, including the body unless it is streamed.'),
+            ('decode_duration_seconds', 'decode_seconds', 'JSON decode time of the result pages.'),
+        ]:
+            lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} histogram']
+            for engine, metrics in engines:
+                histogram = getattr(metrics, attribute)
+                for bound, total in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'{prefix}_{name}_bucket{{engine="{engine}",le="{le}"}} {total}')
+                lines.append(f'{prefix}_{name}_sum{{engine="{engine}"}} {round(histogram.sum, 6)}')
+                lines.append(f'{prefix}_{name}_count{{engine="{engine}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,209 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(headers) -> float | None:
+    """
+    Get the number of seconds to wait from rate limit response headers.
+
+    Both forms of `Retry-After` (delay in seconds or an HTTP date) are supported,
+    as well as the `X-RateLimit-Remaining` / `X-RateLimit-Reset` pair.
+
+    Args:
+        headers: Response headers.
+
+    Returns:
+        float | None: Seconds to wait, None if the headers do not say.
+    """
+    if not headers:
+        return None
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        retry_after = retry_after.strip()
+        if retry_after.isdigit():
+            return float(retry_after)
+        try:
+            moment = parsedate_to_datetime(retry_after)
+            return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    remaining = headers.get('X-RateLimit-Remaining')
+    reset = headers.get('X-RateLimit-Reset')
+    if remaining is not None and reset is not None:
+        try:
+            if int(float(remaining)) > 0:
+                return None
+            reset = float(reset)
+        except ValueError:
+            return None
+        # The reset value is either an epoch timestamp or a delay in seconds.
+        if reset > 10 ** 9:
+            reset -= time.time()
+        return max(0.0, reset)
+    return None
+
+
+class RateLimiter:
+    """
+    Request budget shared by all in-flight requests of one client.
+
+    Combines a token bucket (requests per second) with AIMD-style concurrency control:
+    every successful response raises the number of allowed in-flight requests additively,
+    every throttled response (429, 503) halves it and pauses the whole client for the
+    time announced by the server.
+
+    Waiting is done with `time.sleep`, which gevent turns into a cooperative sleep, or with
+    `asyncio.sleep` for the clients running on an event loop (`acquire_async`).
+
+    Attributes:
+        rate (float | None): Requests per second, None for no limit.
+        burst (float): Bucket capacity.
+        max_concurrency (int): Upper bound for in-flight requests.
+        min_concurrency (int): Lower bound for in-flight requests.
+        limit (float): Current number of allowed in-flight requests.
+        backoff_base (float): First backoff delay in seconds.
+        backoff_max (float): Maximum backoff delay in seconds.
+    """
+
+    _POLL_INTERVAL = 0.05
+
+    def __init__(self, rate: float = None, burst: float = None, max_concurrency: int = 1,
+                 min_concurrency: int = 1, backoff_base: float = 1.0, backoff_max: float = 60.0):
+        """
+        Initializes the RateLimiter object.
+
+        Args:
+            rate (float): Requests per second, None for no limit.
+            burst (float): Bucket capacity, defaults to one second worth of tokens.
+            max_concurrency (int): Upper bound for in-flight requests.
+            min_concurrency (int): Lower bound for in-flight requests.
+            backoff_base (float): First backoff delay in seconds.
+            backoff_max (float): Maximum backoff delay in seconds.
+        """
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._in_flight = 0
+        self._paused_until = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _refill(self, now: float):
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait_time(self) -> float:
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= int(self.limit):
+            return self._POLL_INTERVAL
+        if self.rate:
+            self._refill(now)
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+        return 0.0
+
+    def try_acquire(self) -> float:
+        """
+        Account for a request as in flight if it may be sent right away.
+
+        Returns:
+            float: 0 if the request was allowed, otherwise the seconds to wait before trying again.
+        """
+        wait = self._wait_time()
+        if wait > 0:
+            return wait
+        if self.rate:
+            self._tokens -= 1
+        self._in_flight += 1
+        return 0.0
+
+    def acquire(self):
+        """
+        Block until a request may be sent, then account for it as in flight.
+        """
+        wait = self.try_acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+    async def acquire_async(self):
+        """
+        Wait on the event loop until a request may be sent, then account for it as in flight.
+        """
+        wait = self.try_acquire()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire()
+
+    def release(self):
+        """
+        Mark a request previously allowed by acquire() as finished.
+        """
+        self._in_flight = max(0, self._in_flight - 1)
+
+    def on_success(self, headers=None):
+        """
+        Additive increase of the concurrency limit after a successful response.
+
+        A response that reports an exhausted rate limit window pauses the client
+        until the window resets.
+
+        Args:
+            headers: Response headers.
+        """
+        self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        delay = parse_retry_after(headers)
+        if delay:
+            self.pause(delay)
+
+    def on_throttle(self, headers=None) -> float | None:
+        """
+        Multiplicative decrease of the concurrency limit after a throttled response.
+
+        Args:
+            headers: Response headers.
+
+        Returns:
+            float | None: Delay announced by the server, if any.
+        """
+        self.limit = max(float(self.min_concurrency), self.limit / 2)
+        delay = parse_retry_after(headers)
+        if delay:
+            self.pause(delay)
+        return delay
+
+    def pause(self, seconds: float):
+        """
+        Stop all requests of the client for the given number of seconds.
+
+        Args:
+            seconds (float): Pause duration.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Exponential backoff delay with random jitter.
+
+        Args:
+            attempt (int): Number of the failed attempt, starting from 1.
+
+        Returns:
+            float: Seconds to wait before the next attempt.
+        """
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(self.backoff_base / 2, max(self.backoff_base / 2, ceiling))
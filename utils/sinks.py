@@ -0,0 +1,183 @@
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+from collections.abc import Iterable
+
+from utils.hosts import HOST_FIELDS, HostRecord
+
+logger = logging.getLogger(__name__)
+
+# Columns written by every sink: the host record followed by the query that found it.
+ROW_FIELDS = HOST_FIELDS + ('query',)
+
+
+class RecordSink:
+    """
+    Streaming destination of host records.
+
+    Records are consumed lazily and written in batches of `batch_size` rows, so the
+    memory used does not depend on the number of records. Subclasses implement
+    `_write_rows` for one batch of row tuples in ROW_FIELDS order.
+
+    Attributes:
+        path (str): Path of the output file, '-' for stdout where supported.
+        batch_size (int): Number of rows written at once.
+    """
+
+    FORMAT = ''
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = path
+        self.batch_size = max(1, batch_size)
+
+    def write(self, records: Iterable[HostRecord], query: str = None) -> int:
+        """
+        Write host records to the sink.
+
+        Args:
+            records (Iterable[HostRecord]): Records to write, e.g. from `client.iter_hosts`.
+            query (str): Search query that found the records, stored with every row.
+
+        Returns:
+            int: Number of written records.
+        """
+        written = 0
+        batch = []
+        for record in records:
+            batch.append(record.as_tuple() + (query,))
+            if len(batch) >= self.batch_size:
+                self._write_rows(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            self._write_rows(batch)
+            written += len(batch)
+        self.flush()
+        return written
+
+    def _write_rows(self, rows: list[tuple]):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JsonlRecordSink(RecordSink):
+    """
+    Write host records as JSON lines, one object per record.
+    """
+
+    FORMAT = 'jsonl'
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        super().__init__(path, batch_size)
+        self._file = sys.stdout if path == '-' else open(path, 'w')
+
+    def _write_rows(self, rows: list[tuple]):
+        self._file.write(''.join(json.dumps(dict(zip(ROW_FIELDS, row))) + '\n' for row in rows))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class CsvRecordSink(RecordSink):
+    """
+    Write host records to a CSV file with a header row.
+    """
+
+    FORMAT = 'csv'
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        super().__init__(path, batch_size)
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(ROW_FIELDS)
+
+    def _write_rows(self, rows: list[tuple]):
+        self._writer.writerows(rows)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SqliteRecordSink(RecordSink):
+    """
+    Insert host records into a table of a SQLite database.
+
+    Every batch is inserted with one `executemany` call in its own transaction, so an
+    interrupted run keeps the batches written so far.
+
+    Attributes:
+        table (str): Name of the table, created if missing.
+    """
+
+    FORMAT = 'sqlite'
+
+    def __init__(self, path: str, batch_size: int = 5000, table: str = 'hosts'):
+        super().__init__(path, batch_size)
+        if not table.isidentifier():
+            raise ValueError(f'Invalid table name: {table!r}')
+        self.table = table
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} (ip TEXT NOT NULL, port INTEGER, protocol TEXT, hostname TEXT, '
+            f'engine TEXT, timestamp TEXT, query TEXT)')
+        self._insert = f'INSERT INTO {table} ({", ".join(ROW_FIELDS)}) VALUES ({", ".join("?" * len(ROW_FIELDS))})'
+
+    def _write_rows(self, rows: list[tuple]):
+        with self.connection:
+            self.connection.executemany(self._insert, rows)
+
+    def close(self):
+        self.connection.close()
+
+
+SINKS = {sink.FORMAT: sink for sink in (JsonlRecordSink, CsvRecordSink, SqliteRecordSink)}
+EXTENSIONS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv', '.sqlite': 'sqlite', '.sqlite3': 'sqlite',
+              '.db': 'sqlite'}
+
+
+def open_record_sink(path: str, format: str = None, **kwargs) -> RecordSink:
+    """
+    Open the sink of a format, guessed from the file extension if not given.
+
+    Args:
+        path (str): Path of the output file, '-' for stdout (JSON lines only).
+        format (str): One of SINKS (jsonl, csv or sqlite).
+        **kwargs: Options of the sink, e.g. batch_size.
+
+    Returns:
+        RecordSink: Open sink, close it when done.
+
+    Raises:
+        ValueError: If the format is unknown or cannot be guessed.
+    """
+    format = format or ('jsonl' if path == '-' else EXTENSIONS.get(os.path.splitext(path)[1].lower()))
+    if format not in SINKS:
+        raise ValueError(f'Unknown host record format for {path!r}, expected one of {", ".join(SINKS)}')
+    logger.info(f'Writing host records to {path} ({format})')
+    return SINKS[format](path, **kwargs)
@@ -0,0 +1,233 @@
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class PageTask:
+    """
+    One result page of a queued search, leased to a worker.
+
+    Attributes:
+        job (int): Job of the page.
+        page (int): Page index, as in `get_request_page_list`.
+        engine (str): Engine name.
+        query (str): Search query.
+        count (int): Number of items matching the query, the worker rebuilds the page requests from it.
+        attempts (int): Number of times the page was leased, including this one.
+    """
+
+    __slots__ = ('job', 'page', 'engine', 'query', 'count', 'attempts')
+
+    def __init__(self, job: int, page: int, engine: str, query: str, count: int, attempts: int):
+        self.job = job
+        self.page = page
+        self.engine = engine
+        self.query = query
+        self.count = count
+        self.attempts = attempts
+
+    def __repr__(self) -> str:
+        return f'PageTask(job={self.job}, page={self.page}, engine={self.engine!r})'
+
+
+class WorkQueue:
+    """
+    Durable queue of page tasks shared by a coordinator and worker processes, stored in a SQLite file.
+
+    A coordinator submits a job with one task per result page. Workers lease tasks,
+    fetch the pages and push back their IP addresses. A lease that is not completed in
+    time expires and the task is leased again, so a crashed worker only delays its pages.
+    A task that failed `max_attempts` times is given up.
+
+    Workers on several machines can share the queue through a file system that supports
+    SQLite locking; connections wait up to `timeout` seconds for each other.
+
+    Attributes:
+        path (str): Path of the SQLite database.
+    """
+
+    def __init__(self, path: str = '.queue/tasks.sqlite', timeout: float = 30):
+        """
+        Initializes the WorkQueue object.
+
+        Args:
+            path (str): Path of the SQLite database, created if missing.
+            timeout (float): Seconds to wait for a lock held by another process.
+        """
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, engine TEXT, query TEXT, count INTEGER, '
+            'max_attempts INTEGER, created REAL)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS tasks (job INTEGER, page INTEGER, status TEXT, attempts INTEGER DEFAULT 0, '
+            'worker TEXT, lease_until REAL DEFAULT 0, error TEXT, ips TEXT, PRIMARY KEY (job, page)) WITHOUT ROWID')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, job, page)')
+
+    def submit(self, engine: str, query: str, count: int, pages: int, done: dict[int, Iterable[str]] = None,
+               max_attempts: int = 3) -> int:
+        """
+        Queue the pages of a search, or resume the unfinished job of the same search.
+
+        A job of the same engine and query planned for another count or number of pages
+        is stale, its page indexes do not match the new plan: it is removed and replaced.
+
+        Args:
+            engine (str): Engine name.
+            query (str): Search query.
+            count (int): Number of items matching the query.
+            pages (int): Number of result pages.
+            done (dict[int, Iterable[str]]): Pages already fetched by the coordinator with their addresses.
+            max_attempts (int): Leases of a page before it is given up.
+
+        Returns:
+            int: Job id.
+        """
+        rows = self.connection.execute(
+            'SELECT jobs.id, jobs.count, (SELECT COUNT(*) FROM tasks WHERE tasks.job = jobs.id) FROM jobs '
+            'WHERE engine = ? AND query = ?', (engine, query)).fetchall()
+        for job, job_count, job_pages in rows:
+            if job_count == count and job_pages == pages:
+                # Failed pages of an interrupted run get a new chance.
+                self.connection.execute('UPDATE tasks SET status = ?, attempts = 0 WHERE job = ? AND status = ?',
+                                        (PENDING, job, FAILED))
+                logger.info(f'Resuming the queued job {job} of the query: {query}')
+                return job
+            logger.info(f'Replacing the stale job {job} of the query: {query} '
+                        f'({job_pages} pages for {job_count} items, now {pages} pages for {count} items)')
+            self.remove(job)
+        done = done or {}
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            job = self.connection.execute(
+                'INSERT INTO jobs (engine, query, count, max_attempts, created) VALUES (?, ?, ?, ?, ?)',
+                (engine, query, count, max_attempts, time.time())).lastrowid
+            self.connection.executemany(
+                'INSERT INTO tasks (job, page, status, ips) VALUES (?, ?, ?, ?)',
+                ((job, page, DONE if page in done else PENDING, '\n'.join(done[page]) if page in done else None)
+                 for page in range(pages)))
+        logger.info(f'Queued {pages - len(done)} pages of the query: {query} as job {job}')
+        return job
+
+    def claim(self, worker: str, engines: Iterable[str] = None, lease: float = 120) -> PageTask | None:
+        """
+        Lease the next pending page, or a page whose lease expired.
+
+        Args:
+            worker (str): Name of the worker, for the logs.
+            engines (Iterable[str]): Engines the worker has clients for, all engines if omitted.
+            lease (float): Seconds the page is reserved for the worker.
+
+        Returns:
+            PageTask | None: Leased page, None if there is nothing to do.
+        """
+        now = time.time()
+        sql = ('SELECT tasks.job, tasks.page, jobs.engine, jobs.query, jobs.count, tasks.attempts, jobs.max_attempts '
+               'FROM tasks JOIN jobs ON jobs.id = tasks.job '
+               'WHERE (tasks.status = ? OR (tasks.status = ? AND tasks.lease_until < ?))')
+        args = [PENDING, LEASED, now]
+        if engines is not None:
+            engines = list(engines)
+            sql += f' AND jobs.engine IN ({", ".join("?" * len(engines))})'
+            args += engines
+        sql += ' ORDER BY tasks.job, tasks.page LIMIT 1'
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            while True:
+                row = self.connection.execute(sql, args).fetchone()
+                if row is None:
+                    return None
+                job, page, engine, query, count, attempts, max_attempts = row
+                if attempts >= max_attempts:
+                    # The lease of the last attempt expired.
+                    self.connection.execute('UPDATE tasks SET status = ?, error = ? WHERE job = ? AND page = ?',
+                                            (FAILED, 'the lease expired', job, page))
+                    continue
+                self.connection.execute(
+                    'UPDATE tasks SET status = ?, attempts = ?, worker = ?, lease_until = ? WHERE job = ? AND page = ?',
+                    (LEASED, attempts + 1, worker, now + lease, job, page))
+                return PageTask(job, page, engine, query, count, attempts + 1)
+
+    def complete(self, task: PageTask, ips: Iterable[str]):
+        """
+        Store the addresses of a fetched page.
+
+        Args:
+            task (PageTask): Leased page.
+            ips (Iterable[str]): Deduplicated addresses of the page.
+        """
+        self.connection.execute('UPDATE tasks SET status = ?, ips = ?, error = NULL WHERE job = ? AND page = ? '
+                                'AND status != ?', (DONE, '\n'.join(ips), task.job, task.page, DONE))
+
+    def fail(self, task: PageTask, error: str):
+        """
+        Release a page that could not be fetched, it is leased again until it runs out of attempts.
+
+        Args:
+            task (PageTask): Leased page.
+            error (str): Reason of the failure.
+        """
+        self.connection.execute(
+            'UPDATE tasks SET status = CASE WHEN attempts >= (SELECT max_attempts FROM jobs WHERE id = job) '
+            'THEN ? ELSE ? END, lease_until = 0, error = ? WHERE job = ? AND page = ? AND status = ?',
+            (FAILED, PENDING, error, task.job, task.page, LEASED))
+
+    def progress(self, job: int) -> dict[str, int]:
+        """
+        Count the pages of a job by status.
+
+        Args:
+            job (int): Job id.
+
+        Returns:
+            dict[str, int]: Number of pending, leased, done and failed pages.
+        """
+        counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+        for status, total in self.connection.execute(
+                'SELECT status, COUNT(*) FROM tasks WHERE job = ? GROUP BY status', (job,)):
+            counts[status] = total
+        return counts
+
+    def results(self, job: int) -> Iterator[str]:
+        """
+        Yield the addresses of the fetched pages of a job.
+
+        Args:
+            job (int): Job id.
+
+        Yields:
+            str: IP address, addresses found on several pages are yielded once per page.
+        """
+        rows = self.connection.execute('SELECT ips FROM tasks WHERE job = ? AND status = ? ORDER BY page',
+                                       (job, DONE)).fetchall()
+        for ips, in rows:
+            if ips:
+                yield from ips.split('\n')
+
+    def remove(self, job: int):
+        """
+        Delete a job and its pages.
+
+        Args:
+            job (int): Job id.
+        """
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('DELETE FROM tasks WHERE job = ?', (job,))
+            self.connection.execute('DELETE FROM jobs WHERE id = ?', (job,))
+
+    def close(self):
+        self.connection.close()